@@ -0,0 +1,82 @@
+"""Perfil de produção do banco: tamanho do pool e PRAGMAs do SQLite.
+
+Rodamos SQLite em produção para tenants pequenos, então cada conexão do
+pool (síncrono e assíncrono) sai daqui com WAL, synchronous=NORMAL, cache e
+mmap dimensionados, busy_timeout e temp_store em memória. Em bancos que não
+são SQLite só as opções de pool se aplicam.
+"""
+from typing import Any, Dict, Union
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    # Negativo = KiB por conexão (64 MiB)
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+
+def is_sqlite_file(url: Union[str, URL]) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database not in (None, "", ":memory:")
+
+
+def engine_options(url: str) -> Dict[str, Any]:
+    """kwargs de create_engine/create_async_engine com o pool dimensionado"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and not is_sqlite_file(url):
+        # :memory: usa SingletonThreadPool/StaticPool, que não aceitam tamanho
+        return {"connect_args": {"check_same_thread": False}}
+
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    if parsed.get_backend_name() == "sqlite":
+        if parsed.get_driver_name() == "aiosqlite":
+            # O aiosqlite usa NullPool por padrão; sem pool não há o que dimensionar
+            options["poolclass"] = AsyncAdaptedQueuePool
+        else:
+            options["connect_args"] = {"check_same_thread": False}
+    return options
+
+
+def install_sqlite_pragmas(engine: Engine):
+    """Aplica SQLITE_PRAGMAS em toda conexão nova do pool do engine (síncrono)"""
+    if not is_sqlite_file(engine.url):
+        return
+
+    @event.listens_for(engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def effective_settings(engine: Engine) -> Dict[str, Any]:
+    """Lê de volta os valores efetivos numa conexão do pool, para o self-check"""
+    settings: Dict[str, Any] = {"pool": engine.pool.status()}
+    if engine.dialect.name != "sqlite":
+        return settings
+
+    with engine.connect() as conn:
+        for name in SQLITE_PRAGMAS:
+            settings[name] = conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+    return settings
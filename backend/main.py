@@ -1,17 +1,39 @@
-from fastapi import FastAPI, HTTPException, Depends, status, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Depends, status, WebSocket, WebSocketDisconnect, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Date
-from sqlalchemy.orm import DeclarativeBase, sessionmaker, Session, relationship
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Date, Index, UniqueConstraint, case, func, select, or_, tuple_
+from sqlalchemy.orm import DeclarativeBase, sessionmaker, Session, relationship, joinedload, make_transient_to_detached, aliased
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from collections import Counter
 from datetime import datetime, timedelta, date
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from typing import Optional, List, Dict, Any, Union
+from typing import Optional, List, Dict, Any, Union, Tuple
 from pydantic import BaseModel, EmailStr
 import os
 from dotenv import load_dotenv
 import json
 import asyncio
+import base64
+import time
+import uuid
+
+from cache import TTLCache
+from db_profile import SQLITE_PRAGMAS, engine_options, install_sqlite_pragmas, effective_settings
+from migrations import run_migrations, check_query_plans
+from notification_retention import NOTIFICATION_RETENTION_INTERVAL_SECONDS, run_retention
+from password_hashing import (
+    get_executor, hash_password, hash_password_async, verify_and_update_password_async,
+    verify_password_async, shutdown_executor
+)
+from realtime_bus import create_bus
+from story_index import ActiveStoryIndex, StoryViewBuffer
+from user_search import search_user_ids
+from typeahead import NameIndex
+from friend_graph import FriendGraph
+from friend_suggestions import FRIEND_SUGGESTIONS_INTERVAL_SECONDS, FRIEND_SUGGESTIONS_TOP_K, run_friend_suggestions
+from websocket_manager import TYPING_TTL_SECONDS, manager
 
 # Carrega variáveis de ambiente
 load_dotenv()
@@ -20,18 +42,60 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+COUNTER_RECONCILE_INTERVAL_SECONDS = int(os.getenv("COUNTER_RECONCILE_INTERVAL_SECONDS", "600"))
+COUNTER_RECONCILE_BATCH_SIZE = int(os.getenv("COUNTER_RECONCILE_BATCH_SIZE", "500"))
+MAX_PAGE_SIZE = 100
+COMMENT_REPLIES_PER_THREAD = int(os.getenv("COMMENT_REPLIES_PER_THREAD", "3"))
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+NOTIFICATION_DISPATCH_INTERVAL_SECONDS = float(os.getenv("NOTIFICATION_DISPATCH_INTERVAL_SECONDS", "1"))
+NOTIFICATION_DISPATCH_BATCH_SIZE = int(os.getenv("NOTIFICATION_DISPATCH_BATCH_SIZE", "100"))
+NOTIFICATION_OUTBOX_LEASE_SECONDS = int(os.getenv("NOTIFICATION_OUTBOX_LEASE_SECONDS", "30"))
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_OUTBOX_MAX_ATTEMPTS", "5"))
+NOTIFICATION_COALESCE_WINDOW_SECONDS = int(os.getenv("NOTIFICATION_COALESCE_WINDOW_SECONDS", "3600"))
+NOTIFICATION_COALESCE_PUSH_INTERVAL_SECONDS = int(os.getenv("NOTIFICATION_COALESCE_PUSH_INTERVAL_SECONDS", "30"))
+STORY_SWEEP_BATCH_SIZE = int(os.getenv("STORY_SWEEP_BATCH_SIZE", "500"))
+STORY_INDEX_REFRESH_SECONDS = int(os.getenv("STORY_INDEX_REFRESH_SECONDS", "30"))
+STORY_TRAY_CACHE_TTL_SECONDS = int(os.getenv("STORY_TRAY_CACHE_TTL_SECONDS", "60"))
+STORY_TRAY_CACHE_MAX_ENTRIES = int(os.getenv("STORY_TRAY_CACHE_MAX_ENTRIES", "10000"))
+STORY_VIEW_FLUSH_INTERVAL_SECONDS = float(os.getenv("STORY_VIEW_FLUSH_INTERVAL_SECONDS", "1"))
+STORY_VIEW_FLUSH_SIZE = int(os.getenv("STORY_VIEW_FLUSH_SIZE", "500"))
+INBOX_SNIPPET_LENGTH = int(os.getenv("INBOX_SNIPPET_LENGTH", "80"))
+TYPEAHEAD_REBUILD_SECONDS = int(os.getenv("TYPEAHEAD_REBUILD_SECONDS", "600"))
+TYPEAHEAD_MAX_LIMIT = int(os.getenv("TYPEAHEAD_MAX_LIMIT", "20"))
+FRIEND_GRAPH_REFRESH_SECONDS = int(os.getenv("FRIEND_GRAPH_REFRESH_SECONDS", "300"))
 
 # Database
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {})
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
+install_sqlite_pragmas(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Leituras quentes usam um engine assíncrono (aiosqlite/asyncpg) quando
+# DB_ACCESS_MODE=async; com "sync" elas rodam na Session comum em threads
+def async_database_url(url: str) -> str:
+    for sync_prefix, async_prefix in (("sqlite://", "sqlite+aiosqlite://"),
+                                      ("postgresql://", "postgresql+asyncpg://"),
+                                      ("postgres://", "postgresql+asyncpg://")):
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+DB_ACCESS_MODE = os.getenv("DB_ACCESS_MODE", "async")  # async, sync
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", async_database_url(SQLALCHEMY_DATABASE_URL))
+async_engine = None
+AsyncSessionLocal = None
+if DB_ACCESS_MODE == "async":
+    try:
+        async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL))
+        install_sqlite_pragmas(async_engine.sync_engine)
+        AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+    except ImportError as e:
+        print(f"⚠️ Driver assíncrono indisponível ({e}), leituras vão usar sessões síncronas em threads")
+
 class Base(DeclarativeBase):
     pass
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # OAuth2
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
@@ -50,9 +114,15 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     last_seen = Column(DateTime, default=datetime.utcnow)
+    # Mantido na mesma transação de quem cria, lê ou apaga notificações
+    unread_notifications_count = Column(Integer, default=0, nullable=False)
 
 class Post(Base):
     __tablename__ = "posts"
+    __table_args__ = (
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        Index("ix_posts_author_type_created_at_id", "author_id", "post_type", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -86,6 +156,9 @@ class Story(Base):
 
 class StoryView(Base):
     __tablename__ = "story_views"
+    __table_args__ = (
+        Index("ux_story_views_story_id_viewer_id", "story_id", "viewer_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     story_id = Column(Integer, ForeignKey("stories.id"), nullable=False)
@@ -97,6 +170,10 @@ class StoryView(Base):
 
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (
+        Index("ix_notifications_recipient_created_at_id", "recipient_id", "created_at", "id"),
+        Index("ix_notifications_recipient_group_started_at", "recipient_id", "group_key", "group_started_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     recipient_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -107,10 +184,47 @@ class Notification(Base):
     data = Column(Text)  # JSON data
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Eventos agrupados numa única linha ("X e outras 41 pessoas...")
+    group_key = Column(String(100))
+    actor_count = Column(Integer, default=1, nullable=False)
+    # Primeiro evento do grupo: a janela conta daqui, created_at sobe a cada evento
+    group_started_at = Column(DateTime)
     
     recipient = relationship("User", foreign_keys=[recipient_id], backref="received_notifications")
     sender = relationship("User", foreign_keys=[sender_id], backref="sent_notifications")
 
+class NotificationOutbox(Base):
+    """Entregas em tempo real pendentes, gravadas na mesma transação da notificação"""
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        Index("ix_notification_outbox_available_at_id", "available_at", "id"),
+        Index("ix_notification_outbox_claimed_by", "claimed_by"),
+        Index("ix_notification_outbox_notification_id", "notification_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    notification_id = Column(Integer, ForeignKey("notifications.id", ondelete="CASCADE"), nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    available_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    claimed_by = Column(String(32))
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    notification = relationship("Notification")
+
+class NotificationActor(Base):
+    """Quem já está numa notificação agrupada: actor_count conta pessoas, não eventos"""
+    __tablename__ = "notification_actors"
+    __table_args__ = (
+        Index("ux_notification_actors_notification_user", "notification_id", "user_id", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    notification_id = Column(Integer, ForeignKey("notifications.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    
+    notification = relationship("Notification")
+
 class Friendship(Base):
     __tablename__ = "friendships"
     
@@ -138,6 +252,9 @@ class Reaction(Base):
 
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (
+        Index("ix_comments_post_parent_created_at_id", "post_id", "parent_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     content = Column(Text, nullable=False)
@@ -160,6 +277,68 @@ class Share(Base):
     
     user = relationship("User", backref="shares")
 
+class FriendSuggestion(Base):
+    """Sugestões de amizade pré-calculadas pelo job de friend_suggestions.py"""
+    __tablename__ = "friend_suggestions"
+    __table_args__ = (
+        Index("ix_friend_suggestions_user_rank", "user_id", "rank"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    suggested_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    rank = Column(Integer, nullable=False)
+    mutual_friends = Column(Integer, default=0, nullable=False)
+    followed_by_friends = Column(Integer, default=0, nullable=False)
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+class JobLease(Base):
+    """Trava com prazo para jobs que só um worker deve rodar por vez"""
+    __tablename__ = "job_leases"
+
+    name = Column(String(50), primary_key=True)
+    owner = Column(String(32), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+class Conversation(Base):
+    """Conversa entre dois usuários, guardada com o par em ordem (user1_id < user2_id)"""
+    __tablename__ = "conversations"
+    __table_args__ = (
+        UniqueConstraint("user1_id", "user2_id", name="unique_conversation"),
+        # Caixa de entrada: um índice por lado do par, sem OR entre colunas
+        Index("ix_conversations_user1_updated_at_id", "user1_id", "updated_at", "id"),
+        Index("ix_conversations_user2_updated_at_id", "user2_id", "updated_at", "id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user1_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user2_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    last_message_id = Column(Integer, ForeignKey("messages.id", use_alter=True, name="fk_conversations_last_message_id"))
+    # Mensagens não lidas de cada participante, mantidas junto com `messages`
+    user1_unread_count = Column(Integer, default=0, nullable=False)
+    user2_unread_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class Message(Base):
+    __tablename__ = "messages"
+    __table_args__ = (
+        # Histórico da conversa por (created_at, id) sem varrer a tabela
+        Index("ix_messages_conversation_created_at_id", "conversation_id", "created_at", "id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"))
+    sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    receiver_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    content = Column(Text, nullable=False)
+    message_type = Column(String(20), default="text")  # text, image, video
+    media_url = Column(String(500))
+    is_read = Column(Boolean, default=False)
+    # Confirmado pelo cliente do destinatário (frame "delivered")
+    delivered_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 # Pydantic models
 class UserBase(BaseModel):
     first_name: str
@@ -196,6 +375,16 @@ class UserResponse(UserBase):
             date: lambda v: v.isoformat() if v else None
         }
 
+class UserUpdate(BaseModel):
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    gender: Optional[str] = None
+    phone: Optional[str] = None
+
+class PasswordUpdate(BaseModel):
+    current_password: str
+    new_password: str
+
 class ReactionCreate(BaseModel):
     post_id: int
     reaction_type: str
@@ -211,7 +400,11 @@ class CommentResponse(BaseModel):
     author: Dict[str, Any]
     created_at: datetime
     reactions_count: int = 0
+    parent_id: Optional[int] = None
     replies: List['CommentResponse'] = []
+    # Total de respostas no fio e cursor para GET /comments/{id}/replies
+    replies_count: int = 0
+    replies_cursor: Optional[str] = None
     
     class Config:
         from_attributes = True
@@ -273,6 +466,15 @@ class StoryResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class TrayStoryResponse(StoryResponse):
+    seen: bool
+
+class StoryTrayResponse(BaseModel):
+    author: Dict[str, Any]
+    stories: List[TrayStoryResponse]
+    has_unseen: bool
+    latest_created_at: datetime
+
 class NotificationResponse(BaseModel):
     id: int
     notification_type: str
@@ -282,17 +484,40 @@ class NotificationResponse(BaseModel):
     is_read: bool
     created_at: datetime
     sender: Optional[Dict[str, Any]] = None
+    actor_count: int = 1
     
     class Config:
         from_attributes = True
 
-# Utility functions
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+class MessageCreate(BaseModel):
+    receiver_id: int
+    content: str
+    message_type: str = "text"
+    media_url: Optional[str] = None
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+class MessageResponse(BaseModel):
+    id: int
+    conversation_id: int
+    sender_id: int
+    receiver_id: int
+    content: str
+    message_type: str
+    media_url: Optional[str] = None
+    is_read: bool
+    delivered_at: Optional[datetime] = None
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
 
+class InboxConversationResponse(BaseModel):
+    id: int
+    peer: Dict[str, Any]
+    last_message: Optional[Dict[str, Any]] = None
+    unread_count: int = 0
+    updated_at: datetime
+
+# Utility functions
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -303,6 +528,667 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Keyset pagination
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def paginate_keyset(query, model, cursor: Optional[str], limit: int):
+    """Pagina por (created_at, id) decrescente sem OFFSET.
+
+    Retorna a página e o cursor da próxima, ou None quando não há mais linhas.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor:
+        query = query.filter(tuple_(model.created_at, model.id) < tuple_(*decode_cursor(cursor)))
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], encode_cursor(last.created_at, last.id)
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+# Post hydration
+def serialize_author(user: User) -> Dict[str, Any]:
+    return {
+        "id": user.id,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "avatar": getattr(user, 'avatar', None)
+    }
+
+def hydrate_posts(db: Session, posts: List[Post]) -> List[PostResponse]:
+    """Monta PostResponse para uma página de posts sem consultas extras.
+
+    Os autores devem vir carregados junto com os posts (joinedload) e os
+    contadores vêm das colunas desnormalizadas mantidas por bump_post_counter.
+    """
+    return [
+        PostResponse(
+            id=post.id,
+            author=serialize_author(post.author),
+            content=post.content,
+            post_type=post.post_type,
+            media_type=post.media_type,
+            media_url=post.media_url,
+            created_at=post.created_at,
+            reactions_count=post.reactions_count or 0,
+            comments_count=post.comments_count or 0,
+            shares_count=post.shares_count or 0
+        )
+        for post in posts
+    ]
+
+def load_post_page(db: Session, *criteria, cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[PostResponse], Optional[str]]:
+    """Carrega uma página de posts (mais recentes primeiro) já hidratada"""
+    query = db.query(Post).options(joinedload(Post.author)).filter(*criteria)
+    posts, next_cursor = paginate_keyset(query, Post, cursor, limit)
+    return hydrate_posts(db, posts), next_cursor
+
+# Engagement counters
+POST_COUNTER_SOURCES = {
+    "reactions_count": Reaction,
+    "comments_count": Comment,
+    "shares_count": Share,
+}
+
+def bump_post_counter(db: Session, post_id: int, counter: str, delta: int):
+    """Ajusta um contador de Post na mesma transação da escrita que o originou"""
+    column = getattr(Post, counter)
+    db.query(Post).filter(Post.id == post_id).update(
+        {column: func.coalesce(column, 0) + delta}, synchronize_session=False
+    )
+
+def reconcile_post_counters(db: Session, batch_size: int = COUNTER_RECONCILE_BATCH_SIZE) -> int:
+    """Recalcula em lote os contadores que divergiram das tabelas de origem.
+
+    Percorre os posts por faixas de id, fazendo um UPDATE com subconsultas
+    correlacionadas por faixa, e retorna quantos posts foram corrigidos.
+    """
+    actual = {
+        counter: select(func.count(model.id)).where(model.post_id == Post.id).scalar_subquery()
+        for counter, model in POST_COUNTER_SOURCES.items()
+    }
+    drifted = or_(*[
+        func.coalesce(getattr(Post, counter), -1) != actual[counter]
+        for counter in POST_COUNTER_SOURCES
+    ])
+
+    max_id = db.query(func.max(Post.id)).scalar() or 0
+    fixed = 0
+    for start in range(0, max_id, batch_size):
+        fixed += db.query(Post).filter(
+            Post.id > start, Post.id <= start + batch_size, drifted
+        ).update(
+            {getattr(Post, counter): actual[counter] for counter in POST_COUNTER_SOURCES},
+            synchronize_session=False
+        )
+        db.commit()
+    return fixed
+
+def bump_unread_count(db: Session, user_id: int, delta: int):
+    """Ajusta o contador de não lidas na mesma transação da escrita em notifications"""
+    if delta:
+        db.query(User).filter(User.id == user_id).update(
+            {User.unread_notifications_count: User.unread_notifications_count + delta},
+            synchronize_session=False
+        )
+
+def read_unread_count(db: Session, user_id: int) -> int:
+    return db.query(User.unread_notifications_count).filter(User.id == user_id).scalar() or 0
+
+async def push_unread_count(user_id: int, count: int):
+    await manager.send_personal_message(json.dumps({"type": "unread_count", "count": count}), user_id)
+
+def reconcile_unread_counts(db: Session, batch_size: int = COUNTER_RECONCILE_BATCH_SIZE) -> int:
+    actual = select(func.count(Notification.id)).where(
+        Notification.recipient_id == User.id,
+        Notification.is_read == False
+    ).scalar_subquery()
+
+    max_id = db.query(func.max(User.id)).scalar() or 0
+    fixed = 0
+    for start in range(0, max_id, batch_size):
+        fixed += db.query(User).filter(
+            User.id > start, User.id <= start + batch_size,
+            User.unread_notifications_count != actual
+        ).update({User.unread_notifications_count: actual}, synchronize_session=False)
+        db.commit()
+    return fixed
+
+async def run_counter_reconciliation():
+    # A primeira passada é na subida: um deploy não empurra a correção por mais um intervalo
+    while True:
+        db = SessionLocal()
+        try:
+            fixed = await asyncio.to_thread(reconcile_post_counters, db)
+            if fixed:
+                print(f"🔁 Contadores de {fixed} posts reconciliados")
+            fixed = await asyncio.to_thread(reconcile_unread_counts, db)
+            if fixed:
+                print(f"🔁 Não lidas de {fixed} usuários reconciliadas")
+        except Exception as e:
+            print(f"❌ Erro ao reconciliar contadores: {e}")
+            db.rollback()
+        finally:
+            db.close()
+        await asyncio.sleep(COUNTER_RECONCILE_INTERVAL_SECONDS)
+
+# Notification outbox
+outbox_wakeup = asyncio.Event()
+outbox_stats = {"delivered": 0, "retried": 0, "abandoned": 0}
+
+# Tipos agrupáveis: (chave em `data` que identifica o alvo, verbo no singular, no plural).
+# A preposição acompanha o verbo (reagir a, comentar em), como nas mensagens avulsas
+COALESCED_NOTIFICATIONS = {
+    "reaction": ("post_id", "reagiu ao seu post", "reagiram ao seu post"),
+    "comment": ("post_id", "comentou no seu post", "comentaram no seu post"),
+}
+
+def notification_group_key(notification_type: str, data: Dict[str, Any]) -> Optional[str]:
+    if notification_type not in COALESCED_NOTIFICATIONS:
+        return None
+    return f"{notification_type}:{data[COALESCED_NOTIFICATIONS[notification_type][0]]}"
+
+def coalesced_message(notification_type: str, actor_count: int) -> str:
+    others = actor_count - 1
+    _, singular, plural = COALESCED_NOTIFICATIONS[notification_type]
+    if others == 1:
+        return f"e outra pessoa {singular}"
+    return f"e outras {others} pessoas {plural}"
+
+def coalesce_notification(db: Session, recipient_id: int, sender: User, notification_type: str, group_key: str, data: Dict[str, Any]) -> Optional[int]:
+    """Soma o evento a uma notificação não lida do mesmo alvo dentro da janela, se houver.
+
+    Devolve o id da notificação do grupo. A janela conta do primeiro evento do
+    grupo, então um post que não para de receber reações abre um grupo novo a
+    cada NOTIFICATION_COALESCE_WINDOW_SECONDS. Quem já está no grupo não conta
+    de novo, e o incremento é feito no próprio UPDATE para não perder eventos
+    concorrentes.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=NOTIFICATION_COALESCE_WINDOW_SECONDS)
+    notification_id = db.query(Notification.id).filter(
+        Notification.recipient_id == recipient_id,
+        Notification.group_key == group_key,
+        Notification.group_started_at >= cutoff,
+        Notification.is_read == False
+    ).order_by(Notification.group_started_at.desc()).limit(1).scalar()
+    if notification_id is None:
+        return None
+
+    joined = db.execute(insert_ignoring_conflicts(NotificationActor.__table__).values(
+        notification_id=notification_id, user_id=sender.id
+    )).rowcount
+    if not joined:
+        return notification_id
+
+    db.query(Notification).filter(Notification.id == notification_id).update({
+        Notification.actor_count: Notification.actor_count + 1,
+        Notification.sender_id: sender.id,
+        Notification.title: f"{sender.first_name} {sender.last_name}",
+        Notification.data: json.dumps(data),
+        # Sobe para o topo da lista, como uma notificação nova
+        Notification.created_at: datetime.utcnow()
+    }, synchronize_session=False)
+    # O UPDATE acima segura a linha até o commit, então a contagem lida é a nossa
+    actor_count = db.query(Notification.actor_count).filter(Notification.id == notification_id).scalar()
+    db.query(Notification).filter(Notification.id == notification_id).update({
+        Notification.message: coalesced_message(notification_type, actor_count)
+    }, synchronize_session=False)
+
+    # No máximo um push pendente por grupo, e nunca antes do intervalo
+    pending = db.query(NotificationOutbox.id).filter(
+        NotificationOutbox.notification_id == notification_id
+    ).first()
+    if pending is None:
+        db.add(NotificationOutbox(
+            notification_id=notification_id,
+            available_at=datetime.utcnow() + timedelta(seconds=NOTIFICATION_COALESCE_PUSH_INTERVAL_SECONDS)
+        ))
+    return notification_id
+
+def queue_notification(db: Session, recipient_id: int, sender: User, notification_type: str, message: str, data: Dict[str, Any]):
+    """Adiciona a notificação e sua entrega ao outbox; quem chama faz o commit junto com a ação"""
+    group_key = notification_group_key(notification_type, data)
+    if group_key is not None:
+        if coalesce_notification(db, recipient_id, sender, notification_type, group_key, data) is not None:
+            return
+
+    now = datetime.utcnow()
+    notification = Notification(
+        recipient_id=recipient_id,
+        sender_id=sender.id,
+        notification_type=notification_type,
+        title=f"{sender.first_name} {sender.last_name}",
+        message=message,
+        data=json.dumps(data),
+        created_at=now,
+        group_key=group_key,
+        group_started_at=now if group_key is not None else None,
+        actor_count=1
+    )
+    db.add(notification)
+    db.add(NotificationOutbox(notification=notification))
+    if group_key is not None:
+        db.add(NotificationActor(notification=notification, user_id=sender.id))
+    bump_unread_count(db, recipient_id, 1)
+
+def wake_notification_dispatcher():
+    outbox_wakeup.set()
+
+def notification_payload(notification: Notification) -> Dict[str, Any]:
+    return {
+        "id": notification.id,
+        "type": notification.notification_type,
+        "title": notification.title,
+        "message": notification.message,
+        "sender": serialize_author(notification.sender) if notification.sender else None,
+        "data": json.loads(notification.data) if notification.data else {},
+        "actor_count": notification.actor_count,
+        "created_at": notification.created_at.isoformat()
+    }
+
+def claim_outbox_batch(db: Session, limit: int) -> Tuple[List[Tuple[int, Optional[int], Optional[Dict[str, Any]]]], Dict[int, int]]:
+    """Reserva até `limit` entregas vencidas para este worker por NOTIFICATION_OUTBOX_LEASE_SECONDS.
+
+    Devolve as entregas e o contador de não lidas atual de cada destinatário.
+    """
+    now = datetime.utcnow()
+    claim = uuid.uuid4().hex
+    # Mais antigas primeiro, na ordem do índice (available_at, id)
+    due = select(NotificationOutbox.id).where(
+        NotificationOutbox.available_at <= now
+    ).order_by(NotificationOutbox.available_at, NotificationOutbox.id).limit(limit)
+    # O UPDATE único é a reserva: outro worker não pega a mesma linha
+    db.query(NotificationOutbox).filter(
+        NotificationOutbox.id.in_(due),
+        NotificationOutbox.available_at <= now
+    ).update({
+        NotificationOutbox.claimed_by: claim,
+        NotificationOutbox.available_at: now + timedelta(seconds=NOTIFICATION_OUTBOX_LEASE_SECONDS)
+    }, synchronize_session=False)
+    db.commit()
+
+    entries = db.query(NotificationOutbox).options(
+        joinedload(NotificationOutbox.notification).joinedload(Notification.sender)
+    ).filter(NotificationOutbox.claimed_by == claim).order_by(NotificationOutbox.id).all()
+    batch = []
+    for entry in entries:
+        if entry.notification is None:
+            # Notificação apagada antes da entrega
+            batch.append((entry.id, None, None))
+        else:
+            batch.append((entry.id, entry.notification.recipient_id, notification_payload(entry.notification)))
+
+    recipients = {recipient_id for _, recipient_id, _ in batch if recipient_id is not None}
+    unread_counts = dict(db.query(User.id, User.unread_notifications_count).filter(User.id.in_(recipients)).all()) if recipients else {}
+    return batch, unread_counts
+
+def finish_outbox_batch(db: Session, delivered: List[int], failed: Dict[int, str]):
+    if delivered:
+        db.query(NotificationOutbox).filter(NotificationOutbox.id.in_(delivered)).delete(synchronize_session=False)
+        outbox_stats["delivered"] += len(delivered)
+    now = datetime.utcnow()
+    for entry in db.query(NotificationOutbox).filter(NotificationOutbox.id.in_(list(failed))).all():
+        entry.attempts += 1
+        if entry.attempts >= NOTIFICATION_OUTBOX_MAX_ATTEMPTS:
+            # A notificação continua na lista do usuário; só o push é abandonado
+            print(f"❌ Entrega da notificação {entry.notification_id} abandonada após {entry.attempts} tentativas: {failed[entry.id]}")
+            db.delete(entry)
+            outbox_stats["abandoned"] += 1
+            continue
+        outbox_stats["retried"] += 1
+        entry.claimed_by = None
+        entry.last_error = failed[entry.id]
+        entry.available_at = now + timedelta(seconds=2 ** entry.attempts)
+    db.commit()
+
+async def dispatch_notifications() -> int:
+    db = SessionLocal()
+    try:
+        batch, unread_counts = await asyncio.to_thread(claim_outbox_batch, db, NOTIFICATION_DISPATCH_BATCH_SIZE)
+        if not batch:
+            return 0
+        results = await asyncio.gather(*(
+            manager.send_notification(recipient_id, payload)
+            for _, recipient_id, payload in batch if payload is not None
+        ), return_exceptions=True)
+        await asyncio.gather(*(
+            push_unread_count(recipient_id, count) for recipient_id, count in unread_counts.items()
+        ), return_exceptions=True)
+        pending = [entry_id for entry_id, _, payload in batch if payload is not None]
+        delivered = [entry_id for entry_id, _, payload in batch if payload is None]
+        failed = {}
+        for entry_id, result in zip(pending, results):
+            if isinstance(result, Exception):
+                failed[entry_id] = repr(result)
+            elif result is False:
+                # Backplane fora: outros workers não receberam, a linha fica para nova tentativa
+                failed[entry_id] = "Backplane indisponível"
+            else:
+                delivered.append(entry_id)
+        await asyncio.to_thread(finish_outbox_batch, db, delivered, failed)
+        return len(batch)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def run_notification_dispatcher():
+    while True:
+        outbox_wakeup.clear()
+        try:
+            handled = await dispatch_notifications()
+        except Exception as e:
+            print(f"❌ Erro ao despachar notificações: {e}")
+            handled = 0
+        # Lote cheio indica fila acumulada; senão espera o próximo commit ou o intervalo
+        if handled < NOTIFICATION_DISPATCH_BATCH_SIZE:
+            try:
+                await asyncio.wait_for(outbox_wakeup.wait(), NOTIFICATION_DISPATCH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+# Notification retention
+retention_report: Dict[str, Any] = {}
+
+async def run_notification_retention():
+    global retention_report
+    # Primeira passada na subida, depois a cada intervalo
+    while True:
+        db = SessionLocal()
+        try:
+            retention_report = await asyncio.to_thread(run_retention, db, Notification, NotificationOutbox, NotificationActor)
+        except Exception as e:
+            print(f"❌ Erro na retenção de notificações: {e}")
+            db.rollback()
+        finally:
+            db.close()
+        await asyncio.sleep(NOTIFICATION_RETENTION_INTERVAL_SECONDS)
+
+# Sugestões de amizade
+friend_suggestions_report: Dict[str, Any] = {}
+WORKER_ID = uuid.uuid4().hex
+
+def acquire_job_lease(db: Session, name: str, seconds: int, owner: str = WORKER_ID) -> bool:
+    """Pega (ou renova) a trava `name` por `seconds` se estiver livre, vencida ou já for nossa"""
+    now = datetime.utcnow()
+    db.execute(insert_ignoring_conflicts(JobLease.__table__).values(name=name, owner=owner, expires_at=now))
+    # Um UPDATE só: entre workers disputando, no máximo um casa a condição
+    taken = db.query(JobLease).filter(
+        JobLease.name == name, or_(JobLease.owner == owner, JobLease.expires_at <= now)
+    ).update({JobLease.owner: owner, JobLease.expires_at: now + timedelta(seconds=seconds)}, synchronize_session=False)
+    db.commit()
+    return taken == 1
+
+def refresh_friend_suggestions() -> Optional[Dict[str, Any]]:
+    """Recalcula as sugestões se este worker ficar com a trava do intervalo"""
+    db = SessionLocal()
+    try:
+        if not acquire_job_lease(db, "friend_suggestions", FRIEND_SUGGESTIONS_INTERVAL_SECONDS):
+            return None
+        return run_friend_suggestions(db, FriendSuggestion)
+    finally:
+        db.close()
+
+async def run_friend_suggestion_job():
+    # FRIEND_SUGGESTIONS_INTERVAL_SECONDS=0 desliga o job aqui (ex.: rodar via cron com
+    # `python friend_suggestions.py`). Ligado, roda já na subida e depois a cada
+    # intervalo, mas só no worker que pegar a trava: um reinício dentro do intervalo
+    # não recalcula de novo e os outros workers só assumem se o dono sumir.
+    global friend_suggestions_report
+    if FRIEND_SUGGESTIONS_INTERVAL_SECONDS <= 0:
+        return
+    while True:
+        try:
+            report = await asyncio.to_thread(refresh_friend_suggestions)
+            if report is not None:
+                friend_suggestions_report = report
+        except Exception as e:
+            print(f"❌ Erro ao calcular sugestões de amizade: {e}")
+        await asyncio.sleep(FRIEND_SUGGESTIONS_INTERVAL_SECONDS)
+
+# Stories ativos e expiração
+story_index = ActiveStoryIndex()
+
+def serialize_story(story: Story, views_count: int) -> Dict[str, Any]:
+    return {
+        "id": story.id,
+        "author": {
+            "id": story.author.id,
+            "first_name": story.author.first_name,
+            "last_name": story.author.last_name,
+            "avatar": None
+        },
+        "content": story.content,
+        "media_type": story.media_type,
+        "media_url": story.media_url,
+        "background_color": story.background_color,
+        "created_at": story.created_at,
+        "expires_at": story.expires_at,
+        "views_count": views_count
+    }
+
+def load_active_stories(db: Session) -> List[Dict[str, Any]]:
+    stories = db.query(Story).options(joinedload(Story.author)).filter(
+        Story.expires_at > datetime.utcnow()
+    ).all()
+    return [serialize_story(story, story.views_count or 0) for story in stories]
+
+# Bandeja por usuário: (versão do story_index, bandeja montada)
+story_tray_cache = TTLCache(STORY_TRAY_CACHE_MAX_ENTRIES, STORY_TRAY_CACHE_TTL_SECONDS)
+
+def build_story_tray(db: Session, viewer_id: int, stories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Agrupa os stories ativos por autor, marcando o que o usuário já viu com uma única consulta"""
+    ids = [story["id"] for story in stories]
+    seen = {story_id for (story_id,) in db.query(StoryView.story_id).filter(
+        StoryView.viewer_id == viewer_id,
+        StoryView.story_id.in_(ids)
+    )} if ids else set()
+
+    groups: Dict[int, Dict[str, Any]] = {}
+    # Dentro do grupo os stories tocam do mais antigo para o mais novo
+    for story in sorted(stories, key=lambda story: (story["created_at"], story["id"])):
+        group = groups.setdefault(story["author"]["id"], {
+            "author": story["author"],
+            "stories": [],
+            "has_unseen": False
+        })
+        group["stories"].append({**story, "seen": story["id"] in seen})
+        group["has_unseen"] = group["has_unseen"] or story["id"] not in seen
+        group["latest_created_at"] = story["created_at"]
+
+    # Próprios stories primeiro, depois não vistos, cada faixa do mais recente ao mais antigo
+    tray = sorted(groups.values(), key=lambda group: group["latest_created_at"], reverse=True)
+    tray.sort(key=lambda group: (group["author"]["id"] != viewer_id, not group["has_unseen"]))
+    return tray
+
+# Visualizações de stories: buffer em memória gravado em lote
+story_view_buffer = StoryViewBuffer()
+story_view_wakeup = asyncio.Event()
+
+def insert_ignoring_conflicts(table):
+    dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+    return dialect.insert(table).on_conflict_do_nothing()
+
+def flush_story_views(db: Session, rows: List[Dict[str, Any]]) -> Tuple[Counter, set]:
+    """Grava o lote ignorando pares já existentes e soma em views_count só o que entrou"""
+    story_ids = {row["story_id"] for row in rows}
+    # Stories apagados ou expirados enquanto o lote estava no buffer
+    live = {story_id for (story_id,) in db.query(Story.id).filter(Story.id.in_(story_ids))}
+    rows = [row for row in rows if row["story_id"] in live]
+    if not rows:
+        return Counter(), set()
+
+    inserted = db.execute(
+        insert_ignoring_conflicts(StoryView.__table__).returning(StoryView.story_id, StoryView.viewer_id),
+        rows
+    ).all()
+    counts = Counter(story_id for story_id, _ in inserted)
+    for story_id, views in counts.items():
+        db.query(Story).filter(Story.id == story_id).update(
+            {Story.views_count: func.coalesce(Story.views_count, 0) + views}, synchronize_session=False
+        )
+    db.commit()
+    return counts, {viewer_id for _, viewer_id in inserted}
+
+async def flush_buffered_story_views() -> int:
+    rows = story_view_buffer.drain()
+    if not rows:
+        return 0
+    db = SessionLocal()
+    try:
+        counts, viewers = await asyncio.to_thread(flush_story_views, db, rows)
+    except Exception as e:
+        print(f"❌ Erro ao gravar visualizações de stories: {e}")
+        db.rollback()
+        story_view_buffer.requeue(rows)
+        return 0
+    finally:
+        db.close()
+
+    for story_id, views in counts.items():
+        story_index.increment_views(story_id, views)
+    for viewer_id in viewers:
+        story_tray_cache.delete(viewer_id)
+    return len(rows)
+
+async def run_story_view_flusher():
+    while True:
+        try:
+            await asyncio.wait_for(story_view_wakeup.wait(), STORY_VIEW_FLUSH_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        story_view_wakeup.clear()
+        await flush_buffered_story_views()
+
+def refresh_story_index():
+    db = SessionLocal()
+    try:
+        story_index.load(load_active_stories(db))
+    finally:
+        db.close()
+
+def media_file_path(media_url: Optional[str]) -> Optional[str]:
+    """Caminho local de uma mídia enviada para uploads/, se for o caso"""
+    if media_url and media_url.startswith('http://localhost:8000/uploads/'):
+        return media_url.replace('http://localhost:8000/', '')
+    return None
+
+def sweep_expired_stories(db: Session, batch_size: int = STORY_SWEEP_BATCH_SIZE) -> int:
+    """Apaga stories vencidos, suas visualizações e arquivos, em lotes pelo índice de expires_at"""
+    now = datetime.utcnow()
+    deleted = 0
+    while True:
+        expired = db.query(Story.id, Story.media_url).filter(
+            Story.expires_at <= now
+        ).order_by(Story.expires_at).limit(batch_size).all()
+        if not expired:
+            break
+        ids = [story_id for story_id, _ in expired]
+        db.query(StoryView).filter(StoryView.story_id.in_(ids)).delete(synchronize_session=False)
+        db.query(Story).filter(Story.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        deleted += len(ids)
+
+        # Arquivos só depois do commit: no pior caso sobra um arquivo órfão
+        for _, media_url in expired:
+            file_path = media_file_path(media_url)
+            try:
+                if file_path and os.path.exists(file_path):
+                    os.remove(file_path)
+            except OSError as e:
+                print(f"⚠️ Erro ao remover mídia {file_path}: {e}")
+        if len(expired) < batch_size:
+            break
+    return deleted
+
+async def run_story_sweeper():
+    while True:
+        now = datetime.utcnow()
+        try:
+            if story_index.loaded_at is None or (now - story_index.loaded_at).total_seconds() >= STORY_INDEX_REFRESH_SECONDS:
+                await asyncio.to_thread(refresh_story_index)
+            story_index.pop_expired(now)
+            db = SessionLocal()
+            try:
+                deleted = await asyncio.to_thread(sweep_expired_stories, db)
+            finally:
+                db.close()
+            if deleted:
+                print(f"🧹 {deleted} stories expirados removidos")
+        except Exception as e:
+            print(f"❌ Erro ao expirar stories: {e}")
+
+        # Acorda no próximo vencimento ou na próxima recarga, o que vier antes
+        delay = STORY_INDEX_REFRESH_SECONDS
+        next_expiry = story_index.next_expiry()
+        if next_expiry is not None:
+            delay = min(delay, max((next_expiry - datetime.utcnow()).total_seconds(), 0) + 0.1)
+        await asyncio.sleep(delay)
+
+# Sugestões de usuários (type-ahead) em memória
+user_name_index = NameIndex()
+
+def rebuild_name_index():
+    db = SessionLocal()
+    try:
+        user_name_index.load(db.query(User.id, User.first_name, User.last_name).filter(
+            User.is_active == True
+        ).order_by(User.id).yield_per(5000))
+    finally:
+        db.close()
+
+async def run_name_index_rebuild():
+    # Cadastros e edições de outros workers só chegam na reconstrução
+    while True:
+        try:
+            await asyncio.to_thread(rebuild_name_index)
+        except Exception as e:
+            print(f"❌ Erro ao montar índice de sugestões: {e}")
+        await asyncio.sleep(TYPEAHEAD_REBUILD_SECONDS)
+
+# Grafo de amizades em memória
+def accepted_friendships() -> List[Tuple[int, int]]:
+    db = SessionLocal()
+    try:
+        return db.query(Friendship.requester_id, Friendship.addressee_id).filter(
+            Friendship.status == "accepted"
+        ).all()
+    finally:
+        db.close()
+
+friend_graph = FriendGraph(accepted_friendships)
+
+async def ready_friend_graph() -> FriendGraph:
+    # A primeira carga vai para uma thread para não travar o event loop
+    if not friend_graph.loaded:
+        await asyncio.to_thread(friend_graph.ensure_loaded)
+    return friend_graph
+
+async def run_friend_graph_refresh():
+    # Só recarrega se alguém já usou o grafo; mudanças de outros workers chegam aqui
+    while True:
+        await asyncio.sleep(FRIEND_GRAPH_REFRESH_SECONDS)
+        if not friend_graph.loaded:
+            continue
+        try:
+            await asyncio.to_thread(friend_graph.reload)
+        except Exception as e:
+            print(f"❌ Erro ao recarregar grafo de amizades: {e}")
+
 # Database dependency
 def get_db():
     db = SessionLocal()
@@ -311,76 +1197,91 @@ def get_db():
     finally:
         db.close()
 
+async def get_read_db():
+    """Sessão para leituras quentes: AsyncSession ou, em modo sync, a Session comum"""
+    if AsyncSessionLocal is None:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+    else:
+        async with AsyncSessionLocal() as db:
+            yield db
+
+async def run_read(db: Union[Session, AsyncSession], fn, *args, **kwargs):
+    """Executa fn(session, ...) sem bloquear o event loop.
+
+    Com AsyncSession o código síncrono roda via run_sync sobre o driver
+    assíncrono; com Session comum ele vai para o threadpool.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+# Authenticated principal cache
+token_cache = TTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)  # token -> user id
+principal_cache = TTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)  # user id -> colunas do User
+
+def snapshot_user(user: User) -> Dict[str, Any]:
+    return {column.key: getattr(user, column.key) for column in User.__table__.columns}
+
+def attach_principal(db: Session, snapshot: Dict[str, Any]) -> User:
+    """Recria o User em cache dentro da sessão da requisição, sem SELECT"""
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+def resolve_principal(db: Session, token: str) -> Optional[User]:
+    """Resolve o usuário de um token, evitando jwt.decode e o SELECT quando em cache"""
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        snapshot = principal_cache.get(user_id)
+        if snapshot is not None:
+            return attach_principal(db, snapshot)
+        user = db.query(User).filter(User.id == user_id).first()
+    else:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        email = payload.get("sub")
+        if email is None:
+            return None
+        user = db.query(User).filter(User.email == email).first()
+        if user is not None:
+            expires_in = payload["exp"] - time.time() if "exp" in payload else None
+            token_cache.set(token, user.id, ttl_seconds=expires_in)
+
+    if user is None:
+        return None
+    principal_cache.set(user.id, snapshot_user(user))
+    return user
+
+def invalidate_principal(user_id: int):
+    """Deve ser chamada por toda escrita que altera o usuário"""
+    principal_cache.delete(user_id)
+    token_cache.delete_where(lambda token, cached_user_id: cached_user_id == user_id)
+
 # Get current user
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.email == email).first()
+    user = resolve_principal(db, token)
     if user is None:
         raise credentials_exception
     return user
 
-# WebSocket Manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, List[WebSocket]] = {}
-
-    async def connect(self, websocket: WebSocket, user_id: int):
-        await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
-
-    def disconnect(self, websocket: WebSocket, user_id: int):
-        if user_id in self.active_connections:
-            if websocket in self.active_connections[user_id]:
-                self.active_connections[user_id].remove(websocket)
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
-
-    async def send_personal_message(self, message: str, user_id: int):
-        if user_id in self.active_connections:
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_text(message)
-                except:
-                    self.active_connections[user_id].remove(connection)
-
-    async def send_notification(self, user_id: int, notification: dict):
-        message = json.dumps({
-            "type": "notification",
-            **notification
-        })
-        await self.send_personal_message(message, user_id)
-
-manager = ConnectionManager()
-
+# WebSocket auth
 def verify_websocket_token(token: str):
+    db = SessionLocal()
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
-        
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter(User.email == email).first()
-            return user
-        finally:
-            db.close()
-    except JWTError:
-        return None
+        return resolve_principal(db, token)
+    finally:
+        db.close()
 
 # FastAPI app
 app = FastAPI(title="Backend API", version="1.0.0")
@@ -392,19 +1293,69 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Sync-Cursor", "X-Remaining-Count"],
 )
 
+# Background tasks
+@app.on_event("startup")
+async def start_background_tasks():
+    settings = effective_settings(engine)
+    print(f"🗄️ Banco: {settings}")
+    if engine.dialect.name == "sqlite" and str(settings.get("journal_mode")).lower() != SQLITE_PRAGMAS["journal_mode"].lower():
+        print(f"⚠️ journal_mode efetivo é {settings.get('journal_mode')}, esperado {SQLITE_PRAGMAS['journal_mode']}")
+    for name, details in check_query_plans(engine).items():
+        print(f"⚠️ Consulta {name} sem índice: {'; '.join(details)}")
+    # O pool do bcrypt nasce aqui, não no primeiro login
+    get_executor()
+    asyncio.create_task(run_counter_reconciliation())
+    asyncio.create_task(run_notification_dispatcher())
+    asyncio.create_task(run_notification_retention())
+    asyncio.create_task(run_story_sweeper())
+    asyncio.create_task(run_story_view_flusher())
+    asyncio.create_task(run_name_index_rebuild())
+    asyncio.create_task(run_friend_graph_refresh())
+    asyncio.create_task(run_friend_suggestion_job())
+    await manager.start(create_bus())
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    shutdown_executor()
+    await flush_buffered_story_views()
+    await manager.stop()
+    if async_engine is not None:
+        await async_engine.dispose()
+
 # Auth routes
+# Os handlers são async para aguardar o pool do bcrypt; o banco vai para o
+# threadpool para que uma espera por lock não trave o event loop
+def find_user_by_email(db: Session, email: str) -> Optional[User]:
+    return db.query(User).filter(User.email == email).first()
+
+def find_active_user(db: Session, user_id: int) -> Optional[User]:
+    return db.query(User).filter(User.id == user_id, User.is_active == True).first()
+
+def save_user(db: Session, user: User) -> User:
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+def store_password_hash(db: Session, user: User, password_hash: str):
+    user.password_hash = password_hash
+    db.commit()
+    db.refresh(user)
+    invalidate_principal(user.id)
+
 @app.post("/auth/register", response_model=UserResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: Session = Depends(get_db)):
     try:
         # Verifica se o usuário já existe
-        db_user = db.query(User).filter(User.email == user.email).first()
+        db_user = await run_in_threadpool(find_user_by_email, db, user.email)
         if db_user:
             raise HTTPException(status_code=400, detail="Email already registered")
         
         # Cria novo usuário
-        hashed_password = hash_password(user.password)
+        hashed_password = await hash_password_async(user.password)
         
         # Converte birth_date string para objeto date
         birth_date_obj = user.get_birth_date_as_date() if user.birth_date else None
@@ -421,22 +1372,25 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
             created_at=datetime.utcnow(),
             last_seen=datetime.utcnow()
         )
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        db_user = await run_in_threadpool(save_user, db, db_user)
+        user_name_index.add(db_user.id, db_user.first_name, db_user.last_name)
         
         return db_user
     except Exception as e:
         print(f"Erro no registro: {e}")
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
 
 @app.post("/auth/login", response_model=Token)
-def login(login_data: LoginRequest, db: Session = Depends(get_db)):
+async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
     try:
-        user = db.query(User).filter(User.email == login_data.email).first()
+        user = await run_in_threadpool(find_user_by_email, db, login_data.email)
+        
+        verified, new_hash = (False, None)
+        if user:
+            verified, new_hash = await verify_and_update_password_async(login_data.password, user.password_hash)
         
-        if not user or not verify_password(login_data.password, user.password_hash):
+        if not verified:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect username or password",
@@ -446,6 +1400,10 @@ def login(login_data: LoginRequest, db: Session = Depends(get_db)):
         if not user.is_active:
             raise HTTPException(status_code=400, detail="Inactive user")
         
+        # Refaz o hash com o custo atual quando BCRYPT_ROUNDS mudou
+        if new_hash:
+            await run_in_threadpool(store_password_hash, db, user, new_hash)
+        
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(
             data={"sub": user.email, "user_id": user.id}, expires_delta=access_token_expires
@@ -471,9 +1429,43 @@ def check_email_exists(email: str, db: Session = Depends(get_db)):
 async def verify_token(current_user: User = Depends(get_current_user)):
     return {"valid": True, "user": current_user}
 
+# Settings routes
+# Toda escrita no usuário chama invalidate_principal; o cache é por processo,
+# então os outros workers só veem a mudança depois de AUTH_CACHE_TTL_SECONDS.
+@app.put("/settings/profile")
+def update_profile(user_update: UserUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    for field, value in user_update.dict(exclude_unset=True).items():
+        setattr(current_user, field, value)
+
+    db.commit()
+    db.refresh(current_user)
+    invalidate_principal(current_user.id)
+    user_name_index.add(current_user.id, current_user.first_name, current_user.last_name)
+
+    return {"message": "Profile updated successfully"}
+
+@app.put("/settings/password")
+async def update_password(password_update: PasswordUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    if not await verify_password_async(password_update.current_password, current_user.password_hash):
+        raise HTTPException(status_code=400, detail="Current password is incorrect")
+
+    new_hash = await hash_password_async(password_update.new_password)
+    await run_in_threadpool(store_password_hash, db, current_user, new_hash)
+
+    return {"message": "Password updated successfully"}
+
+@app.delete("/settings/account")
+def deactivate_account(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    current_user.is_active = False
+    db.commit()
+    invalidate_principal(current_user.id)
+    user_name_index.remove(current_user.id)
+
+    return {"message": "Account deactivated successfully"}
+
 # Posts routes
 @app.post("/posts/", response_model=PostResponse)
-async def create_post(post: PostCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_post(post: PostCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Validação e processamento do conteúdo
     content_to_save = post.content
     
@@ -527,90 +1519,35 @@ async def create_post(post: PostCreate, current_user: User = Depends(get_current
     )
 
 @app.get("/posts/", response_model=List[PostResponse])
-async def get_posts(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    posts = db.query(Post).order_by(Post.created_at.desc()).limit(50).all()
-    
-    return [
-        PostResponse(
-            id=post.id,
-            author={
-                "id": post.author.id,
-                "first_name": post.author.first_name,
-                "last_name": post.author.last_name,
-                "avatar": None
-            },
-            content=post.content,
-            post_type=post.post_type,
-            media_type=post.media_type,
-            media_url=post.media_url,
-            created_at=post.created_at,
-            reactions_count=post.reactions_count,
-            comments_count=post.comments_count,
-            shares_count=post.shares_count
-        )
-        for post in posts
-    ]
+async def get_posts(response: Response, cursor: Optional[str] = None, limit: int = 50, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    posts, next_cursor = await run_read(db, load_post_page, cursor=cursor, limit=limit)
+    set_next_cursor(response, next_cursor)
+    return posts
 
 # User posts routes
 @app.get("/users/{user_id}/posts", response_model=List[PostResponse])
-async def get_user_posts(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    posts = db.query(Post).filter(
-        Post.author_id == user_id,
-        Post.post_type == "post"
-    ).order_by(Post.created_at.desc()).limit(50).all()
-    
-    return [
-        PostResponse(
-            id=post.id,
-            author={
-                "id": post.author.id,
-                "first_name": post.author.first_name,
-                "last_name": post.author.last_name,
-                "avatar": getattr(post.author, 'avatar', None)
-            },
-            content=post.content,
-            post_type=post.post_type,
-            media_type=post.media_type,
-            media_url=post.media_url,
-            created_at=post.created_at,
-            reactions_count=db.query(Reaction).filter(Reaction.post_id == post.id).count(),
-            comments_count=db.query(Comment).filter(Comment.post_id == post.id).count(),
-            shares_count=db.query(Share).filter(Share.post_id == post.id).count()
-        )
-        for post in posts
-    ]
+async def get_user_posts(user_id: int, response: Response, cursor: Optional[str] = None, limit: int = 50, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    posts, next_cursor = await run_read(db, load_post_page, Post.author_id == user_id, Post.post_type == "post", cursor=cursor, limit=limit)
+    set_next_cursor(response, next_cursor)
+    return posts
 
 @app.get("/users/{user_id}/testimonials", response_model=List[PostResponse])
-async def get_user_testimonials(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    testimonials = db.query(Post).filter(
-        Post.author_id == user_id,
-        Post.post_type == "testimonial"
-    ).order_by(Post.created_at.desc()).limit(50).all()
-    
-    return [
-        PostResponse(
-            id=post.id,
-            author={
-                "id": post.author.id,
-                "first_name": post.author.first_name,
-                "last_name": post.author.last_name,
-                "avatar": getattr(post.author, 'avatar', None)
-            },
-            content=post.content,
-            post_type=post.post_type,
-            media_type=post.media_type,
-            media_url=post.media_url,
-            created_at=post.created_at,
-            reactions_count=db.query(Reaction).filter(Reaction.post_id == post.id).count(),
-            comments_count=db.query(Comment).filter(Comment.post_id == post.id).count(),
-            shares_count=db.query(Share).filter(Share.post_id == post.id).count()
-        )
-        for post in testimonials
-    ]
+async def get_user_testimonials(user_id: int, response: Response, cursor: Optional[str] = None, limit: int = 50, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    testimonials, next_cursor = await run_read(db, load_post_page, Post.author_id == user_id, Post.post_type == "testimonial", cursor=cursor, limit=limit)
+    set_next_cursor(response, next_cursor)
+    return testimonials
 
 # Reactions routes
 @app.post("/reactions/")
 async def create_reaction(reaction: ReactionCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    message, notify = await run_in_threadpool(save_reaction, db, current_user, reaction)
+    if notify:
+        wake_notification_dispatcher()
+    
+    return {"message": message}
+
+def save_reaction(db: Session, current_user: User, reaction: ReactionCreate) -> Tuple[str, bool]:
+    """Cria, troca ou remove a reação; devolve (mensagem, se enfileirou notificação)"""
     # Check if post exists
     post = db.query(Post).filter(Post.id == reaction.post_id).first()
     if not post:
@@ -631,13 +1568,14 @@ async def create_reaction(reaction: ReactionCreate, current_user: User = Depends
         if existing_reaction.reaction_type == reaction.reaction_type:
             # Remove reaction if same type
             db.delete(existing_reaction)
+            bump_post_counter(db, reaction.post_id, "reactions_count", -1)
             db.commit()
-            return {"message": "Reaction removed"}
+            return "Reaction removed", False
         else:
             # Update reaction type
             existing_reaction.reaction_type = reaction.reaction_type
             db.commit()
-            return {"message": "Reaction updated"}
+            return "Reaction updated", False
     
     # Create new reaction
     db_reaction = Reaction(
@@ -646,65 +1584,48 @@ async def create_reaction(reaction: ReactionCreate, current_user: User = Depends
         reaction_type=reaction.reaction_type
     )
     db.add(db_reaction)
-    db.commit()
+    bump_post_counter(db, reaction.post_id, "reactions_count", 1)
     
     # Send notification to post author if not self-reaction
-    if post.author_id != current_user.id:
-        notification = Notification(
-            recipient_id=post.author_id,
-            sender_id=current_user.id,
-            notification_type="reaction",
-            title=f"{current_user.first_name} {current_user.last_name}",
-            message=f"reagiu ao seu post com {reaction.reaction_type}",
-            data=json.dumps({"post_id": reaction.post_id}),
-            created_at=datetime.utcnow()
-        )
-        db.add(notification)
-        db.commit()
-        
-        # Send real-time notification
-        await manager.send_notification(post.author_id, {
-            "id": notification.id,
-            "type": "reaction",
-            "title": f"{current_user.first_name} {current_user.last_name}",
-            "message": f"reagiu ao seu post com {reaction.reaction_type}",
-            "sender": {
-                "id": current_user.id,
-                "first_name": current_user.first_name,
-                "last_name": current_user.last_name,
-                "avatar": getattr(current_user, 'avatar', None)
-            },
-            "data": {"post_id": reaction.post_id},
-            "created_at": notification.created_at.isoformat()
-        })
-    
-    return {"message": "Reaction created"}
+    notify = post.author_id != current_user.id
+    if notify:
+        queue_notification(db, post.author_id, current_user, "reaction",
+                           f"reagiu ao seu post com {reaction.reaction_type}",
+                           {"post_id": reaction.post_id})
+    db.commit()
+    return "Reaction created", notify
 
 @app.get("/reactions/post/{post_id}")
-async def get_post_reactions(post_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    reactions = db.query(Reaction).filter(Reaction.post_id == post_id).all()
-    
+async def get_post_reactions(post_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    return await run_read(db, load_reaction_summary, post_id, current_user.id)
+
+def load_reaction_summary(db: Session, post_id: int, user_id: int) -> Dict[str, Any]:
     # Group reactions by type
-    reaction_counts = {}
-    user_reaction = None
+    reaction_counts = dict(db.query(Reaction.reaction_type, func.count(Reaction.id)).filter(
+        Reaction.post_id == post_id
+    ).group_by(Reaction.reaction_type).all())
     
-    for reaction in reactions:
-        if reaction.reaction_type not in reaction_counts:
-            reaction_counts[reaction.reaction_type] = 0
-        reaction_counts[reaction.reaction_type] += 1
-        
-        if reaction.user_id == current_user.id:
-            user_reaction = reaction.reaction_type
+    user_reaction = db.query(Reaction.reaction_type).filter(
+        Reaction.post_id == post_id,
+        Reaction.user_id == user_id
+    ).scalar()
     
     return {
         "reactions": reaction_counts,
         "user_reaction": user_reaction,
-        "total": len(reactions)
+        "total": sum(reaction_counts.values())
     }
 
 # Comments routes
 @app.post("/comments/", response_model=CommentResponse)
 async def create_comment(comment: CommentCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    response, notify = await run_in_threadpool(save_comment, db, current_user, comment)
+    if notify:
+        wake_notification_dispatcher()
+    
+    return response
+
+def save_comment(db: Session, current_user: User, comment: CommentCreate) -> Tuple[CommentResponse, bool]:
     # Check if post exists
     post = db.query(Post).filter(Post.id == comment.post_id).first()
     if not post:
@@ -717,38 +1638,16 @@ async def create_comment(comment: CommentCreate, current_user: User = Depends(ge
         author_id=current_user.id
     )
     db.add(db_comment)
-    db.commit()
-    db.refresh(db_comment)
+    bump_post_counter(db, comment.post_id, "comments_count", 1)
+    db.flush()
     
     # Send notification to post author
-    if post.author_id != current_user.id:
-        notification = Notification(
-            recipient_id=post.author_id,
-            sender_id=current_user.id,
-            notification_type="comment",
-            title=f"{current_user.first_name} {current_user.last_name}",
-            message="comentou no seu post",
-            data=json.dumps({"post_id": comment.post_id, "comment_id": db_comment.id}),
-            created_at=datetime.utcnow()
-        )
-        db.add(notification)
-        db.commit()
-        
-        # Send real-time notification
-        await manager.send_notification(post.author_id, {
-            "id": notification.id,
-            "type": "comment",
-            "title": f"{current_user.first_name} {current_user.last_name}",
-            "message": "comentou no seu post",
-            "sender": {
-                "id": current_user.id,
-                "first_name": current_user.first_name,
-                "last_name": current_user.last_name,
-                "avatar": getattr(current_user, 'avatar', None)
-            },
-            "data": {"post_id": comment.post_id, "comment_id": db_comment.id},
-            "created_at": notification.created_at.isoformat()
-        })
+    notify = post.author_id != current_user.id
+    if notify:
+        queue_notification(db, post.author_id, current_user, "comment", "comentou no seu post",
+                           {"post_id": comment.post_id, "comment_id": db_comment.id})
+    db.commit()
+    db.refresh(db_comment)
     
     return CommentResponse(
         id=db_comment.id,
@@ -762,48 +1661,110 @@ async def create_comment(comment: CommentCreate, current_user: User = Depends(ge
         created_at=db_comment.created_at,
         reactions_count=0,
         replies=[]
-    )
+    ), notify
 
 @app.get("/comments/post/{post_id}", response_model=List[CommentResponse])
-async def get_post_comments(post_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    comments = db.query(Comment).filter(Comment.post_id == post_id, Comment.parent_id.is_(None)).all()
-    
+async def get_post_comments(post_id: int, response: Response, cursor: Optional[str] = None, limit: int = 20, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    comments, next_cursor = await run_read(db, load_comment_page, post_id, cursor, limit)
+    set_next_cursor(response, next_cursor)
+    return comments
+
+@app.get("/comments/{comment_id}/replies", response_model=List[CommentResponse])
+async def get_comment_replies(comment_id: int, response: Response, cursor: Optional[str] = None, limit: int = 20, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    replies, next_cursor, remaining = await run_read(db, load_reply_page, comment_id, cursor, limit)
+    set_next_cursor(response, next_cursor)
+    response.headers["X-Remaining-Count"] = str(remaining)
+    return replies
+
+def serialize_comment(comment: Comment) -> CommentResponse:
+    return CommentResponse(
+        id=comment.id,
+        content=comment.content,
+        author=serialize_author(comment.author),
+        created_at=comment.created_at,
+        parent_id=comment.parent_id,
+        reactions_count=0,
+        replies=[]
+    )
+
+def load_threads(db: Session, root_ids: List[int], per_thread: int, after: Optional[str] = None) -> Dict[int, Tuple[List[Comment], int]]:
+    """Respostas (em qualquer profundidade) de cada raiz, da mais antiga à mais nova, numa única consulta.
+
+    Uma CTE recursiva percorre os fios e ROW_NUMBER limita a `per_thread` + 1
+    por raiz (a linha extra só indica que há mais). Devolve, por raiz, as
+    respostas e o total restante a partir de `after`.
+    """
+    thread = select(Comment.id.label("id"), Comment.id.label("root_id")).where(
+        Comment.id.in_(root_ids)
+    ).cte("thread", recursive=True)
+    child = aliased(Comment)
+    thread = thread.union_all(
+        select(child.id, thread.c.root_id).where(child.parent_id == thread.c.id)
+    )
+
+    ranked = select(
+        thread.c.id,
+        thread.c.root_id,
+        func.row_number().over(partition_by=thread.c.root_id, order_by=(Comment.created_at, Comment.id)).label("position"),
+        func.count().over(partition_by=thread.c.root_id).label("total")
+    ).join(Comment, Comment.id == thread.c.id).where(thread.c.id != thread.c.root_id)
+    if after:
+        ranked = ranked.where(tuple_(Comment.created_at, Comment.id) > tuple_(*decode_cursor(after)))
+    ranked = ranked.subquery()
+
+    rows = db.query(Comment, ranked.c.root_id, ranked.c.total).join(
+        ranked, ranked.c.id == Comment.id
+    ).options(joinedload(Comment.author)).filter(
+        ranked.c.position <= per_thread + 1
+    ).order_by(ranked.c.root_id, Comment.created_at, Comment.id).all()
+
+    threads: Dict[int, Tuple[List[Comment], int]] = {}
+    for comment, root_id, total in rows:
+        threads.setdefault(root_id, ([], total))[0].append(comment)
+    return threads
+
+def load_comment_page(db: Session, post_id: int, cursor: Optional[str], limit: int) -> Tuple[List[CommentResponse], Optional[str]]:
+    """Página de comentários de primeiro nível com até COMMENT_REPLIES_PER_THREAD respostas cada"""
+    query = db.query(Comment).options(joinedload(Comment.author)).filter(
+        Comment.post_id == post_id,
+        Comment.parent_id.is_(None)
+    )
+    roots, next_cursor = paginate_keyset(query, Comment, cursor, limit)
+    threads = load_threads(db, [root.id for root in roots], COMMENT_REPLIES_PER_THREAD) if roots else {}
+
     result = []
-    for comment in comments:
-        replies = db.query(Comment).filter(Comment.parent_id == comment.id).all()
-        result.append(CommentResponse(
-            id=comment.id,
-            content=comment.content,
-            author={
-                "id": comment.author.id,
-                "first_name": comment.author.first_name,
-                "last_name": comment.author.last_name,
-                "avatar": getattr(comment.author, 'avatar', None)
-            },
-            created_at=comment.created_at,
-            reactions_count=0,
-            replies=[
-                CommentResponse(
-                    id=reply.id,
-                    content=reply.content,
-                    author={
-                        "id": reply.author.id,
-                        "first_name": reply.author.first_name,
-                        "last_name": reply.author.last_name,
-                        "avatar": getattr(reply.author, 'avatar', None)
-                    },
-                    created_at=reply.created_at,
-                    reactions_count=0,
-                    replies=[]
-                ) for reply in replies
-            ]
-        ))
-    
-    return result
+    for root in roots:
+        node = serialize_comment(root)
+        replies, total = threads.get(root.id, ([], 0))
+        shown = replies[:COMMENT_REPLIES_PER_THREAD]
+        node.replies_count = total
+        if len(replies) > len(shown):
+            node.replies_cursor = encode_cursor(shown[-1].created_at, shown[-1].id)
+
+        # Respostas são mais novas que o pai, então o pai de cada uma já está na árvore
+        nodes = {root.id: node}
+        for reply in shown:
+            nodes[reply.id] = serialize_comment(reply)
+            parent = nodes.get(reply.parent_id, node)
+            parent.replies.append(nodes[reply.id])
+        result.append(node)
+    return result, next_cursor
+
+def load_reply_page(db: Session, comment_id: int, cursor: Optional[str], limit: int) -> Tuple[List[CommentResponse], Optional[str], int]:
+    """Próximas respostas de um fio em lista plana; `parent_id` diz onde encaixar cada uma.
+
+    Devolve também quantas ainda restam depois da página, contando respostas
+    criadas depois que o fio foi aberto.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    replies, total = load_threads(db, [comment_id], limit, after=cursor).get(comment_id, ([], 0))
+    shown = replies[:limit]
+    next_cursor = encode_cursor(shown[-1].created_at, shown[-1].id) if len(replies) > limit else None
+    return [serialize_comment(reply) for reply in shown], next_cursor, total - len(shown)
 
 # Shares routes
 @app.post("/shares/")
-async def share_post(share: ShareCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def share_post(share: ShareCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Check if post exists
     post = db.query(Post).filter(Post.id == share.post_id).first()
     if not post:
@@ -823,27 +1784,43 @@ async def share_post(share: ShareCreate, current_user: User = Depends(get_curren
         post_id=share.post_id
     )
     db.add(db_share)
+    bump_post_counter(db, share.post_id, "shares_count", 1)
     db.commit()
     
     return {"message": "Post shared successfully"}
 
 # Friendships routes
+def find_friendship(db: Session, user_id: int, other_id: int) -> Optional[Friendship]:
+    """Amizade entre os dois em qualquer direção, com uma busca indexada por direção"""
+    return db.query(Friendship).filter(
+        Friendship.requester_id == user_id, Friendship.addressee_id == other_id
+    ).first() or db.query(Friendship).filter(
+        Friendship.requester_id == other_id, Friendship.addressee_id == user_id
+    ).first()
+
 @app.post("/friendships/")
 async def send_friend_request(friendship: FriendshipCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Check if user exists
-    addressee = db.query(User).filter(User.id == friendship.addressee_id, User.is_active == True).first()
-    if not addressee:
-        raise HTTPException(status_code=404, detail="User not found")
-    
     # Can't send request to yourself
     if current_user.id == friendship.addressee_id:
         raise HTTPException(status_code=400, detail="Cannot send friend request to yourself")
     
+    graph = await ready_friend_graph()
+    if graph.are_friends(current_user.id, friendship.addressee_id):
+        raise HTTPException(status_code=400, detail="Already friends")
+    
+    await run_in_threadpool(save_friend_request, db, current_user, friendship.addressee_id)
+    wake_notification_dispatcher()
+    
+    return {"message": "Friend request sent successfully"}
+
+def save_friend_request(db: Session, current_user: User, addressee_id: int):
+    # Check if user exists
+    addressee = db.query(User.id).filter(User.id == addressee_id, User.is_active == True).first()
+    if not addressee:
+        raise HTTPException(status_code=404, detail="User not found")
+    
     # Check if friendship already exists
-    existing_friendship = db.query(Friendship).filter(
-        ((Friendship.requester_id == current_user.id) & (Friendship.addressee_id == friendship.addressee_id)) |
-        ((Friendship.requester_id == friendship.addressee_id) & (Friendship.addressee_id == current_user.id))
-    ).first()
+    existing_friendship = find_friendship(db, current_user.id, addressee_id)
     
     if existing_friendship:
         if existing_friendship.status == "pending":
@@ -854,45 +1831,25 @@ async def send_friend_request(friendship: FriendshipCreate, current_user: User =
     # Create friendship request
     db_friendship = Friendship(
         requester_id=current_user.id,
-        addressee_id=friendship.addressee_id,
+        addressee_id=addressee_id,
         status="pending"
     )
     db.add(db_friendship)
-    db.commit()
+    db.flush()
     
     # Send notification
-    notification = Notification(
-        recipient_id=friendship.addressee_id,
-        sender_id=current_user.id,
-        notification_type="friend_request",
-        title=f"{current_user.first_name} {current_user.last_name}",
-        message="enviou uma solicitação de amizade",
-        data=json.dumps({"friendship_id": db_friendship.id}),
-        created_at=datetime.utcnow()
-    )
-    db.add(notification)
+    queue_notification(db, addressee_id, current_user, "friend_request",
+                       "enviou uma solicitação de amizade", {"friendship_id": db_friendship.id})
     db.commit()
-    
-    # Send real-time notification
-    await manager.send_notification(friendship.addressee_id, {
-        "id": notification.id,
-        "type": "friend_request",
-        "title": f"{current_user.first_name} {current_user.last_name}",
-        "message": "enviou uma solicitação de amizade",
-        "sender": {
-            "id": current_user.id,
-            "first_name": current_user.first_name,
-            "last_name": current_user.last_name,
-            "avatar": getattr(current_user, 'avatar', None)
-        },
-        "data": {"friendship_id": db_friendship.id},
-        "created_at": notification.created_at.isoformat()
-    })
-    
-    return {"message": "Friend request sent successfully"}
 
 @app.put("/friendships/{friendship_id}/accept")
 async def accept_friend_request(friendship_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    await run_in_threadpool(accept_friendship, db, current_user, friendship_id)
+    wake_notification_dispatcher()
+    
+    return {"message": "Friend request accepted"}
+
+def accept_friendship(db: Session, current_user: User, friendship_id: int):
     friendship = db.query(Friendship).filter(Friendship.id == friendship_id).first()
     if not friendship:
         raise HTTPException(status_code=404, detail="Friend request not found")
@@ -905,41 +1862,15 @@ async def accept_friend_request(friendship_id: int, current_user: User = Depends
     
     friendship.status = "accepted"
     friendship.updated_at = datetime.utcnow()
-    db.commit()
     
     # Send notification to requester
-    notification = Notification(
-        recipient_id=friendship.requester_id,
-        sender_id=current_user.id,
-        notification_type="friend_accept",
-        title=f"{current_user.first_name} {current_user.last_name}",
-        message="aceitou sua solicitação de amizade",
-        data=json.dumps({"friendship_id": friendship_id}),
-        created_at=datetime.utcnow()
-    )
-    db.add(notification)
+    queue_notification(db, friendship.requester_id, current_user, "friend_accept",
+                       "aceitou sua solicitação de amizade", {"friendship_id": friendship_id})
     db.commit()
-    
-    # Send real-time notification
-    await manager.send_notification(friendship.requester_id, {
-        "id": notification.id,
-        "type": "friend_accept",
-        "title": f"{current_user.first_name} {current_user.last_name}",
-        "message": "aceitou sua solicitação de amizade",
-        "sender": {
-            "id": current_user.id,
-            "first_name": current_user.first_name,
-            "last_name": current_user.last_name,
-            "avatar": getattr(current_user, 'avatar', None)
-        },
-        "data": {"friendship_id": friendship_id},
-        "created_at": notification.created_at.isoformat()
-    })
-    
-    return {"message": "Friend request accepted"}
+    friend_graph.add(friendship.requester_id, friendship.addressee_id)
 
 @app.put("/friendships/{friendship_id}/reject")
-async def reject_friend_request(friendship_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def reject_friend_request(friendship_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     friendship = db.query(Friendship).filter(Friendship.id == friendship_id).first()
     if not friendship:
         raise HTTPException(status_code=404, detail="Friend request not found")
@@ -953,15 +1884,31 @@ async def reject_friend_request(friendship_id: int, current_user: User = Depends
     friendship.status = "rejected"
     friendship.updated_at = datetime.utcnow()
     db.commit()
+    friend_graph.remove(friendship.requester_id, friendship.addressee_id)
     
     return {"message": "Friend request rejected"}
 
+@app.delete("/friendships/{friendship_id}")
+def delete_friendship(friendship_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Desfaz a amizade ou cancela o pedido, por qualquer um dos dois"""
+    friendship = db.query(Friendship).filter(Friendship.id == friendship_id).first()
+    if not friendship or current_user.id not in (friendship.requester_id, friendship.addressee_id):
+        raise HTTPException(status_code=404, detail="Friendship not found")
+    
+    requester_id, addressee_id = friendship.requester_id, friendship.addressee_id
+    db.delete(friendship)
+    db.commit()
+    friend_graph.remove(requester_id, addressee_id)
+    
+    return {"message": "Friendship removed"}
+
 @app.get("/friendships/status/{user_id}")
-async def get_friendship_status(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    friendship = db.query(Friendship).filter(
-        ((Friendship.requester_id == current_user.id) & (Friendship.addressee_id == user_id)) |
-        ((Friendship.requester_id == user_id) & (Friendship.addressee_id == current_user.id))
-    ).first()
+async def get_friendship_status(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    graph = await ready_friend_graph()
+    if graph.are_friends(current_user.id, user_id):
+        return {"status": "accepted"}
+    
+    friendship = await run_read(db, find_friendship, current_user.id, user_id)
     
     if not friendship:
         return {"status": "none"}
@@ -970,33 +1917,82 @@ async def get_friendship_status(user_id: int, current_user: User = Depends(get_c
 
 # User search
 @app.get("/users/")
-async def search_users(search: str = "", current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def search_users(search: str = "", current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
     if not search.strip():
         return []
+    graph = await ready_friend_graph()
+    return await run_read(db, load_user_search, search.strip(), current_user.id, graph)
+
+def load_user_search(db: Session, search: str, viewer_id: int, graph: Optional[FriendGraph] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    # E-mail só por igualdade (índice único); nomes pelo índice full-text
+    if "@" in search:
+        hits = [(user_id, False, 0) for (user_id,) in db.query(User.id).filter(
+            User.email == search, User.is_active == True, User.id != viewer_id
+        )]
+    else:
+        hits = search_user_ids(db, search, viewer_id, limit, graph)
+    users = {user.id: user for user in db.query(User).filter(User.id.in_([hit[0] for hit in hits]))} if hits else {}
     
-    users = db.query(User).filter(
-        User.is_active == True,
-        User.id != current_user.id,
-        (User.first_name.ilike(f"%{search}%") | User.last_name.ilike(f"%{search}%") | User.email.ilike(f"%{search}%"))
-    ).limit(20).all()
+    return [
+        {
+            "id": user_id,
+            "first_name": users[user_id].first_name,
+            "last_name": users[user_id].last_name,
+            "email": users[user_id].email,
+            "avatar": getattr(users[user_id], 'avatar', None),
+            "is_friend": is_friend,
+            "mutual_friends": mutual_friends
+        }
+        for user_id, is_friend, mutual_friends in hits if user_id in users
+    ]
+
+# Type-ahead: só memória, sem banco
+@app.get("/users/suggest")
+async def suggest_users(q: str = "", limit: int = 8, current_user: User = Depends(get_current_user)):
+    limit = max(1, min(limit, TYPEAHEAD_MAX_LIMIT))
+    return user_name_index.suggest(q, limit, exclude=current_user.id)
+
+# Pessoas que você talvez conheça (pré-calculadas)
+@app.get("/users/suggestions")
+async def get_friend_suggestions(limit: int = 10, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    graph = await ready_friend_graph()
+    return await run_read(db, load_friend_suggestions, graph, current_user.id, max(1, min(limit, FRIEND_SUGGESTIONS_TOP_K)))
+
+def load_friend_suggestions(db: Session, graph: FriendGraph, user_id: int, limit: int) -> List[Dict[str, Any]]:
+    rows = db.query(FriendSuggestion, User).join(User, User.id == FriendSuggestion.suggested_id).filter(
+        FriendSuggestion.user_id == user_id, User.is_active == True
+    ).order_by(FriendSuggestion.rank).limit(FRIEND_SUGGESTIONS_TOP_K).all()
+    if not rows:
+        return []
+    
+    # Descarta quem virou amigo ou recebeu/enviou pedido depois do último cálculo
+    candidate_ids = [suggestion.suggested_id for suggestion, _ in rows]
+    requested = {addressee_id for (addressee_id,) in db.query(Friendship.addressee_id).filter(
+        Friendship.requester_id == user_id, Friendship.addressee_id.in_(candidate_ids)
+    )} | {requester_id for (requester_id,) in db.query(Friendship.requester_id).filter(
+        Friendship.addressee_id == user_id, Friendship.requester_id.in_(candidate_ids)
+    )}
     
     return [
         {
             "id": user.id,
             "first_name": user.first_name,
             "last_name": user.last_name,
-            "email": user.email,
-            "avatar": getattr(user, 'avatar', None)
+            "avatar": getattr(user, 'avatar', None),
+            "mutual_friends": suggestion.mutual_friends,
+            "followed_by_friends": suggestion.followed_by_friends
         }
-        for user in users
-    ]
+        for suggestion, user in rows
+        if user.id not in requested and not graph.are_friends(user_id, user.id)
+    ][:limit]
 
 # Get user by ID
 @app.get("/users/{user_id}")
-async def get_user_by_id(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id, User.is_active == True).first()
+async def get_user_by_id(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    user = await run_read(db, find_active_user, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    graph = await ready_friend_graph()
     
     return {
         "id": user.id,
@@ -1006,39 +2002,64 @@ async def get_user_by_id(user_id: int, current_user: User = Depends(get_current_
         "bio": getattr(user, 'bio', None),
         "avatar": getattr(user, 'avatar', None),
         "birth_date": user.birth_date.isoformat() if user.birth_date else None,
-        "created_at": user.created_at.isoformat()
+        "created_at": user.created_at.isoformat(),
+        "friends_count": graph.friend_count(user.id),
+        "is_friend": graph.are_friends(current_user.id, user.id),
+        "mutual_friends_count": graph.mutual_count(current_user.id, user.id) if user.id != current_user.id else 0
     }
 
 # Mark all notifications as read
 @app.put("/notifications/mark-all-read")
 async def mark_all_notifications_as_read(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    db.query(Notification).filter(
-        Notification.recipient_id == current_user.id,
-        Notification.is_read == False
-    ).update({"is_read": True})
-    db.commit()
+    count = await run_in_threadpool(mark_notifications_read, db, current_user.id)
+    if count is not None:
+        await push_unread_count(current_user.id, count)
     
     return {"message": "All notifications marked as read"}
 
+def mark_notifications_read(db: Session, recipient_id: int, *criteria) -> Optional[int]:
+    """Marca como lidas e devolve o novo contador, ou None se nada mudou"""
+    # O UPDATE condicional garante um único decremento mesmo com chamadas concorrentes
+    marked = db.query(Notification).filter(
+        Notification.recipient_id == recipient_id,
+        Notification.is_read == False,
+        *criteria
+    ).update({"is_read": True}, synchronize_session=False)
+    bump_unread_count(db, recipient_id, -marked)
+    db.commit()
+    return read_unread_count(db, recipient_id) if marked else None
+
 # Delete notification
 @app.delete("/notifications/{notification_id}")
 async def delete_notification(notification_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    count = await run_in_threadpool(remove_notification, db, current_user.id, notification_id)
+    if count is not None:
+        await push_unread_count(current_user.id, count)
+    
+    return {"message": "Notification deleted"}
+
+def remove_notification(db: Session, recipient_id: int, notification_id: int) -> Optional[int]:
+    """Apaga a notificação; devolve o novo contador se ela ainda não tinha sido lida"""
     notification = db.query(Notification).filter(
         Notification.id == notification_id,
-        Notification.recipient_id == current_user.id
+        Notification.recipient_id == recipient_id
     ).first()
     
     if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
     
+    was_unread = not notification.is_read
+    db.query(NotificationOutbox).filter(NotificationOutbox.notification_id == notification.id).delete(synchronize_session=False)
+    db.query(NotificationActor).filter(NotificationActor.notification_id == notification.id).delete(synchronize_session=False)
     db.delete(notification)
+    if was_unread:
+        bump_unread_count(db, recipient_id, -1)
     db.commit()
-    
-    return {"message": "Notification deleted"}
+    return read_unread_count(db, recipient_id) if was_unread else None
 
 # Delete post
 @app.delete("/posts/{post_id}")
-async def delete_post(post_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def delete_post(post_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     post = db.query(Post).filter(Post.id == post_id).first()
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
@@ -1058,7 +2079,7 @@ async def delete_post(post_id: int, current_user: User = Depends(get_current_use
 
 # Stories routes
 @app.post("/stories/", response_model=StoryResponse)
-async def create_story(story: StoryCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_story(story: StoryCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     expires_at = datetime.utcnow() + timedelta(hours=story.duration_hours)
     
     db_story = Story(
@@ -1074,76 +2095,53 @@ async def create_story(story: StoryCreate, current_user: User = Depends(get_curr
     db.commit()
     db.refresh(db_story)
     
-    return StoryResponse(
-        id=db_story.id,
-        author={
-            "id": db_story.author.id,
-            "first_name": db_story.author.first_name,
-            "last_name": db_story.author.last_name,
-            "avatar": None
-        },
-        content=db_story.content,
-        media_type=db_story.media_type,
-        media_url=db_story.media_url,
-        background_color=db_story.background_color,
-        created_at=db_story.created_at,
-        expires_at=db_story.expires_at,
-        views_count=0
-    )
+    serialized = serialize_story(db_story, 0)
+    story_index.add(serialized)
+    return StoryResponse(**serialized)
 
 @app.get("/stories/", response_model=List[StoryResponse])
-async def get_stories(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Get stories that haven't expired
-    now = datetime.utcnow()
-    stories = db.query(Story).filter(Story.expires_at > now).order_by(Story.created_at.desc()).all()
-    
-    return [
-        StoryResponse(
-            id=story.id,
-            author={
-                "id": story.author.id,
-                "first_name": story.author.first_name,
-                "last_name": story.author.last_name,
-                "avatar": None
-            },
-            content=story.content,
-            media_type=story.media_type,
-            media_url=story.media_url,
-            background_color=story.background_color,
-            created_at=story.created_at,
-            expires_at=story.expires_at,
-            views_count=db.query(StoryView).filter(StoryView.story_id == story.id).count()
-        )
-        for story in stories
-    ]
+async def get_stories(current_user: User = Depends(get_current_user)):
+    # Servido do conjunto em memória; o sweeper mantém ele atualizado
+    if story_index.loaded_at is None:
+        await asyncio.to_thread(refresh_story_index)
+    return [StoryResponse(**story) for story in story_index.active(datetime.utcnow())]
+
+@app.get("/stories/tray", response_model=List[StoryTrayResponse])
+async def get_story_tray(current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    if story_index.loaded_at is None:
+        await asyncio.to_thread(refresh_story_index)
+    version = story_index.version
+    cached = story_tray_cache.get(current_user.id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    
+    tray = await run_read(db, build_story_tray, current_user.id, story_index.active(datetime.utcnow()))
+    story_tray_cache.set(current_user.id, (version, tray))
+    return tray
 
 @app.post("/stories/{story_id}/view")
-async def view_story(story_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    story = db.query(Story).filter(Story.id == story_id).first()
-    if not story:
+async def view_story(story_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    now = datetime.utcnow()
+    # Quase sempre o story está no conjunto ativo; o banco só cobre os de outros workers ainda não carregados
+    story = story_index.get(story_id)
+    expires_at = story["expires_at"] if story else await run_read(db, story_expiry, story_id)
+    if expires_at is None:
         raise HTTPException(status_code=404, detail="Story not found")
     
-    if story.expires_at <= datetime.utcnow():
+    if expires_at <= now:
         raise HTTPException(status_code=410, detail="Story has expired")
     
-    # Check if already viewed
-    existing_view = db.query(StoryView).filter(
-        StoryView.story_id == story_id,
-        StoryView.viewer_id == current_user.id
-    ).first()
-    
-    if not existing_view:
-        db_view = StoryView(
-            story_id=story_id,
-            viewer_id=current_user.id
-        )
-        db.add(db_view)
-        db.commit()
+    # Gravada em lote pelo run_story_view_flusher; repetições já morrem no buffer
+    if story_view_buffer.add(story_id, current_user.id, now) and len(story_view_buffer) >= STORY_VIEW_FLUSH_SIZE:
+        story_view_wakeup.set()
     
     return {"message": "Story viewed"}
 
+def story_expiry(db: Session, story_id: int) -> Optional[datetime]:
+    return db.query(Story.expires_at).filter(Story.id == story_id).scalar()
+
 @app.delete("/stories/{story_id}")
-async def delete_story(story_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def delete_story(story_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     story = db.query(Story).filter(Story.id == story_id).first()
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
@@ -1157,15 +2155,22 @@ async def delete_story(story_id: int, current_user: User = Depends(get_current_u
     # Delete the story
     db.delete(story)
     db.commit()
+    story_index.remove(story_id)
     
     return {"message": "Story deleted successfully"}
 
 # Notifications routes
 @app.get("/notifications/", response_model=List[NotificationResponse])
-async def get_notifications(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    notifications = db.query(Notification).filter(
-        Notification.recipient_id == current_user.id
-    ).order_by(Notification.created_at.desc()).limit(50).all()
+async def get_notifications(response: Response, cursor: Optional[str] = None, limit: int = 50, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    notifications, next_cursor = await run_read(db, load_notification_page, current_user.id, cursor, limit)
+    set_next_cursor(response, next_cursor)
+    return notifications
+
+def load_notification_page(db: Session, recipient_id: int, cursor: Optional[str], limit: int) -> Tuple[List[NotificationResponse], Optional[str]]:
+    query = db.query(Notification).options(joinedload(Notification.sender)).filter(
+        Notification.recipient_id == recipient_id
+    )
+    notifications, next_cursor = paginate_keyset(query, Notification, cursor, limit)
     
     return [
         NotificationResponse(
@@ -1176,41 +2181,43 @@ async def get_notifications(current_user: User = Depends(get_current_user), db:
             data=notification.data,
             is_read=notification.is_read,
             created_at=notification.created_at,
+            actor_count=notification.actor_count,
             sender={
                 "id": notification.sender.id,
                 "name": f"{notification.sender.first_name} {notification.sender.last_name}"
             } if notification.sender else None
         )
         for notification in notifications
-    ]
+    ], next_cursor
 
 @app.get("/notifications/unread-count")
-async def get_unread_notifications_count(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    count = db.query(Notification).filter(
-        Notification.recipient_id == current_user.id,
-        Notification.is_read == False
-    ).count()
+async def get_unread_notifications_count(current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    count = await run_read(db, read_unread_count, current_user.id)
     
     return {"count": count}
 
 @app.put("/notifications/{notification_id}/read")
 async def mark_notification_as_read(notification_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    notification = db.query(Notification).filter(
+    count = await run_in_threadpool(mark_one_notification_read, db, current_user.id, notification_id)
+    if count is not None:
+        await push_unread_count(current_user.id, count)
+    
+    return {"message": "Notification marked as read"}
+
+def mark_one_notification_read(db: Session, recipient_id: int, notification_id: int) -> Optional[int]:
+    notification = db.query(Notification.id).filter(
         Notification.id == notification_id,
-        Notification.recipient_id == current_user.id
+        Notification.recipient_id == recipient_id
     ).first()
     
     if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
     
-    notification.is_read = True
-    db.commit()
-    
-    return {"message": "Notification marked as read"}
+    return mark_notifications_read(db, recipient_id, Notification.id == notification_id)
 
 # Friendships routes
 @app.get("/friendships/pending-count")
-async def get_pending_friendships_count(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_pending_friendships_count(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     count = db.query(Friendship).filter(
         Friendship.addressee_id == current_user.id,
         Friendship.status == "pending"
@@ -1219,7 +2226,7 @@ async def get_pending_friendships_count(current_user: User = Depends(get_current
     return {"count": count}
 
 @app.get("/friendships/pending")
-async def get_pending_friendships(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_pending_friendships(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     friendships = db.query(Friendship).filter(
         Friendship.addressee_id == current_user.id,
         Friendship.status == "pending"
@@ -1239,6 +2246,335 @@ async def get_pending_friendships(current_user: User = Depends(get_current_user)
         for friendship in friendships
     ]
 
+# Messages routes
+def conversation_pair(user_id: int, other_id: int) -> Tuple[int, int]:
+    return (user_id, other_id) if user_id < other_id else (other_id, user_id)
+
+def find_conversation(db: Session, user_id: int, other_id: int) -> Optional[Conversation]:
+    user1_id, user2_id = conversation_pair(user_id, other_id)
+    return db.query(Conversation).filter(
+        Conversation.user1_id == user1_id, Conversation.user2_id == user2_id
+    ).first()
+
+def get_or_create_conversation(db: Session, user_id: int, other_id: int) -> Conversation:
+    # ON CONFLICT evita a corrida de dois envios simultâneos criando o mesmo par
+    user1_id, user2_id = conversation_pair(user_id, other_id)
+    now = datetime.utcnow()
+    db.execute(insert_ignoring_conflicts(Conversation.__table__).values(
+        user1_id=user1_id, user2_id=user2_id, user1_unread_count=0, user2_unread_count=0,
+        created_at=now, updated_at=now
+    ))
+    return find_conversation(db, user_id, other_id)
+
+def unread_column(conversation: Conversation, user_id: int):
+    """Contador de não lidas do participante `user_id`"""
+    return Conversation.user1_unread_count if conversation.user1_id == user_id else Conversation.user2_unread_count
+
+@app.post("/messages/", response_model=MessageResponse)
+async def send_message(message: MessageCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    if current_user.id == message.receiver_id:
+        raise HTTPException(status_code=400, detail="Cannot send message to yourself")
+    
+    db_message = await run_in_threadpool(store_message, db, current_user.id, message)
+    manager.typing.clear(current_user.id, message.receiver_id)
+    await push_message(db_message)
+    
+    return db_message
+
+def store_message(db: Session, sender_id: int, message: MessageCreate) -> Message:
+    receiver = db.query(User.id).filter(User.id == message.receiver_id, User.is_active == True).first()
+    if not receiver:
+        raise HTTPException(status_code=404, detail="Receiver not found")
+    
+    conversation = get_or_create_conversation(db, sender_id, message.receiver_id)
+    db_message = Message(
+        conversation_id=conversation.id,
+        sender_id=sender_id,
+        receiver_id=message.receiver_id,
+        content=message.content,
+        message_type=message.message_type,
+        media_url=message.media_url,
+        created_at=datetime.utcnow()
+    )
+    db.add(db_message)
+    db.flush()
+    # Soma no banco, não no objeto: envios concorrentes não se sobrescrevem
+    db.query(Conversation).filter(Conversation.id == conversation.id).update({
+        Conversation.last_message_id: db_message.id,
+        Conversation.updated_at: db_message.created_at,
+        unread_column(conversation, message.receiver_id): unread_column(conversation, message.receiver_id) + 1
+    }, synchronize_session=False)
+    db.commit()
+    db.refresh(db_message)
+    return db_message
+
+@app.get("/messages/inbox", response_model=List[InboxConversationResponse])
+async def get_inbox(response: Response, cursor: Optional[str] = None, limit: int = 20, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    conversations, next_cursor = await run_read(db, load_inbox_page, current_user.id, cursor, limit)
+    set_next_cursor(response, next_cursor)
+    return conversations
+
+def load_inbox_page(db: Session, user_id: int, cursor: Optional[str], limit: int) -> Tuple[List[InboxConversationResponse], Optional[str]]:
+    """Conversas por atividade recente, com par, última mensagem e não lidas numa só consulta.
+
+    Cada lado do par (user1/user2) é um SELECT com índice próprio unidos por
+    UNION ALL, no lugar de um OR que obrigaria a varrer `conversations`.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    sides = []
+    for own, peer, unread in (
+        (Conversation.user1_id, Conversation.user2_id, Conversation.user1_unread_count),
+        (Conversation.user2_id, Conversation.user1_id, Conversation.user2_unread_count),
+    ):
+        side = select(
+            Conversation.id.label("id"),
+            peer.label("peer_id"),
+            unread.label("unread_count"),
+            Conversation.last_message_id.label("last_message_id"),
+            Conversation.updated_at.label("updated_at")
+        ).where(own == user_id, Conversation.last_message_id.isnot(None))
+        if cursor:
+            side = side.where(tuple_(Conversation.updated_at, Conversation.id) < tuple_(*decode_cursor(cursor)))
+        sides.append(side.order_by(Conversation.updated_at.desc(), Conversation.id.desc()).limit(limit + 1).subquery())
+    inbox = select(*sides[0].c).union_all(select(*sides[1].c)).subquery()
+    
+    rows = db.execute(
+        select(
+            inbox.c.id, inbox.c.unread_count, inbox.c.updated_at,
+            User.id, User.first_name, User.last_name,
+            Message.id, Message.sender_id, func.substr(Message.content, 1, INBOX_SNIPPET_LENGTH),
+            Message.message_type, Message.is_read, Message.created_at
+        )
+        .join(User, User.id == inbox.c.peer_id)
+        .outerjoin(Message, Message.id == inbox.c.last_message_id)
+        .order_by(inbox.c.updated_at.desc(), inbox.c.id.desc())
+        .limit(limit + 1)
+    ).all()
+    
+    next_cursor = encode_cursor(rows[limit - 1][2], rows[limit - 1][0]) if len(rows) > limit else None
+    return [
+        InboxConversationResponse(
+            id=conversation_id,
+            peer={"id": peer_id, "first_name": first_name, "last_name": last_name, "avatar": None},
+            last_message={
+                "id": message_id,
+                "sender_id": sender_id,
+                "snippet": snippet,
+                "message_type": message_type,
+                "is_read": is_read,
+                "created_at": created_at
+            } if message_id else None,
+            unread_count=unread_count,
+            updated_at=updated_at
+        )
+        for (conversation_id, unread_count, updated_at, peer_id, first_name, last_name,
+             message_id, sender_id, snippet, message_type, is_read, created_at) in rows[:limit]
+    ], next_cursor
+
+@app.get("/messages/conversation/{user_id}", response_model=List[MessageResponse])
+async def get_conversation(user_id: int, response: Response, cursor: Optional[str] = None, since: Optional[str] = None, limit: int = 50, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    messages, next_cursor, sync_cursor = await run_read(db, load_message_page, current_user.id, user_id, cursor, since, limit)
+    set_next_cursor(response, next_cursor)
+    if sync_cursor:
+        response.headers["X-Sync-Cursor"] = sync_cursor
+    return messages
+
+def load_message_page(db: Session, user_id: int, other_id: int, cursor: Optional[str], since: Optional[str], limit: int) -> Tuple[List[MessageResponse], Optional[str], Optional[str]]:
+    """Histórico do mais novo para o mais antigo ou, com `since`, só o que chegou depois.
+
+    Em modo `since` as mensagens vêm em ordem de chegada, no máximo `limit`;
+    X-Sync-Cursor aponta para a mais nova entregue e é o `since` da próxima
+    sincronização. Menos de `limit` mensagens significa que o cliente está em dia.
+    """
+    conversation = find_conversation(db, user_id, other_id)
+    if conversation is None:
+        return [], None, since
+    query = db.query(Message).filter(Message.conversation_id == conversation.id)
+    
+    if since:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        messages = query.filter(
+            tuple_(Message.created_at, Message.id) > tuple_(*decode_cursor(since))
+        ).order_by(Message.created_at, Message.id).limit(limit).all()
+        sync_cursor = encode_cursor(messages[-1].created_at, messages[-1].id) if messages else since
+        return [MessageResponse.model_validate(message) for message in messages], None, sync_cursor
+    
+    messages, next_cursor = paginate_keyset(query, Message, cursor, limit)
+    # A primeira página já entrega o ponto de partida da sincronização
+    sync_cursor = encode_cursor(messages[0].created_at, messages[0].id) if messages and not cursor else None
+    return [MessageResponse.model_validate(message) for message in messages], next_cursor, sync_cursor
+
+@app.put("/messages/conversation/{user_id}/read")
+async def mark_conversation_as_read(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    conversation_id, peer_id, marked = await run_in_threadpool(read_conversation, db, current_user.id, user_id)
+    if not conversation_id:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    if marked:
+        await push_receipt("read", conversation_id, current_user.id, peer_id, marked)
+    
+    return {"message": "Conversation marked as read", "marked": len(marked)}
+
+@app.put("/messages/{message_id}/read")
+async def mark_message_as_read(message_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    conversation_id, peer_id, marked = await run_in_threadpool(read_messages_by_id, db, current_user.id, [message_id])
+    if not conversation_id:
+        raise HTTPException(status_code=404, detail="Message not found")
+    
+    if marked:
+        await push_receipt("read", conversation_id, current_user.id, peer_id, marked)
+    
+    return {"message": "Message marked as read"}
+
+def mark_messages_read(db: Session, conversation: Conversation, reader_id: int, *criteria) -> List[int]:
+    """Marca como lidas as mensagens recebidas por `reader_id`, desconta do contador dele e devolve os ids"""
+    marked = [message_id for (message_id,) in db.query(Message.id).filter(
+        Message.conversation_id == conversation.id,
+        Message.receiver_id == reader_id,
+        Message.is_read == False,
+        *criteria
+    )]
+    if marked:
+        now = datetime.utcnow()
+        db.query(Message).filter(Message.id.in_(marked)).update(
+            {Message.is_read: True, Message.delivered_at: func.coalesce(Message.delivered_at, now)},
+            synchronize_session=False
+        )
+        unread = unread_column(conversation, reader_id)
+        db.query(Conversation).filter(Conversation.id == conversation.id).update(
+            {unread: case((unread > len(marked), unread - len(marked)), else_=0)},
+            synchronize_session=False
+        )
+    return marked
+
+def mark_messages_delivered(db: Session, reader_id: int, message_ids: List[int]) -> List[Tuple[int, int, int]]:
+    """Registra a entrega das mensagens ainda não confirmadas; devolve (id, sender_id, conversation_id)"""
+    delivered = db.query(Message.id, Message.sender_id, Message.conversation_id).filter(
+        Message.id.in_(message_ids),
+        Message.receiver_id == reader_id,
+        Message.delivered_at.is_(None)
+    ).all()
+    if delivered:
+        db.query(Message).filter(Message.id.in_([row[0] for row in delivered])).update(
+            {Message.delivered_at: datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+    return delivered
+
+# Versões para o socket e as rotas: devolvem (conversation_id, id do par, ids marcados)
+# e não o objeto, que expira no commit e não pode ser lido fora da sessão
+def read_messages_by_id(db: Session, reader_id: int, message_ids: List[int]) -> Tuple[int, int, List[int]]:
+    conversation_id = db.query(Message.conversation_id).filter(
+        Message.id.in_(message_ids), Message.receiver_id == reader_id
+    ).limit(1).scalar()
+    if conversation_id is None:
+        return 0, 0, []
+    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    receipt = (conversation.id, conversation_peer(conversation, reader_id))
+    marked = mark_messages_read(db, conversation, reader_id, Message.id.in_(message_ids))
+    db.commit()
+    return receipt[0], receipt[1], marked
+
+def read_conversation(db: Session, reader_id: int, peer_id: int) -> Tuple[int, int, List[int]]:
+    conversation = find_conversation(db, reader_id, peer_id)
+    if conversation is None:
+        return 0, 0, []
+    conversation_id = conversation.id
+    marked = mark_messages_read(db, conversation, reader_id)
+    db.commit()
+    return conversation_id, peer_id, marked
+
+# Realtime chat
+#
+# Servidor -> cliente:
+#   {"type": "message", "message": {...}}               nova mensagem (destinatário e outras abas de quem enviou)
+#   {"type": "receipt", "status": "delivered"|"read", "conversation_id", "user_id", "message_ids"}
+#   {"type": "typing", "user_id", "is_typing", "expires_in"}
+#   {"type": "pong"} / {"type": "error", "detail"}
+# Cliente -> servidor:
+#   {"type": "delivered", "message_ids": [...]}
+#   {"type": "read", "message_ids": [...]} ou {"type": "read", "user_id": <par>}
+#   {"type": "typing", "to": <usuário>, "is_typing": true|false}
+#   {"type": "ping"}
+def conversation_peer(conversation: Conversation, user_id: int) -> int:
+    return conversation.user2_id if conversation.user1_id == user_id else conversation.user1_id
+
+async def push_message(message: Message):
+    frame = json.dumps({
+        "type": "message",
+        "message": MessageResponse.model_validate(message).model_dump(mode="json")
+    })
+    await manager.send_personal_message(frame, message.receiver_id)
+    await manager.send_personal_message(frame, message.sender_id)
+
+async def push_receipt(status: str, conversation_id: int, reader_id: int, sender_id: int, message_ids: List[int]):
+    await manager.send_personal_message(json.dumps({
+        "type": "receipt",
+        "status": status,
+        "conversation_id": conversation_id,
+        "user_id": reader_id,
+        "message_ids": message_ids
+    }), sender_id)
+
+def frame_ids(frame: Dict[str, Any]) -> List[int]:
+    ids = frame.get("message_ids")
+    if not isinstance(ids, list):
+        raise ValueError("message_ids must be a list")
+    return [int(message_id) for message_id in ids[:MAX_PAGE_SIZE]]
+
+def in_session(fn, *args):
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+async def relay_typing(user_id: int, frame: Dict[str, Any]):
+    receiver_id = int(frame["to"])
+    is_typing = bool(frame.get("is_typing", True))
+    if receiver_id == user_id or not manager.typing.should_forward(user_id, receiver_id, is_typing, time.monotonic()):
+        return
+    # Só para quem já conversa; a checagem roda no máximo uma vez por intervalo
+    if is_typing and await asyncio.to_thread(in_session, find_conversation, user_id, receiver_id) is None:
+        return
+    await manager.send_personal_message(json.dumps({
+        "type": "typing",
+        "user_id": user_id,
+        "is_typing": is_typing,
+        "expires_in": TYPING_TTL_SECONDS
+    }), receiver_id)
+
+async def handle_client_frame(websocket: WebSocket, user_id: int, raw: str):
+    try:
+        frame = json.loads(raw)
+        kind = frame.get("type") if isinstance(frame, dict) else None
+        if kind == "ping":
+            manager.reply(websocket, user_id, json.dumps({"type": "pong"}))
+        elif kind == "typing":
+            await relay_typing(user_id, frame)
+        elif kind == "delivered":
+            delivered = await asyncio.to_thread(in_session, mark_messages_delivered, user_id, frame_ids(frame))
+            grouped: Dict[Tuple[int, int], List[int]] = {}
+            for message_id, sender_id, conversation_id in delivered:
+                grouped.setdefault((conversation_id, sender_id), []).append(message_id)
+            for (conversation_id, sender_id), message_ids in grouped.items():
+                await push_receipt("delivered", conversation_id, user_id, sender_id, message_ids)
+        elif kind == "read":
+            if "user_id" in frame:
+                conversation_id, peer_id, marked = await asyncio.to_thread(in_session, read_conversation, user_id, int(frame["user_id"]))
+            else:
+                conversation_id, peer_id, marked = await asyncio.to_thread(in_session, read_messages_by_id, user_id, frame_ids(frame))
+            if marked:
+                await push_receipt("read", conversation_id, user_id, peer_id, marked)
+        else:
+            manager.reply(websocket, user_id, json.dumps({"type": "error", "detail": "Unknown frame type"}))
+    except (ValueError, TypeError, KeyError):
+        manager.reply(websocket, user_id, json.dumps({"type": "error", "detail": "Invalid frame"}))
+    except Exception as e:
+        # Falha de banco não derruba o socket
+        print(f"❌ Erro ao tratar frame de {user_id}: {e}")
+        manager.reply(websocket, user_id, json.dumps({"type": "error", "detail": "Internal error"}))
+
 # WebSocket endpoint
 @app.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: int):
@@ -1251,7 +2587,7 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
         return
     
     # Verify token
-    user = verify_websocket_token(token)
+    user = await asyncio.to_thread(verify_websocket_token, token)
     if not user or user.id != user_id:
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
@@ -1260,9 +2596,11 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
     try:
         while True:
             data = await websocket.receive_text()
-            # Echo message back for testing
-            await manager.send_personal_message(f"Echo: {data}", user_id)
-    except WebSocketDisconnect:
+            await handle_client_frame(websocket, user_id, data)
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: o socket já foi fechado pelo servidor (cliente lento)
+        pass
+    finally:
         manager.disconnect(websocket, user_id)
 
 # Health check
@@ -1270,8 +2608,25 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics")
+def get_metrics():
+    return {
+        "auth_token_cache": token_cache.stats(),
+        "auth_principal_cache": principal_cache.stats(),
+        "websockets": manager.stats(),
+        "notification_outbox": outbox_stats,
+        "notification_retention": retention_report,
+        "stories": story_index.stats(),
+        "story_tray_cache": story_tray_cache.stats(),
+        "story_view_buffer": story_view_buffer.stats(),
+        "typeahead": user_name_index.stats(),
+        "friend_graph": friend_graph.stats(),
+        "friend_suggestions": friend_suggestions_report
+    }
+
 # Create tables
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 # Função para inicializar o banco com dados de exemplo
 def init_sample_data():
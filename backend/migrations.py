@@ -0,0 +1,394 @@
+"""Migrações versionadas do schema.
+
+`Base.metadata.create_all` só cria tabelas que ainda não existem, então
+colunas e índices novos nunca chegam em bancos antigos (como o vibe.db).
+Cada migração aqui roda uma única vez, dentro de uma transação, e fica
+registrada em `schema_migrations`. Todas checam tabelas e colunas antes de
+alterar qualquer coisa, porque bancos antigos nem sempre têm o schema atual.
+
+Uso manual:
+    python migrations.py            # aplica migrações pendentes
+    python migrations.py --check    # valida os planos das consultas quentes
+"""
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+import os
+import re
+import sys
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+
+def table_columns(conn: Connection, table: str) -> List[str]:
+    inspector = inspect(conn)
+    if not inspector.has_table(table):
+        return []
+    return [column["name"] for column in inspector.get_columns(table)]
+
+
+def add_column(conn: Connection, table: str, column: str, ddl: str) -> bool:
+    columns = table_columns(conn, table)
+    if not columns or column in columns:
+        return False
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return True
+
+
+def create_index(conn: Connection, name: str, table: str, columns: Tuple[str, ...], unique: bool = False):
+    existing = table_columns(conn, table)
+    if not existing or any(column not in existing for column in columns):
+        print(f"⚠️ Índice {name} ignorado: {table}({', '.join(columns)}) não existe")
+        return
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    conn.execute(text(f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+
+# Migrations
+def add_post_counters(conn: Connection):
+    added = [
+        column for column in ("reactions_count", "comments_count", "shares_count")
+        if add_column(conn, "posts", column, "INTEGER DEFAULT 0")
+    ]
+    add_column(conn, "stories", "views_count", "INTEGER DEFAULT 0")
+
+    # Preenche os contadores recém-criados a partir das tabelas de origem
+    sources = {"reactions_count": "reactions", "comments_count": "comments", "shares_count": "shares"}
+    for column in added:
+        source = sources[column]
+        if table_columns(conn, source):
+            conn.execute(text(
+                f"UPDATE posts SET {column} = "
+                f"(SELECT COUNT(*) FROM {source} WHERE {source}.post_id = posts.id)"
+            ))
+
+
+HOT_PATH_INDEXES = [
+    ("ix_posts_created_at_id", "posts", ("created_at", "id")),
+    ("ix_posts_author_type_created_at_id", "posts", ("author_id", "post_type", "created_at", "id")),
+    ("ix_reactions_post_id_user_id", "reactions", ("post_id", "user_id")),
+    ("ix_comments_post_id_parent_id", "comments", ("post_id", "parent_id")),
+    ("ix_comments_parent_id", "comments", ("parent_id",)),
+    ("ix_shares_post_id_user_id", "shares", ("post_id", "user_id")),
+    ("ix_notifications_recipient_created_at_id", "notifications", ("recipient_id", "created_at", "id")),
+    ("ix_notifications_recipient_is_read", "notifications", ("recipient_id", "is_read")),
+    ("ix_story_views_story_id_viewer_id", "story_views", ("story_id", "viewer_id")),
+    ("ix_stories_expires_at", "stories", ("expires_at",)),
+    ("ix_friendships_addressee_status", "friendships", ("addressee_id", "status")),
+    ("ix_friendships_requester_status", "friendships", ("requester_id", "status")),
+    ("ix_messages_sender_receiver_created_at", "messages", ("sender_id", "receiver_id", "created_at")),
+    ("ix_messages_receiver_sender_created_at", "messages", ("receiver_id", "sender_id", "created_at")),
+]
+
+
+def add_hot_path_indexes(conn: Connection):
+    for name, table, columns in HOT_PATH_INDEXES:
+        create_index(conn, name, table, columns)
+
+
+def add_notification_coalescing(conn: Connection):
+    add_column(conn, "notifications", "group_key", "VARCHAR(100)")
+    add_column(conn, "notifications", "actor_count", "INTEGER NOT NULL DEFAULT 1")
+    create_index(conn, "ix_notifications_recipient_group_created_at", "notifications",
+                 ("recipient_id", "group_key", "created_at"))
+
+
+def add_unread_notifications_count(conn: Connection):
+    if not add_column(conn, "users", "unread_notifications_count", "INTEGER NOT NULL DEFAULT 0"):
+        return
+    if table_columns(conn, "notifications"):
+        conn.execute(text(
+            "UPDATE users SET unread_notifications_count = "
+            "(SELECT COUNT(*) FROM notifications "
+            "WHERE notifications.recipient_id = users.id AND notifications.is_read = 0)"
+        ))
+
+
+def add_unique_story_views(conn: Connection):
+    if not table_columns(conn, "story_views"):
+        return
+    # Remove repetições antigas antes do índice único, mantendo a primeira
+    conn.execute(text(
+        "DELETE FROM story_views WHERE id NOT IN "
+        "(SELECT MIN(id) FROM story_views GROUP BY story_id, viewer_id)"
+    ))
+    conn.execute(text("DROP INDEX IF EXISTS ix_story_views_story_id_viewer_id"))
+    create_index(conn, "ux_story_views_story_id_viewer_id", "story_views", ("story_id", "viewer_id"), unique=True)
+    if "views_count" in table_columns(conn, "stories"):
+        conn.execute(text(
+            "UPDATE stories SET views_count = "
+            "(SELECT COUNT(*) FROM story_views WHERE story_views.story_id = stories.id)"
+        ))
+
+
+def add_comment_thread_index(conn: Connection):
+    create_index(conn, "ix_comments_post_parent_created_at_id", "comments",
+                 ("post_id", "parent_id", "created_at", "id"))
+
+
+def add_user_search_index(conn: Connection):
+    # FTS5 é exclusivo do SQLite; em outros bancos a busca usa prefixo com LIKE
+    if conn.dialect.name != "sqlite" or not table_columns(conn, "users"):
+        return
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+        "first_name, last_name, content='users', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN "
+        "INSERT INTO users_fts(rowid, first_name, last_name) VALUES (new.id, new.first_name, new.last_name); "
+        "END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN "
+        "INSERT INTO users_fts(users_fts, rowid, first_name, last_name) VALUES ('delete', old.id, old.first_name, old.last_name); "
+        "END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF first_name, last_name ON users BEGIN "
+        "INSERT INTO users_fts(users_fts, rowid, first_name, last_name) VALUES ('delete', old.id, old.first_name, old.last_name); "
+        "INSERT INTO users_fts(rowid, first_name, last_name) VALUES (new.id, new.first_name, new.last_name); "
+        "END"
+    ))
+    # Indexa os usuários que já existem
+    conn.execute(text("INSERT INTO users_fts(users_fts) VALUES ('rebuild')"))
+
+
+def add_message_conversations(conn: Connection):
+    """Liga cada mensagem à conversa do par, com o par sempre em ordem"""
+    if not table_columns(conn, "messages") or not table_columns(conn, "conversations"):
+        return
+    add_column(conn, "messages", "conversation_id", "INTEGER REFERENCES conversations(id)")
+    low = "CASE WHEN sender_id < receiver_id THEN sender_id ELSE receiver_id END"
+    high = "CASE WHEN sender_id < receiver_id THEN receiver_id ELSE sender_id END"
+
+    # Conversas antigas podiam ter o par invertido; só a forma ordenada fica
+    conn.execute(text(
+        "UPDATE conversations SET user1_id = user2_id, user2_id = user1_id "
+        "WHERE user1_id > user2_id AND NOT EXISTS (SELECT 1 FROM conversations c "
+        "WHERE c.user1_id = conversations.user2_id AND c.user2_id = conversations.user1_id)"
+    ))
+    conn.execute(text("DELETE FROM conversations WHERE user1_id > user2_id"))
+    conn.execute(text(
+        f"INSERT INTO conversations (user1_id, user2_id, created_at, updated_at) "
+        f"SELECT {low}, {high}, MIN(created_at), MAX(created_at) FROM messages "
+        f"WHERE sender_id IS NOT NULL AND receiver_id IS NOT NULL AND NOT EXISTS ("
+        f"SELECT 1 FROM conversations c WHERE c.user1_id = {low} AND c.user2_id = {high}) "
+        f"GROUP BY {low}, {high}"
+    ))
+    conn.execute(text(
+        f"UPDATE messages SET conversation_id = (SELECT c.id FROM conversations c "
+        f"WHERE c.user1_id = {low} AND c.user2_id = {high}) WHERE conversation_id IS NULL"
+    ))
+    conn.execute(text(
+        "UPDATE conversations SET last_message_id = (SELECT id FROM messages "
+        "WHERE messages.conversation_id = conversations.id ORDER BY created_at DESC, id DESC LIMIT 1)"
+    ))
+    create_index(conn, "ix_messages_conversation_created_at_id", "messages",
+                 ("conversation_id", "created_at", "id"))
+
+
+def add_conversation_unread_counts(conn: Connection):
+    if not table_columns(conn, "conversations"):
+        return
+    added = [
+        column for column in ("user1_unread_count", "user2_unread_count")
+        if add_column(conn, "conversations", column, "INTEGER NOT NULL DEFAULT 0")
+    ]
+    # Preenche a partir das mensagens não lidas recebidas por cada lado
+    participants = {"user1_unread_count": "user1_id", "user2_unread_count": "user2_id"}
+    if "conversation_id" in table_columns(conn, "messages"):
+        for column in added:
+            conn.execute(text(
+                f"UPDATE conversations SET {column} = (SELECT COUNT(*) FROM messages "
+                f"WHERE messages.conversation_id = conversations.id "
+                f"AND messages.receiver_id = conversations.{participants[column]} AND messages.is_read = 0)"
+            ))
+    create_index(conn, "ix_conversations_user1_updated_at_id", "conversations", ("user1_id", "updated_at", "id"))
+    create_index(conn, "ix_conversations_user2_updated_at_id", "conversations", ("user2_id", "updated_at", "id"))
+
+
+def add_message_delivered_at(conn: Connection):
+    if add_column(conn, "messages", "delivered_at", "DATETIME"):
+        # Mensagens já lidas certamente foram entregues
+        conn.execute(text("UPDATE messages SET delivered_at = created_at WHERE is_read = 1"))
+
+
+def add_outbox_claim_index(conn: Connection):
+    create_index(conn, "ix_notification_outbox_claimed_by", "notification_outbox", ("claimed_by",))
+
+
+def add_notification_actors(conn: Connection):
+    if not table_columns(conn, "notification_actors") or not table_columns(conn, "notifications"):
+        return
+    # Grupos já existentes começam com o último remetente conhecido
+    conn.execute(text(
+        "INSERT INTO notification_actors (notification_id, user_id) "
+        "SELECT id, sender_id FROM notifications n WHERE group_key IS NOT NULL AND sender_id IS NOT NULL "
+        "AND NOT EXISTS (SELECT 1 FROM notification_actors a "
+        "WHERE a.notification_id = n.id AND a.user_id = n.sender_id)"
+    ))
+
+
+def add_outbox_notification_index(conn: Connection):
+    create_index(conn, "ix_notification_outbox_notification_id", "notification_outbox", ("notification_id",))
+
+
+def add_notification_group_started_at(conn: Connection):
+    if add_column(conn, "notifications", "group_started_at", "DATETIME"):
+        # Sem o primeiro evento gravado, o último é o melhor palpite para grupos já abertos
+        conn.execute(text("UPDATE notifications SET group_started_at = created_at WHERE group_key IS NOT NULL"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_notifications_recipient_group_created_at"))
+    create_index(conn, "ix_notifications_recipient_group_started_at", "notifications",
+                 ("recipient_id", "group_key", "group_started_at"))
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "add_post_counters", add_post_counters),
+    (2, "add_hot_path_indexes", add_hot_path_indexes),
+    (3, "add_notification_coalescing", add_notification_coalescing),
+    (4, "add_unread_notifications_count", add_unread_notifications_count),
+    (5, "add_unique_story_views", add_unique_story_views),
+    (6, "add_comment_thread_index", add_comment_thread_index),
+    (7, "add_user_search_index", add_user_search_index),
+    (8, "add_message_conversations", add_message_conversations),
+    (9, "add_conversation_unread_counts", add_conversation_unread_counts),
+    (10, "add_message_delivered_at", add_message_delivered_at),
+    (11, "add_outbox_claim_index", add_outbox_claim_index),
+    (12, "add_notification_actors", add_notification_actors),
+    (13, "add_outbox_notification_index", add_outbox_notification_index),
+    (14, "add_notification_group_started_at", add_notification_group_started_at),
+]
+
+
+def applied_versions(conn: Connection) -> Dict[int, str]:
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at DATETIME NOT NULL)"
+    ))
+    rows = conn.execute(text("SELECT version, name FROM schema_migrations")).fetchall()
+    return {version: name for version, name in rows}
+
+
+def run_migrations(engine: Engine) -> List[str]:
+    """Aplica as migrações pendentes em ordem e retorna os nomes aplicados"""
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+                {"version": version, "name": name, "applied_at": datetime.utcnow()}
+            )
+        print(f"✅ Migração {version:03d} aplicada: {name}")
+        applied.append(name)
+    return applied
+
+
+# Query plan guard
+HOT_QUERIES = {
+    "feed": "SELECT id FROM posts ORDER BY created_at DESC, id DESC LIMIT 50",
+    "feed_page": (
+        "SELECT id FROM posts WHERE (created_at, id) < ('2000-01-01', 1) "
+        "ORDER BY created_at DESC, id DESC LIMIT 51"
+    ),
+    "profile_posts": (
+        "SELECT id FROM posts WHERE author_id = 1 AND post_type = 'post' "
+        "ORDER BY created_at DESC, id DESC LIMIT 50"
+    ),
+    "post_reactions": "SELECT COUNT(*) FROM reactions WHERE post_id = 1",
+    "user_reaction": "SELECT id FROM reactions WHERE user_id = 1 AND post_id = 1",
+    "post_comments": "SELECT id FROM comments WHERE post_id = 1 AND parent_id IS NULL",
+    "comment_replies": "SELECT id FROM comments WHERE parent_id = 1",
+    "user_share": "SELECT id FROM shares WHERE user_id = 1 AND post_id = 1",
+    "notifications_page": (
+        "SELECT id FROM notifications WHERE recipient_id = 1 "
+        "ORDER BY created_at DESC, id DESC LIMIT 50"
+    ),
+    "story_view": "SELECT id FROM story_views WHERE story_id = 1 AND viewer_id = 1",
+    "active_stories": "SELECT id FROM stories WHERE expires_at > '2000-01-01'",
+    "pending_friendships": "SELECT id FROM friendships WHERE addressee_id = 1 AND status = 'pending'",
+    # Cada lado usa o próprio índice; a ordenação final é só das 2 x 21 linhas
+    "inbox": (
+        "SELECT * FROM (SELECT id, updated_at FROM conversations WHERE user1_id = 1 "
+        "AND last_message_id IS NOT NULL ORDER BY updated_at DESC, id DESC LIMIT 21) "
+        "UNION ALL SELECT * FROM (SELECT id, updated_at FROM conversations WHERE user2_id = 1 "
+        "AND last_message_id IS NOT NULL ORDER BY updated_at DESC, id DESC LIMIT 21) "
+        "ORDER BY 2 DESC, 1 DESC LIMIT 21"
+    ),
+    "outbox_due": (
+        "SELECT id FROM notification_outbox WHERE available_at <= '2000-01-01' "
+        "ORDER BY available_at, id LIMIT 100"
+    ),
+    "outbox_claimed": "SELECT id FROM notification_outbox WHERE claimed_by = 'x' ORDER BY id",
+    "outbox_notification": "SELECT id FROM notification_outbox WHERE notification_id = 1",
+    "notification_actor": "SELECT id FROM notification_actors WHERE notification_id = 1 AND user_id = 1",
+    "friend_suggestions": "SELECT id FROM friend_suggestions WHERE user_id = 1 ORDER BY rank LIMIT 50",
+    "conversation_history": (
+        "SELECT id FROM messages WHERE conversation_id = 1 "
+        "ORDER BY created_at DESC, id DESC LIMIT 50"
+    ),
+}
+
+
+def plan_problems(plan: List[Tuple[int, int, str]]) -> List[str]:
+    """Linhas do plano que indicam varredura completa ou ordenação em memória.
+
+    `plan` são as linhas (id, pai, detalhe) do EXPLAIN QUERY PLAN. Ler uma
+    subconsulta ("SCAN (subquery-1)") não varre tabela: ela já veio limitada
+    pelo próprio índice, e ordenar só esse resultado também é aceitável.
+    """
+    subquery_scans = {
+        parent for _, parent, detail in plan
+        if detail.startswith("SCAN (") or detail.startswith("SCAN SUBQUERY")
+    }
+    return [
+        detail for _, parent, detail in plan
+        if (detail.startswith("SCAN ") and " USING " not in detail and not detail.startswith(("SCAN (", "SCAN SUBQUERY")))
+        or ("TEMP B-TREE" in detail and parent not in subquery_scans)
+    ]
+
+
+def check_query_plans(engine: Engine) -> Dict[str, List[str]]:
+    """Roda EXPLAIN QUERY PLAN nas consultas quentes (apenas SQLite).
+
+    Retorna {nome: linhas problemáticas} para as consultas que caíram em
+    full scan; um dicionário vazio significa que todas usam índice.
+    """
+    if engine.dialect.name != "sqlite":
+        return {}
+
+    problems = {}
+    with engine.connect() as conn:
+        tables = set(inspect(conn).get_table_names())
+        for name, sql in HOT_QUERIES.items():
+            if any(table not in tables for table in re.findall(r"FROM (\w+)", sql)):
+                continue
+            plan = [(row[0], row[1], row[-1]) for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+            bad = plan_problems(plan)
+            if bad:
+                problems[name] = bad
+    return problems
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    database_url = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+    engine = create_engine(database_url)
+    run_migrations(engine)
+
+    if "--check" in sys.argv:
+        problems = check_query_plans(engine)
+        for name, details in problems.items():
+            print(f"❌ {name}: {'; '.join(details)}")
+        if problems:
+            sys.exit(1)
+        print("✅ Todas as consultas quentes usam índices")
@@ -0,0 +1,154 @@
+"""Retenção de notificações lidas.
+
+Notificações não lidas nunca são tocadas. Das lidas, são removidas as mais
+velhas que NOTIFICATION_RETENTION_DAYS e as que passam das
+NOTIFICATION_RETENTION_KEEP_LAST mais recentes de cada usuário. O trabalho
+é feito em lotes de NOTIFICATION_RETENTION_BATCH_SIZE, com no máximo
+NOTIFICATION_RETENTION_MAX_BATCHES lotes por passada; o que sobrar fica para
+a próxima.
+
+Com NOTIFICATION_ARCHIVE_DIR definido cada lote vira um segmento NDJSON
+compactado (gzip) antes de ser apagado. O segmento é gravado e renomeado
+antes do DELETE, então uma queda no meio deixa no máximo linhas duplicadas
+no arquivo, nunca perdidas.
+
+Uso avulso (a partir de backend/):
+    python notification_retention.py
+"""
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+import gzip
+import json
+import os
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))
+NOTIFICATION_RETENTION_KEEP_LAST = int(os.getenv("NOTIFICATION_RETENTION_KEEP_LAST", "500"))
+NOTIFICATION_RETENTION_BATCH_SIZE = int(os.getenv("NOTIFICATION_RETENTION_BATCH_SIZE", "1000"))
+NOTIFICATION_RETENTION_MAX_BATCHES = int(os.getenv("NOTIFICATION_RETENTION_MAX_BATCHES", "50"))
+NOTIFICATION_RETENTION_INTERVAL_SECONDS = int(os.getenv("NOTIFICATION_RETENTION_INTERVAL_SECONDS", "3600"))
+NOTIFICATION_ARCHIVE_DIR = os.getenv("NOTIFICATION_ARCHIVE_DIR", "")
+
+
+def serialize_row(row) -> Dict[str, Any]:
+    record = {}
+    for column in row.__table__.columns:
+        value = getattr(row, column.key)
+        record[column.key] = value.isoformat() if isinstance(value, (datetime, date)) else value
+    return record
+
+
+def write_segment(archive_dir: str, rows: List[Any]) -> str:
+    """Grava as linhas num segmento .ndjson.gz e devolve o caminho"""
+    os.makedirs(archive_dir, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(archive_dir, f"notifications-{stamp}-{rows[0].id}-{rows[-1].id}.ndjson.gz")
+    partial = path + ".partial"
+    with gzip.open(partial, "wt", encoding="utf-8") as segment:
+        for row in rows:
+            segment.write(json.dumps(serialize_row(row), ensure_ascii=False) + "\n")
+    os.replace(partial, path)
+    return path
+
+
+def expired_ids(db: Session, model, prunable, cutoff: datetime, limit: int) -> List[int]:
+    return [row_id for (row_id,) in db.query(model.id).filter(
+        prunable, model.created_at < cutoff
+    ).order_by(model.id).limit(limit)]
+
+
+def overflow_ids(db: Session, model, prunable, keep_last: int, limit: int) -> List[int]:
+    """Lidas além das `keep_last` mais recentes, usuário a usuário"""
+    over_limit = db.query(model.recipient_id).filter(prunable).group_by(
+        model.recipient_id
+    ).having(func.count(model.id) > keep_last).limit(limit)
+
+    ids: List[int] = []
+    for (recipient_id,) in over_limit:
+        ids.extend(row_id for (row_id,) in db.query(model.id).filter(
+            prunable, model.recipient_id == recipient_id
+        ).order_by(model.created_at.desc(), model.id.desc()).offset(keep_last).limit(limit - len(ids)))
+        if len(ids) >= limit:
+            break
+    return ids
+
+
+def prune_batch(db: Session, model, ids: List[int], archive_dir: str, actor_model=None) -> Optional[str]:
+    segment = None
+    if archive_dir:
+        rows = db.query(model).filter(model.id.in_(ids)).order_by(model.id).all()
+        segment = write_segment(archive_dir, rows)
+    if actor_model is not None:
+        db.query(actor_model).filter(actor_model.notification_id.in_(ids)).delete(synchronize_session=False)
+    db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+    db.commit()
+    return segment
+
+
+def run_retention(
+    db: Session,
+    model,
+    outbox_model,
+    actor_model=None,
+    max_age_days: int = NOTIFICATION_RETENTION_DAYS,
+    keep_last: int = NOTIFICATION_RETENTION_KEEP_LAST,
+    batch_size: int = NOTIFICATION_RETENTION_BATCH_SIZE,
+    max_batches: int = NOTIFICATION_RETENTION_MAX_BATCHES,
+    archive_dir: str = NOTIFICATION_ARCHIVE_DIR,
+    progress: Callable[[str], None] = print,
+) -> Dict[str, Any]:
+    """Executa uma passada limitada das políticas e devolve o relatório"""
+    started = time.monotonic()
+    report: Dict[str, Any] = {
+        "started_at": datetime.utcnow().isoformat(),
+        "deleted": {"max_age": 0, "keep_last": 0},
+        "archived": 0,
+        "segments": [],
+        "batches": 0,
+        "complete": True,
+    }
+    # Só lidas, e nunca com push ainda pendente no outbox
+    prunable = (model.is_read == True) & model.id.not_in(select(outbox_model.notification_id))
+
+    policies = []
+    if max_age_days > 0:
+        cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+        policies.append(("max_age", lambda limit: expired_ids(db, model, prunable, cutoff, limit)))
+    if keep_last > 0:
+        policies.append(("keep_last", lambda limit: overflow_ids(db, model, prunable, keep_last, limit)))
+
+    for policy, next_ids in policies:
+        while True:
+            if report["batches"] >= max_batches:
+                report["complete"] = False
+                break
+            ids = next_ids(batch_size)
+            if not ids:
+                break
+            segment = prune_batch(db, model, ids, archive_dir, actor_model)
+            report["batches"] += 1
+            report["deleted"][policy] += len(ids)
+            if segment:
+                report["archived"] += len(ids)
+                report["segments"].append(segment)
+            progress(f"🧹 Retenção ({policy}): lote {report['batches']}, {len(ids)} notificações removidas")
+
+    report["elapsed_seconds"] = round(time.monotonic() - started, 3)
+    return report
+
+
+if __name__ == "__main__":
+    from main import Notification, NotificationActor, NotificationOutbox, SessionLocal
+
+    session = SessionLocal()
+    try:
+        while True:
+            result = run_retention(session, Notification, NotificationOutbox, NotificationActor)
+            print(json.dumps(result, indent=2))
+            if result["complete"]:
+                break
+    finally:
+        session.close()
@@ -0,0 +1,91 @@
+"""Hash de senhas com bcrypt fora do event loop.
+
+O bcrypt é deliberadamente lento, então cada hash/verificação roda num
+executor dedicado e limitado (pool de processos por padrão, para escalar
+com o número de núcleos em vez de disputar o GIL). Este módulo não importa
+`main` de propósito: os processos do pool só precisam dele e do passlib.
+
+O pool é criado no startup e usa `forkserver` (ou `spawn` onde não houver):
+um `fork` direto do servidor, que já tem threads do aiosqlite, do
+`to_thread` e das tasks de fundo, pode herdar locks presos e travar os
+processos filhos.
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+import asyncio
+import multiprocessing
+import os
+
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_EXECUTOR = os.getenv("HASH_EXECUTOR", "process")  # process, thread
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(HASH_WORKERS * 4)))
+
+# min/max iguais ao custo configurado fazem o passlib marcar para rehash
+# qualquer hash gerado com outro custo
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verifica a senha e devolve um novo hash se o custo do atual estiver desatualizado"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+_executor: Optional[Executor] = None
+_slots: Optional[asyncio.Semaphore] = None
+
+
+def get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if HASH_EXECUTOR == "thread":
+            _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+        else:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context(start_method))
+    return _executor
+
+
+def shutdown_executor():
+    global _executor, _slots
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+    _slots = None
+
+
+async def run_hashing(fn, *args):
+    """Executa `fn` no executor de hash, com no máximo HASH_MAX_PENDING chamadas em voo"""
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(HASH_MAX_PENDING)
+    async with _slots:
+        return await asyncio.get_running_loop().run_in_executor(get_executor(), fn, *args)
+
+
+async def hash_password_async(password: str) -> str:
+    return await run_hashing(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await run_hashing(verify_password, plain_password, hashed_password)
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await run_hashing(verify_and_update_password, plain_password, hashed_password)
@@ -0,0 +1,364 @@
+"""Backplane de pub/sub para entrega em tempo real entre workers.
+
+Com vários workers do uvicorn cada processo só conhece os próprios sockets.
+O ConnectionManager publica toda mensagem no canal do destinatário
+(`vibe:user:<id>`) ou em `vibe:broadcast`, e cada worker assina apenas os
+canais dos usuários conectados nele, então a mensagem chega em quem segura
+o socket.
+
+Backends (REALTIME_BUS_URL):
+    memory://                   entrega no próprio processo (padrão)
+    redis://[:senha@]host:porta Redis ou qualquer servidor que fale RESP
+    unix:///caminho/bus.sock    idem, via Unix socket
+
+Para desenvolvimento e testes existe um servidor RESP mínimo que só entende
+pub/sub:
+    python realtime_bus.py unix:///tmp/vibe-bus.sock
+"""
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+from urllib.parse import urlparse
+import asyncio
+import os
+import sys
+
+REALTIME_BUS_URL = os.getenv("REALTIME_BUS_URL", "memory://")
+REALTIME_BUS_PREFIX = os.getenv("REALTIME_BUS_PREFIX", "vibe")
+BROADCAST_CHANNEL = f"{REALTIME_BUS_PREFIX}:broadcast"
+
+MessageHandler = Callable[[str, str], Awaitable[None]]
+
+
+def user_channel(user_id: int) -> str:
+    return f"{REALTIME_BUS_PREFIX}:user:{user_id}"
+
+
+def channel_user_id(channel: str) -> Optional[int]:
+    prefix = f"{REALTIME_BUS_PREFIX}:user:"
+    if not channel.startswith(prefix):
+        return None
+    return int(channel[len(prefix):])
+
+
+class MessageBus(ABC):
+    name = "base"
+
+    def __init__(self):
+        self.handler: Optional[MessageHandler] = None
+        self.channels: Set[str] = set()
+        self.published = 0
+        self.received = 0
+
+    async def start(self, handler: MessageHandler):
+        self.handler = handler
+
+    async def stop(self):
+        pass
+
+    async def subscribe(self, channel: str):
+        self.channels.add(channel)
+
+    async def unsubscribe(self, channel: str):
+        self.channels.discard(channel)
+
+    @abstractmethod
+    async def publish(self, channel: str, message: str) -> bool:
+        """True se a mensagem chegou ao backplane; False se só os sockets locais a receberam"""
+        ...
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "subscribed_channels": len(self.channels),
+            "published": self.published,
+            "received": self.received
+        }
+
+
+class InProcessBus(MessageBus):
+    """Entrega direta no processo atual; equivale a não ter backplane"""
+    name = "memory"
+
+    async def publish(self, channel: str, message: str) -> bool:
+        self.published += 1
+        if channel in self.channels and self.handler is not None:
+            self.received += 1
+            await self.handler(channel, message)
+        return True
+
+
+# RESP (protocolo do Redis)
+def encode_bulk(value: str) -> bytes:
+    data = value.encode()
+    return f"${len(data)}\r\n".encode() + data + b"\r\n"
+
+
+def encode_command(*args: str) -> bytes:
+    return f"*{len(args)}\r\n".encode() + b"".join(encode_bulk(arg) for arg in args)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Conexão do backplane encerrada")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode()
+    if kind == b"-":
+        raise ConnectionError(payload.decode())
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        size = int(payload)
+        if size < 0:
+            return None
+        data = await reader.readexactly(size + 2)
+        return data[:-2].decode()
+    if kind == b"*":
+        size = int(payload)
+        if size < 0:
+            return None
+        return [await read_reply(reader) for _ in range(size)]
+    raise ConnectionError(f"Resposta RESP inválida: {line!r}")
+
+
+async def open_resp_connection(url: str):
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        reader, writer = await asyncio.open_unix_connection(parsed.path)
+    else:
+        reader, writer = await asyncio.open_connection(parsed.hostname or "127.0.0.1", parsed.port or 6379)
+    if parsed.password:
+        writer.write(encode_command("AUTH", parsed.password))
+        await writer.drain()
+        await read_reply(reader)
+    return reader, writer
+
+
+class RespBus(MessageBus):
+    """Backplane sobre qualquer servidor RESP (Redis, KeyDB ou o stand-in local).
+
+    Os PUBLISH vão em pipeline por uma conexão só: quem publica enfileira o
+    comando, uma task escreve tudo o que estiver na fila de uma vez e as
+    respostas, que o servidor devolve na mesma ordem, resolvem as esperas.
+    """
+    name = "resp"
+
+    def __init__(self, url: str, reconnect_delay: float = 1.0):
+        super().__init__()
+        self.url = url
+        self.reconnect_delay = reconnect_delay
+        self.reconnects = 0
+        self.publish_failures = 0
+        self._subscriber: Optional[asyncio.StreamWriter] = None
+        self._subscriber_task: Optional[asyncio.Task] = None
+        self._publisher_task: Optional[asyncio.Task] = None
+        self._publish_queue: asyncio.Queue = asyncio.Queue()
+        self._in_flight: Deque[asyncio.Future] = deque()
+
+    async def start(self, handler: MessageHandler):
+        await super().start(handler)
+        self._subscriber_task = asyncio.create_task(self._run_subscriber())
+
+    async def stop(self):
+        for task in (self._subscriber_task, self._publisher_task):
+            if task is not None:
+                task.cancel()
+        if self._subscriber is not None:
+            self._subscriber.close()
+        self._subscriber = None
+
+    async def subscribe(self, channel: str):
+        if channel in self.channels:
+            return
+        await super().subscribe(channel)
+        await self._send_subscription("SUBSCRIBE", channel)
+
+    async def unsubscribe(self, channel: str):
+        if channel not in self.channels:
+            return
+        await super().unsubscribe(channel)
+        await self._send_subscription("UNSUBSCRIBE", channel)
+
+    async def _send_subscription(self, command: str, channel: str):
+        # Sem conexão ativa o canal é (re)assinado quando o subscriber reconectar
+        if self._subscriber is None:
+            return
+        try:
+            self._subscriber.write(encode_command(command, channel))
+            await self._subscriber.drain()
+        except (ConnectionError, OSError):
+            pass
+
+    async def _run_subscriber(self):
+        while True:
+            try:
+                reader, writer = await open_resp_connection(self.url)
+                # Publicado antes do SUBSCRIBE inicial: um subscribe() feito
+                # durante o drain já escreve nesta conexão, depois dele
+                self._subscriber = writer
+                if self.channels:
+                    writer.write(encode_command("SUBSCRIBE", *sorted(self.channels)))
+                    await writer.drain()
+                while True:
+                    reply = await read_reply(reader)
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == "message":
+                        self.received += 1
+                        try:
+                            await self.handler(reply[1], reply[2])
+                        except Exception as e:
+                            print(f"❌ Erro ao entregar mensagem do backplane: {e}")
+            except asyncio.CancelledError:
+                raise
+            except (ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+                print(f"⚠️ Backplane indisponível ({e}), reconectando em {self.reconnect_delay}s")
+            self._subscriber = None
+            self.reconnects += 1
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def publish(self, channel: str, message: str) -> bool:
+        command = encode_command("PUBLISH", channel, message)
+        for attempt in range(2):
+            if self._publisher_task is None or self._publisher_task.done():
+                self._publisher_task = asyncio.create_task(self._run_publisher())
+            reply = asyncio.get_running_loop().create_future()
+            self._publish_queue.put_nowait((command, reply))
+            try:
+                await reply
+                self.published += 1
+                return True
+            except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                pass
+        self.publish_failures += 1
+
+        # Sem backplane ainda dá para entregar a quem está conectado neste worker,
+        # mas quem precisa de garantia (o outbox) tenta de novo
+        if channel in self.channels and self.handler is not None:
+            await self.handler(channel, message)
+        return False
+
+    async def _run_publisher(self):
+        """Dona da conexão de publicação; termina na primeira falha e a próxima publicação reabre"""
+        in_flight: Deque[asyncio.Future] = deque()
+        self._in_flight = in_flight
+        writer = writing = None
+        error: Exception = ConnectionError("Backplane encerrado")
+        try:
+            reader, writer = await open_resp_connection(self.url)
+            writing = asyncio.create_task(self._write_publishes(writer, in_flight))
+            while True:
+                await read_reply(reader)
+                reply = in_flight.popleft() if in_flight else None
+                if reply is not None and not reply.done():
+                    reply.set_result(None)
+        except (ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+            error = e
+        finally:
+            if writing is not None:
+                writing.cancel()
+            if writer is not None:
+                writer.close()
+            # Quem ainda espera resposta (ou nem foi escrito) falha e tenta de novo
+            while not self._publish_queue.empty():
+                in_flight.append(self._publish_queue.get_nowait()[1])
+            for reply in in_flight:
+                if not reply.done():
+                    reply.set_exception(ConnectionError(str(error)))
+            in_flight.clear()
+
+    async def _write_publishes(self, writer: asyncio.StreamWriter, in_flight: Deque[asyncio.Future]):
+        try:
+            while True:
+                command, reply = await self._publish_queue.get()
+                batch = [command]
+                in_flight.append(reply)
+                while not self._publish_queue.empty():
+                    command, reply = self._publish_queue.get_nowait()
+                    batch.append(command)
+                    in_flight.append(reply)
+                writer.write(b"".join(batch))
+                await writer.drain()
+        except (ConnectionError, OSError):
+            # Derruba a conexão para o leitor sair e falhar as esperas
+            writer.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "connected": self._subscriber is not None,
+            "publishes_in_flight": len(self._in_flight),
+            "reconnects": self.reconnects,
+            "publish_failures": self.publish_failures
+        }
+
+
+def create_bus(url: str = REALTIME_BUS_URL) -> MessageBus:
+    scheme = urlparse(url).scheme
+    if scheme in ("", "memory"):
+        return InProcessBus()
+    if scheme in ("redis", "unix", "tcp"):
+        return RespBus(url)
+    raise ValueError(f"REALTIME_BUS_URL não suportada: {url}")
+
+
+# Stand-in local
+async def serve_standin(url: str):
+    """Servidor RESP mínimo com SUBSCRIBE/UNSUBSCRIBE/PUBLISH/PING"""
+    subscribers: Dict[str, Set[asyncio.StreamWriter]] = {}
+    clients: Set[asyncio.StreamWriter] = set()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        mine: List[str] = []
+        clients.add(writer)
+        try:
+            while True:
+                command = await read_reply(reader)
+                name, args = command[0].upper(), command[1:]
+                if name == "SUBSCRIBE":
+                    for channel in args:
+                        subscribers.setdefault(channel, set()).add(writer)
+                        mine.append(channel)
+                        writer.write(b"*3\r\n" + encode_bulk("subscribe") + encode_bulk(channel) + f":{len(mine)}\r\n".encode())
+                elif name == "UNSUBSCRIBE":
+                    for channel in args:
+                        subscribers.get(channel, set()).discard(writer)
+                        if channel in mine:
+                            mine.remove(channel)
+                        writer.write(b"*3\r\n" + encode_bulk("unsubscribe") + encode_bulk(channel) + f":{len(mine)}\r\n".encode())
+                elif name == "PUBLISH":
+                    channel, message = args
+                    targets = list(subscribers.get(channel, ()))
+                    for target in targets:
+                        target.write(encode_command("message", channel, message))
+                    writer.write(f":{len(targets)}\r\n".encode())
+                elif name == "PING":
+                    writer.write(b"+PONG\r\n")
+                else:
+                    writer.write(b"+OK\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, IndexError):
+            pass
+        finally:
+            for channel in mine:
+                subscribers.get(channel, set()).discard(writer)
+            clients.discard(writer)
+            writer.close()
+
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        server = await asyncio.start_unix_server(handle, parsed.path)
+    else:
+        server = await asyncio.start_server(handle, parsed.hostname or "127.0.0.1", parsed.port or 6379)
+    print(f"🔌 Stand-in do backplane ouvindo em {url}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        # Parar o stand-in derruba as conexões abertas, como um Redis que caiu
+        for writer in list(clients):
+            writer.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve_standin(sys.argv[1] if len(sys.argv) > 1 else "unix:///tmp/vibe-bus.sock"))
@@ -1,15 +1,14 @@
 from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from typing import Optional
 from pydantic import BaseModel
 
 from main import (
     get_db, User, UserCreate, UserResponse, Token, get_current_user,
-    hash_password, verify_password, SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES,
-    create_access_token
+    hash_password_async, verify_and_update_password_async, ACCESS_TOKEN_EXPIRE_MINUTES,
+    create_access_token, find_user_by_email, save_user, store_password_hash
 )
 
 router = APIRouter()
@@ -21,15 +20,15 @@ class LoginRequest(BaseModel):
     password: str
 
 @router.post("/register", response_model=UserResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: Session = Depends(get_db)):
     try:
         # Verifica se o usuário já existe
-        db_user = db.query(User).filter(User.email == user.email).first()
+        db_user = await run_in_threadpool(find_user_by_email, db, user.email)
         if db_user:
             raise HTTPException(status_code=400, detail="Email already registered")
         
         # Cria novo usuário
-        hashed_password = hash_password(user.password)
+        hashed_password = await hash_password_async(user.password)
         db_user = User(
             first_name=user.first_name,
             last_name=user.last_name,
@@ -42,22 +41,24 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
             created_at=datetime.utcnow(),
             last_seen=datetime.utcnow()
         )
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        db_user = await run_in_threadpool(save_user, db, db_user)
         
         return db_user
     except Exception as e:
         print(f"Erro no registro: {e}")
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
 
 @router.post("/login", response_model=Token)
-def login(login_data: LoginRequest, db: Session = Depends(get_db)):
+async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
     try:
-        user = db.query(User).filter(User.email == login_data.email).first()
+        user = await run_in_threadpool(find_user_by_email, db, login_data.email)
         
-        if not user or not verify_password(login_data.password, user.password_hash):
+        verified, new_hash = (False, None)
+        if user:
+            verified, new_hash = await verify_and_update_password_async(login_data.password, user.password_hash)
+        
+        if not verified:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect username or password",
@@ -67,6 +68,9 @@ def login(login_data: LoginRequest, db: Session = Depends(get_db)):
         if not user.is_active:
             raise HTTPException(status_code=400, detail="Inactive user")
         
+        if new_hash:
+            await run_in_threadpool(store_password_hash, db, user, new_hash)
+        
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(
             data={"sub": user.email, "user_id": user.id}, expires_delta=access_token_expires
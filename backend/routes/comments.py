@@ -1,7 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from sqlalchemy.orm import Session
-from typing import List
-from main import get_db, get_current_user, User, Comment, CommentCreate, CommentResponse, Post
+from typing import List, Optional
+from main import (
+    get_db, get_current_user, User, Comment, CommentCreate, CommentResponse, Post, bump_post_counter,
+    load_comment_page, load_reply_page, set_next_cursor
+)
 
 router = APIRouter()
 
@@ -19,6 +22,7 @@ def create_comment(comment: CommentCreate, db: Session = Depends(get_db), curren
         author_id=current_user.id
     )
     db.add(db_comment)
+    bump_post_counter(db, comment.post_id, "comments_count", 1)
     db.commit()
     db.refresh(db_comment)
     
@@ -28,15 +32,18 @@ def create_comment(comment: CommentCreate, db: Session = Depends(get_db), curren
     return db_comment
 
 @router.get("/post/{post_id}", response_model=List[CommentResponse])
-def get_post_comments(post_id: int, db: Session = Depends(get_db)):
-    comments = db.query(Comment).filter(Comment.post_id == post_id, Comment.parent_id.is_(None)).all()
-    for comment in comments:
-        comment.reactions_count = 0
-        comment.replies = db.query(Comment).filter(Comment.parent_id == comment.id).all()
-        for reply in comment.replies:
-            reply.reactions_count = 0
+def get_post_comments(post_id: int, response: Response, cursor: Optional[str] = None, limit: int = 20, db: Session = Depends(get_db)):
+    comments, next_cursor = load_comment_page(db, post_id, cursor, limit)
+    set_next_cursor(response, next_cursor)
     return comments
 
+@router.get("/{comment_id}/replies", response_model=List[CommentResponse])
+def get_comment_replies(comment_id: int, response: Response, cursor: Optional[str] = None, limit: int = 20, db: Session = Depends(get_db)):
+    replies, next_cursor, remaining = load_reply_page(db, comment_id, cursor, limit)
+    set_next_cursor(response, next_cursor)
+    response.headers["X-Remaining-Count"] = str(remaining)
+    return replies
+
 @router.delete("/{comment_id}")
 def delete_comment(comment_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     comment = db.query(Comment).filter(Comment.id == comment_id).first()
@@ -47,6 +54,7 @@ def delete_comment(comment_id: int, current_user: User = Depends(get_current_use
         raise HTTPException(status_code=403, detail="Not authorized to delete this comment")
     
     db.delete(comment)
+    bump_post_counter(db, comment.post_id, "comments_count", -1)
     db.commit()
     
     return {"message": "Comment deleted successfully"}
\ No newline at end of file
@@ -1,7 +1,10 @@
 from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.orm import Session
 from typing import List
-from main import get_db, get_current_user, User, Friendship, FriendshipCreate, FriendshipResponse
+from main import (
+    get_db, get_current_user, User, Friendship, FriendshipCreate, FriendshipResponse,
+    find_friendship, friend_graph
+)
 
 router = APIRouter()
 
@@ -17,10 +20,9 @@ def send_friend_request(friendship: FriendshipCreate, db: Session = Depends(get_
         raise HTTPException(status_code=400, detail="Cannot send friend request to yourself")
     
     # Check if friendship already exists
-    existing_friendship = db.query(Friendship).filter(
-        ((Friendship.requester_id == current_user.id) & (Friendship.addressee_id == friendship.addressee_id)) |
-        ((Friendship.requester_id == friendship.addressee_id) & (Friendship.addressee_id == current_user.id))
-    ).first()
+    if friend_graph.are_friends(current_user.id, friendship.addressee_id):
+        raise HTTPException(status_code=400, detail="Already friends")
+    existing_friendship = find_friendship(db, current_user.id, friendship.addressee_id)
     
     if existing_friendship:
         raise HTTPException(status_code=400, detail="Friendship request already exists")
@@ -58,6 +60,7 @@ def accept_friend_request(friendship_id: int, current_user: User = Depends(get_c
     
     friendship.status = "accepted"
     db.commit()
+    friend_graph.add(friendship.requester_id, friendship.addressee_id)
     
     return {"message": "Friend request accepted"}
 
@@ -72,16 +75,23 @@ def reject_friend_request(friendship_id: int, current_user: User = Depends(get_c
     if not friendship:
         raise HTTPException(status_code=404, detail="Friend request not found")
     
+    requester_id, addressee_id = friendship.requester_id, friendship.addressee_id
     db.delete(friendship)
     db.commit()
+    friend_graph.remove(requester_id, addressee_id)
     
     return {"message": "Friend request rejected"}
 
 @router.get("/", response_model=List[FriendshipResponse])
 def get_friends(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    if not friend_graph.friend_count(current_user.id):
+        return []
+    
+    # Uma consulta por direção, cada uma no seu índice (requester/addressee, status)
     friendships = db.query(Friendship).filter(
-        ((Friendship.requester_id == current_user.id) | (Friendship.addressee_id == current_user.id)) &
-        (Friendship.status == "accepted")
-    ).all()
+        Friendship.requester_id == current_user.id, Friendship.status == "accepted"
+    ).union_all(db.query(Friendship).filter(
+        Friendship.addressee_id == current_user.id, Friendship.status == "accepted"
+    )).all()
     
     return friendships
\ No newline at end of file
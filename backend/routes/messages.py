@@ -1,80 +1,59 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
-from main import get_db, get_current_user, User, Message, MessageCreate, MessageResponse, Conversation
+from typing import List, Optional
+from main import (
+    get_db, get_current_user, User, MessageCreate, MessageResponse, InboxConversationResponse,
+    load_inbox_page, load_message_page, read_conversation, read_messages_by_id, store_message,
+    set_next_cursor, manager, push_message, push_receipt
+)
 
 router = APIRouter()
 
 @router.post("/", response_model=MessageResponse)
-def send_message(message: MessageCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    # Check if receiver exists
-    receiver = db.query(User).filter(User.id == message.receiver_id).first()
-    if not receiver:
-        raise HTTPException(status_code=404, detail="Receiver not found")
-    
+async def send_message(message: MessageCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     # Can't send message to yourself
     if current_user.id == message.receiver_id:
         raise HTTPException(status_code=400, detail="Cannot send message to yourself")
     
-    db_message = Message(
-        sender_id=current_user.id,
-        receiver_id=message.receiver_id,
-        content=message.content,
-        message_type=message.message_type,
-        media_url=message.media_url
-    )
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
-    
-    # Update or create conversation
-    conversation = db.query(Conversation).filter(
-        ((Conversation.user1_id == current_user.id) & (Conversation.user2_id == message.receiver_id)) |
-        ((Conversation.user1_id == message.receiver_id) & (Conversation.user2_id == current_user.id))
-    ).first()
-    
-    if not conversation:
-        conversation = Conversation(
-            user1_id=current_user.id,
-            user2_id=message.receiver_id,
-            last_message_id=db_message.id
-        )
-        db.add(conversation)
-    else:
-        conversation.last_message_id = db_message.id
-    
-    db.commit()
+    db_message = await run_in_threadpool(store_message, db, current_user.id, message)
+    manager.typing.clear(current_user.id, message.receiver_id)
+    await push_message(db_message)
     
     return db_message
 
 @router.get("/conversation/{user_id}", response_model=List[MessageResponse])
-def get_conversation(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    messages = db.query(Message).filter(
-        ((Message.sender_id == current_user.id) & (Message.receiver_id == user_id)) |
-        ((Message.sender_id == user_id) & (Message.receiver_id == current_user.id))
-    ).order_by(Message.created_at.asc()).all()
-    
+def get_conversation(user_id: int, response: Response, cursor: Optional[str] = None, since: Optional[str] = None, limit: int = 50, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    messages, next_cursor, sync_cursor = load_message_page(db, current_user.id, user_id, cursor, since, limit)
+    set_next_cursor(response, next_cursor)
+    if sync_cursor:
+        response.headers["X-Sync-Cursor"] = sync_cursor
     return messages
 
-@router.get("/conversations")
-def get_conversations(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    conversations = db.query(Conversation).filter(
-        (Conversation.user1_id == current_user.id) | (Conversation.user2_id == current_user.id)
-    ).all()
-    
+@router.get("/conversations", response_model=List[InboxConversationResponse])
+def get_conversations(response: Response, cursor: Optional[str] = None, limit: int = 20, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    conversations, next_cursor = load_inbox_page(db, current_user.id, cursor, limit)
+    set_next_cursor(response, next_cursor)
     return conversations
 
-@router.put("/{message_id}/read")
-def mark_as_read(message_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    message = db.query(Message).filter(
-        Message.id == message_id,
-        Message.receiver_id == current_user.id
-    ).first()
+@router.put("/conversation/{user_id}/read")
+async def mark_conversation_as_read(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    conversation_id, peer_id, marked = await run_in_threadpool(read_conversation, db, current_user.id, user_id)
+    if not conversation_id:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    if marked:
+        await push_receipt("read", conversation_id, current_user.id, peer_id, marked)
     
-    if not message:
+    return {"message": "Conversation marked as read", "marked": len(marked)}
+
+@router.put("/{message_id}/read")
+async def mark_as_read(message_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    conversation_id, peer_id, marked = await run_in_threadpool(read_messages_by_id, db, current_user.id, [message_id])
+    if not conversation_id:
         raise HTTPException(status_code=404, detail="Message not found")
     
-    message.is_read = True
-    db.commit()
+    if marked:
+        await push_receipt("read", conversation_id, current_user.id, peer_id, marked)
     
     return {"message": "Message marked as read"}
\ No newline at end of file
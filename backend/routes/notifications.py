@@ -1,28 +1,27 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from main import (
-    get_db, get_current_user, User, Notification, NotificationCreate, NotificationResponse
+    get_db, get_current_user, User, Notification, NotificationCreate, NotificationResponse,
+    paginate_keyset, set_next_cursor, bump_unread_count, read_unread_count,
+    NotificationActor, NotificationOutbox
 )
 
 router = APIRouter()
 
 @router.get("/", response_model=List[NotificationResponse])
-def get_notifications(skip: int = 0, limit: int = 50, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    notifications = db.query(Notification).filter(
+def get_notifications(response: Response, cursor: Optional[str] = None, limit: int = 50, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    query = db.query(Notification).filter(
         Notification.recipient_id == current_user.id
-    ).order_by(Notification.created_at.desc()).offset(skip).limit(limit).all()
+    )
+    notifications, next_cursor = paginate_keyset(query, Notification, cursor, limit)
+    set_next_cursor(response, next_cursor)
     
     return notifications
 
 @router.get("/unread-count")
 def get_unread_count(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    count = db.query(Notification).filter(
-        Notification.recipient_id == current_user.id,
-        Notification.is_read == False
-    ).count()
-    
-    return {"count": count}
+    return {"count": read_unread_count(db, current_user.id)}
 
 @router.put("/{notification_id}/read")
 def mark_as_read(notification_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -34,17 +33,22 @@ def mark_as_read(notification_id: int, current_user: User = Depends(get_current_
     if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
     
-    notification.is_read = True
+    marked = db.query(Notification).filter(
+        Notification.id == notification_id,
+        Notification.is_read == False
+    ).update({"is_read": True}, synchronize_session=False)
+    bump_unread_count(db, current_user.id, -marked)
     db.commit()
     
     return {"message": "Notification marked as read"}
 
 @router.put("/mark-all-read")
 def mark_all_as_read(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    db.query(Notification).filter(
+    marked = db.query(Notification).filter(
         Notification.recipient_id == current_user.id,
         Notification.is_read == False
     ).update({"is_read": True})
+    bump_unread_count(db, current_user.id, -marked)
     db.commit()
     
     return {"message": "All notifications marked as read"}
@@ -59,6 +63,10 @@ def delete_notification(notification_id: int, current_user: User = Depends(get_c
     if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
     
+    if not notification.is_read:
+        bump_unread_count(db, current_user.id, -1)
+    db.query(NotificationOutbox).filter(NotificationOutbox.notification_id == notification.id).delete(synchronize_session=False)
+    db.query(NotificationActor).filter(NotificationActor.notification_id == notification.id).delete(synchronize_session=False)
     db.delete(notification)
     db.commit()
     
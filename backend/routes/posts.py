@@ -1,9 +1,9 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from main import (
     get_db, get_current_user, User, Post, PostCreate, PostResponse, 
-    Comment, Like, Share, Reaction
+    Comment, Like, hydrate_posts, load_post_page, set_next_cursor
 )
 import base64
 import os
@@ -50,23 +50,12 @@ def create_post(post: PostCreate, current_user: User = Depends(get_current_user)
     db.commit()
     db.refresh(db_post)
     
-    # Add counts
-    db_post.reactions_count = db.query(Reaction).filter(Reaction.post_id == db_post.id).count()
-    db_post.comments_count = db.query(Comment).filter(Comment.post_id == db_post.id).count()
-    db_post.shares_count = db.query(Share).filter(Share.post_id == db_post.id).count()
-    
-    return db_post
+    return hydrate_posts(db, [db_post])[0]
 
 @router.get("/", response_model=List[PostResponse])
-def get_posts(skip: int = 0, limit: int = 20, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    posts = db.query(Post).order_by(Post.created_at.desc()).offset(skip).limit(limit).all()
-    
-    # Add counts for each post
-    for post in posts:
-        post.reactions_count = db.query(Reaction).filter(Reaction.post_id == post.id).count()
-        post.comments_count = db.query(Comment).filter(Comment.post_id == post.id).count()
-        post.shares_count = db.query(Share).filter(Share.post_id == post.id).count()
-    
+def get_posts(response: Response, cursor: Optional[str] = None, limit: int = 20, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    posts, next_cursor = load_post_page(db, cursor=cursor, limit=limit)
+    set_next_cursor(response, next_cursor)
     return posts
 
 @router.get("/{post_id}", response_model=PostResponse)
@@ -75,12 +64,7 @@ def get_post(post_id: int, db: Session = Depends(get_db)):
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    # Add counts
-    post.reactions_count = db.query(Reaction).filter(Reaction.post_id == post.id).count()
-    post.comments_count = db.query(Comment).filter(Comment.post_id == post.id).count()
-    post.shares_count = db.query(Share).filter(Share.post_id == post.id).count()
-    
-    return post
+    return hydrate_posts(db, [post])[0]
 
 @router.delete("/{post_id}")
 def delete_post(post_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
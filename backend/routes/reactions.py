@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.orm import Session
 from main import (
-    get_db, get_current_user, User, Reaction, ReactionCreate, Post
+    get_db, get_current_user, User, Reaction, ReactionCreate, Post, bump_post_counter
 )
 
 router = APIRouter()
@@ -23,6 +23,7 @@ def toggle_reaction(reaction: ReactionCreate, current_user: User = Depends(get_c
         if existing_reaction.reaction_type == reaction.reaction_type:
             # Remove reaction if it's the same type
             db.delete(existing_reaction)
+            bump_post_counter(db, reaction.post_id, "reactions_count", -1)
             db.commit()
             return {"message": "Reaction removed"}
         else:
@@ -38,6 +39,7 @@ def toggle_reaction(reaction: ReactionCreate, current_user: User = Depends(get_c
             reaction_type=reaction.reaction_type
         )
         db.add(db_reaction)
+        bump_post_counter(db, reaction.post_id, "reactions_count", 1)
         db.commit()
         return {"message": "Reaction added"}
 
@@ -68,6 +70,7 @@ def remove_reaction(post_id: int, current_user: User = Depends(get_current_user)
         raise HTTPException(status_code=404, detail="Reaction not found")
     
     db.delete(reaction)
+    bump_post_counter(db, post_id, "reactions_count", -1)
     db.commit()
     
     return {"message": "Reaction removed"}
\ No newline at end of file
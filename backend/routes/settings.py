@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from main import (
     get_db, get_current_user, User, UserUpdate, PasswordUpdate,
-    hash_password, verify_password
+    invalidate_principal, store_password_hash, user_name_index
 )
+from password_hashing import hash_password_async, verify_password_async
 
 router = APIRouter()
 
@@ -16,18 +18,20 @@ def update_profile(user_update: UserUpdate, current_user: User = Depends(get_cur
     
     db.commit()
     db.refresh(current_user)
+    invalidate_principal(current_user.id)
+    user_name_index.add(current_user.id, current_user.first_name, current_user.last_name)
     
     return {"message": "Profile updated successfully"}
 
 @router.put("/password")
-def update_password(password_update: PasswordUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def update_password(password_update: PasswordUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Verify current password
-    if not verify_password(password_update.current_password, current_user.password_hash):
+    if not await verify_password_async(password_update.current_password, current_user.password_hash):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
     
     # Update password
-    current_user.password_hash = hash_password(password_update.new_password)
-    db.commit()
+    new_hash = await hash_password_async(password_update.new_password)
+    await run_in_threadpool(store_password_hash, db, current_user, new_hash)
     
     return {"message": "Password updated successfully"}
 
@@ -45,6 +49,7 @@ def update_privacy_settings(privacy_level: str, current_user: User = Depends(get
     
     current_user.privacy_level = privacy_level
     db.commit()
+    invalidate_principal(current_user.id)
     
     return {"message": "Privacy settings updated successfully"}
 
@@ -52,5 +57,7 @@ def update_privacy_settings(privacy_level: str, current_user: User = Depends(get
 def deactivate_account(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     current_user.is_active = False
     db.commit()
+    invalidate_principal(current_user.id)
+    user_name_index.remove(current_user.id)
     
     return {"message": "Account deactivated successfully"}
\ No newline at end of file
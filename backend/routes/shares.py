@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.orm import Session
 from main import (
-    get_db, get_current_user, User, Share, ShareCreate, Post
+    get_db, get_current_user, User, Share, ShareCreate, Post, bump_post_counter
 )
 
 router = APIRouter()
@@ -27,6 +27,7 @@ def share_post(share: ShareCreate, current_user: User = Depends(get_current_user
         post_id=share.post_id
     )
     db.add(db_share)
+    bump_post_counter(db, share.post_id, "shares_count", 1)
     db.commit()
     
     return {"message": "Post shared successfully"}
@@ -42,6 +43,7 @@ def unshare_post(post_id: int, current_user: User = Depends(get_current_user), d
         raise HTTPException(status_code=404, detail="Share not found")
     
     db.delete(share)
+    bump_post_counter(db, post_id, "shares_count", -1)
     db.commit()
     
     return {"message": "Post unshared successfully"}
\ No newline at end of file
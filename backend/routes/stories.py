@@ -2,7 +2,11 @@ from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.orm import Session
 from typing import List
 from datetime import datetime, timedelta
-from main import get_db, get_current_user, User, Story, StoryCreate, StoryResponse, StoryView
+from main import (
+    get_db, get_current_user, User, Story, StoryCreate, StoryResponse, StoryView, StoryTrayResponse,
+    story_index, serialize_story, refresh_story_index, media_file_path, story_tray_cache, build_story_tray,
+    story_view_buffer
+)
 import base64
 import os
 
@@ -50,41 +54,41 @@ def create_story(story: StoryCreate, db: Session = Depends(get_db), current_user
     db.commit()
     db.refresh(db_story)
     
-    db_story.views_count = 0
-    return db_story
+    serialized = serialize_story(db_story, 0)
+    story_index.add(serialized)
+    return serialized
 
 @router.get("/", response_model=List[StoryResponse])
-def get_active_stories(db: Session = Depends(get_db)):
-    now = datetime.utcnow()
-    stories = db.query(Story).filter(Story.expires_at > now).order_by(Story.created_at.desc()).all()
-    
-    for story in stories:
-        story.views_count = db.query(StoryView).filter(StoryView.story_id == story.id).count()
+def get_active_stories():
+    if story_index.loaded_at is None:
+        refresh_story_index()
+    return story_index.active(datetime.utcnow())
+
+@router.get("/tray", response_model=List[StoryTrayResponse])
+def get_story_tray(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    if story_index.loaded_at is None:
+        refresh_story_index()
+    version = story_index.version
+    cached = story_tray_cache.get(current_user.id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
     
-    return stories
+    tray = build_story_tray(db, current_user.id, story_index.active(datetime.utcnow()))
+    story_tray_cache.set(current_user.id, (version, tray))
+    return tray
 
 @router.post("/{story_id}/view")
 def view_story(story_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    story = db.query(Story).filter(Story.id == story_id).first()
-    if not story:
+    now = datetime.utcnow()
+    story = story_index.get(story_id)
+    expires_at = story["expires_at"] if story else db.query(Story.expires_at).filter(Story.id == story_id).scalar()
+    if expires_at is None:
         raise HTTPException(status_code=404, detail="Story not found")
     
-    if story.expires_at <= datetime.utcnow():
+    if expires_at <= now:
         raise HTTPException(status_code=410, detail="Story has expired")
     
-    # Check if already viewed
-    existing_view = db.query(StoryView).filter(
-        StoryView.story_id == story_id,
-        StoryView.viewer_id == current_user.id
-    ).first()
-    
-    if not existing_view:
-        db_view = StoryView(
-            story_id=story_id,
-            viewer_id=current_user.id
-        )
-        db.add(db_view)
-        db.commit()
+    story_view_buffer.add(story_id, current_user.id, now)
     
     return {"message": "Story viewed"}
 
@@ -98,15 +102,17 @@ def delete_story(story_id: int, current_user: User = Depends(get_current_user),
         raise HTTPException(status_code=403, detail="Not authorized to delete this story")
     
     # Delete associated file if exists
-    if story.media_url and story.media_url.startswith('http://localhost:8000/uploads/'):
-        file_path = story.media_url.replace('http://localhost:8000/', '')
+    file_path = media_file_path(story.media_url)
+    if file_path:
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
         except Exception as e:
             print(f"Error deleting file: {e}")
     
+    db.query(StoryView).filter(StoryView.story_id == story_id).delete()
     db.delete(story)
     db.commit()
+    story_index.remove(story_id)
     
     return {"message": "Story deleted successfully"}
\ No newline at end of file
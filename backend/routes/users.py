@@ -1,9 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from main import (
     get_db, get_current_user, User, UserResponse, Post, PostResponse,
-    Reaction, Comment, Share, Friendship
+    Reaction, load_post_page, set_next_cursor, search_user_ids,
+    user_name_index, TYPEAHEAD_MAX_LIMIT, friend_graph
 )
 
 router = APIRouter()
@@ -13,17 +14,20 @@ def get_users(skip: int = 0, limit: int = 20, search: str = "", db: Session = De
     query = db.query(User).filter(User.is_active == True)
     
     if search:
-        search_filter = f"%{search}%"
-        query = query.filter(
-            (User.first_name.ilike(search_filter)) |
-            (User.last_name.ilike(search_filter)) |
-            (User.email.ilike(search_filter)) |
-            (User.phone.ilike(search_filter))
-        )
+        # E-mail e telefone por igualdade; nomes pelo índice full-text, na ordem de relevância
+        if "@" in search or search.lstrip("+").replace(" ", "").replace("-", "").isdigit():
+            return query.filter((User.email == search) | (User.phone == search)).limit(limit).all()
+        ids = [user_id for user_id, _, _ in search_user_ids(db, search, viewer_id=0, limit=skip + limit)][skip:]
+        users = {user.id: user for user in query.filter(User.id.in_(ids))}
+        return [users[user_id] for user_id in ids if user_id in users]
     
     users = query.offset(skip).limit(limit).all()
     return users
 
+@router.get("/suggest")
+def suggest_users(q: str = "", limit: int = 8, current_user: User = Depends(get_current_user)):
+    return user_name_index.suggest(q, max(1, min(limit, TYPEAHEAD_MAX_LIMIT)), exclude=current_user.id)
+
 @router.get("/{user_id}", response_model=UserResponse)
 def get_user(user_id: int, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.id == user_id, User.is_active == True).first()
@@ -32,29 +36,15 @@ def get_user(user_id: int, db: Session = Depends(get_db)):
     return user
 
 @router.get("/{user_id}/posts", response_model=List[PostResponse])
-def get_user_posts(user_id: int, skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
-    posts = db.query(Post).filter(Post.author_id == user_id).order_by(Post.created_at.desc()).offset(skip).limit(limit).all()
-    
-    # Add counts for each post
-    for post in posts:
-        post.reactions_count = db.query(Reaction).filter(Reaction.post_id == post.id).count()
-        post.comments_count = db.query(Comment).filter(Comment.post_id == post.id).count()
-        post.shares_count = db.query(Share).filter(Share.post_id == post.id).count()
-    
+def get_user_posts(user_id: int, response: Response, cursor: Optional[str] = None, limit: int = 20, db: Session = Depends(get_db)):
+    posts, next_cursor = load_post_page(db, Post.author_id == user_id, cursor=cursor, limit=limit)
+    set_next_cursor(response, next_cursor)
     return posts
 
 @router.get("/{user_id}/testimonials", response_model=List[PostResponse])
-def get_user_testimonials(user_id: int, skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
-    posts = db.query(Post).filter(
-        Post.post_type == "testimonial"
-    ).order_by(Post.created_at.desc()).offset(skip).limit(limit).all()
-    
-    # Add counts for each post
-    for post in posts:
-        post.reactions_count = db.query(Reaction).filter(Reaction.post_id == post.id).count()
-        post.comments_count = db.query(Comment).filter(Comment.post_id == post.id).count()
-        post.shares_count = db.query(Share).filter(Share.post_id == post.id).count()
-    
+def get_user_testimonials(user_id: int, response: Response, cursor: Optional[str] = None, limit: int = 20, db: Session = Depends(get_db)):
+    posts, next_cursor = load_post_page(db, Post.post_type == "testimonial", cursor=cursor, limit=limit)
+    set_next_cursor(response, next_cursor)
     return posts
 
 @router.get("/{user_id}/stats")
@@ -63,10 +53,7 @@ def get_user_stats(user_id: int, db: Session = Depends(get_db)):
     posts_count = db.query(Post).filter(Post.author_id == user_id).count()
     
     # Count friends
-    friends_count = db.query(Friendship).filter(
-        ((Friendship.requester_id == user_id) | (Friendship.addressee_id == user_id)) &
-        (Friendship.status == "accepted")
-    ).count()
+    friends_count = friend_graph.friend_count(user_id)
     
     # Count testimonials
     testimonials_count = db.query(Post).filter(
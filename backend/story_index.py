@@ -0,0 +1,139 @@
+"""Conjunto em memória dos stories ativos, ordenado por expiração.
+
+Guarda a resposta já serializada de cada story ativo e um heap de
+(expires_at, id), o que permite servir /stories/ sem consultar o histórico
+e saber exatamente quando o próximo story expira. Escritas locais entram na
+hora; as de outros workers chegam no recarregamento periódico.
+
+`version` muda a cada alteração do conjunto (não a cada visualização), o
+que serve de chave de invalidação para caches derivados.
+
+StoryViewBuffer acumula as visualizações em memória, já sem repetições por
+story, para serem gravadas em lote.
+"""
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import heapq
+import threading
+
+
+class ActiveStoryIndex:
+    def __init__(self):
+        self.loaded_at: Optional[datetime] = None
+        self.version = 0
+        self.expired = 0
+        self._stories: Dict[int, Dict[str, Any]] = {}
+        self._heap: List[Tuple[datetime, int]] = []
+        self._lock = threading.Lock()
+
+    def load(self, stories: Iterable[Dict[str, Any]]):
+        """Substitui todo o conteúdo (recarga a partir do banco)"""
+        with self._lock:
+            self._stories = {story["id"]: story for story in stories}
+            self._heap = [(story["expires_at"], story_id) for story_id, story in self._stories.items()]
+            heapq.heapify(self._heap)
+            self.loaded_at = datetime.utcnow()
+            self.version += 1
+
+    def add(self, story: Dict[str, Any]):
+        with self._lock:
+            self._stories[story["id"]] = story
+            heapq.heappush(self._heap, (story["expires_at"], story["id"]))
+            self.version += 1
+
+    def remove(self, story_id: int):
+        # A entrada no heap fica e é descartada quando vencer
+        with self._lock:
+            if self._stories.pop(story_id, None) is not None:
+                self.version += 1
+
+    def get(self, story_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._stories.get(story_id)
+
+    def increment_views(self, story_id: int, delta: int = 1):
+        with self._lock:
+            story = self._stories.get(story_id)
+            if story is not None:
+                story["views_count"] = (story.get("views_count") or 0) + delta
+
+    def pop_expired(self, now: datetime) -> List[int]:
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, story_id = heapq.heappop(self._heap)
+                if self._stories.pop(story_id, None) is not None:
+                    expired.append(story_id)
+            if expired:
+                self.version += 1
+        self.expired += len(expired)
+        return expired
+
+    def next_expiry(self) -> Optional[datetime]:
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def active(self, now: datetime) -> List[Dict[str, Any]]:
+        """Stories ainda válidos, do mais recente para o mais antigo"""
+        with self._lock:
+            stories = [dict(story) for story in self._stories.values() if story["expires_at"] > now]
+        stories.sort(key=lambda story: (story["created_at"], story["id"]), reverse=True)
+        return stories
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": len(self._stories),
+            "version": self.version,
+            "heap_entries": len(self._heap),
+            "expired": self.expired,
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None
+        }
+
+
+class StoryViewBuffer:
+    def __init__(self):
+        self.buffered = 0
+        self.duplicates = 0
+        self._pending: Dict[int, Dict[int, datetime]] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, story_id: int, viewer_id: int, viewed_at: datetime) -> bool:
+        """Enfileira a visualização; devolve False se ela já estava no buffer"""
+        with self._lock:
+            viewers = self._pending.setdefault(story_id, {})
+            if viewer_id in viewers:
+                self.duplicates += 1
+                return False
+            viewers[viewer_id] = viewed_at
+            self._size += 1
+            self.buffered += 1
+            return True
+
+    def drain(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            pending, self._pending, self._size = self._pending, {}, 0
+        return [
+            {"story_id": story_id, "viewer_id": viewer_id, "viewed_at": viewed_at}
+            for story_id, viewers in pending.items()
+            for viewer_id, viewed_at in viewers.items()
+        ]
+
+    def requeue(self, rows: List[Dict[str, Any]]):
+        """Devolve ao buffer um lote cuja gravação falhou"""
+        with self._lock:
+            for row in rows:
+                viewers = self._pending.setdefault(row["story_id"], {})
+                if row["viewer_id"] not in viewers:
+                    viewers[row["viewer_id"]] = row["viewed_at"]
+                    self._size += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self._size,
+            "buffered": self.buffered,
+            "duplicates": self.duplicates
+        }
@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# main cria o banco ao ser importado; os testes nunca devem tocar no test.db local
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("HASH_EXECUTOR", "thread")
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def register(client):
+    """Cadastra um usuário com e-mail único e devolve (id, headers autenticados)"""
+    def register(first_name: str = "Teste", last_name: str = "Usuário", password: str = "senha"):
+        email = f"{uuid.uuid4().hex[:12]}@exemplo.com"
+        response = client.post("/auth/register", json={
+            "first_name": first_name, "last_name": last_name, "email": email, "password": password
+        })
+        assert response.status_code == 200, response.text
+        token = client.post("/auth/login", json={"email": email, "password": password}).json()["access_token"]
+        return response.json()["id"], {"Authorization": f"Bearer {token}"}
+    return register
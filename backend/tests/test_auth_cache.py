@@ -0,0 +1,82 @@
+import time
+
+from sqlalchemy import event
+
+import main
+from cache import TTLCache
+
+
+def count_user_selects():
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            statements.append(statement)
+
+    event.listen(main.engine, "before_cursor_execute", before_execute)
+    return statements, lambda: event.remove(main.engine, "before_cursor_execute", before_execute)
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(max_entries=10, ttl_seconds=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cached_principal_skips_user_select(client, register):
+    _, headers = register()
+    assert client.get("/auth/me", headers=headers).status_code == 200
+
+    statements, stop = count_user_selects()
+    try:
+        response = client.get("/auth/me", headers=headers)
+    finally:
+        stop()
+    assert response.status_code == 200
+    assert statements == []
+
+
+def test_profile_update_invalidates_principal(client, register):
+    user_id, headers = register(first_name="Antes")
+    assert client.get("/auth/me", headers=headers).json()["first_name"] == "Antes"
+    assert main.principal_cache.get(user_id) is not None
+
+    response = client.put("/settings/profile", json={"first_name": "Depois"}, headers=headers)
+    assert response.status_code == 200
+    assert main.principal_cache.get(user_id) is None
+    assert client.get("/auth/me", headers=headers).json()["first_name"] == "Depois"
+
+
+def test_deactivated_account_loses_cached_principal(client, register):
+    user_id, headers = register()
+    assert client.get("/auth/me", headers=headers).status_code == 200
+
+    assert client.delete("/settings/account", headers=headers).status_code == 200
+    assert main.principal_cache.get(user_id) is None
+    assert client.get("/auth/me", headers=headers).json()["is_active"] is False
+
+
+def test_password_update_checks_current_password(client, register):
+    _, headers = register(password="antiga")
+    wrong = client.put("/settings/password", json={"current_password": "errada", "new_password": "nova"}, headers=headers)
+    assert wrong.status_code == 400
+
+    email = client.get("/auth/me", headers=headers).json()["email"]
+    ok = client.put("/settings/password", json={"current_password": "antiga", "new_password": "nova"}, headers=headers)
+    assert ok.status_code == 200
+    assert client.post("/auth/login", json={"email": email, "password": "nova"}).status_code == 200
@@ -0,0 +1,113 @@
+import json
+
+import main
+
+
+def unread(client, headers) -> int:
+    return client.get("/notifications/unread-count", headers=headers).json()["count"]
+
+
+def set_unread(user_id: int, count: int):
+    db = main.SessionLocal()
+    try:
+        db.query(main.User).filter(main.User.id == user_id).update(
+            {main.User.unread_notifications_count: count}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_unread_count_follows_notifications(client, register):
+    _, headers = register()
+    recipient_id, recipient_headers = register()
+    assert unread(client, recipient_headers) == 0
+
+    client.post("/friendships/", json={"addressee_id": recipient_id}, headers=headers)
+    assert unread(client, recipient_headers) == 1
+
+    [notification] = client.get("/notifications/", headers=recipient_headers).json()
+    assert client.put(f"/notifications/{notification['id']}/read", headers=recipient_headers).status_code == 200
+    assert unread(client, recipient_headers) == 0
+    # Marcar de novo não desconta duas vezes
+    client.put(f"/notifications/{notification['id']}/read", headers=recipient_headers)
+    client.put("/notifications/mark-all-read", headers=recipient_headers)
+    assert unread(client, recipient_headers) == 0
+
+
+def test_deleting_unread_notification_decrements(client, register):
+    _, headers = register()
+    recipient_id, recipient_headers = register()
+    client.post("/friendships/", json={"addressee_id": recipient_id}, headers=headers)
+    [notification] = client.get("/notifications/", headers=recipient_headers).json()
+
+    assert client.delete(f"/notifications/{notification['id']}", headers=recipient_headers).status_code == 200
+    assert unread(client, recipient_headers) == 0
+
+
+def test_bump_unread_count_ignores_zero_delta(register):
+    user_id, _ = register()
+    set_unread(user_id, 3)
+    db = main.SessionLocal()
+    try:
+        main.bump_unread_count(db, user_id, 0)
+        main.bump_unread_count(db, user_id, -2)
+        db.commit()
+        assert main.read_unread_count(db, user_id) == 1
+    finally:
+        db.close()
+
+
+def test_unread_count_is_pushed_on_change(client, register):
+    _, headers = register()
+    recipient_id, recipient_headers = register()
+    token = recipient_headers["Authorization"].split()[1]
+
+    with client.websocket_connect(f"/ws/{recipient_id}?token={token}") as websocket:
+        client.post("/friendships/", json={"addressee_id": recipient_id}, headers=headers)
+        counts = []
+        while 1 not in counts:
+            frame = json.loads(websocket.receive_text())
+            if frame["type"] == "unread_count":
+                counts.append(frame["count"])
+
+        client.put("/notifications/mark-all-read", headers=recipient_headers)
+        while counts[-1] != 0:
+            frame = json.loads(websocket.receive_text())
+            if frame["type"] == "unread_count":
+                counts.append(frame["count"])
+
+
+def test_reconcile_fixes_drifted_counters(client, register):
+    _, headers = register()
+    recipient_id, recipient_headers = register()
+    client.post("/friendships/", json={"addressee_id": recipient_id}, headers=headers)
+    set_unread(recipient_id, 7)
+
+    db = main.SessionLocal()
+    try:
+        assert main.reconcile_unread_counts(db, batch_size=5) >= 1
+        assert main.read_unread_count(db, recipient_id) == 1
+        assert main.reconcile_unread_counts(db) == 0
+    finally:
+        db.close()
+
+
+def test_inbox_counts_unread_per_conversation(client, register, monkeypatch):
+    monkeypatch.setattr(main, "INBOX_SNIPPET_LENGTH", 5)
+    sender_id, sender_headers = register()
+    receiver_id, receiver_headers = register()
+
+    for content in ("primeira", "segunda mensagem"):
+        client.post("/messages/", json={"receiver_id": receiver_id, "content": content}, headers=sender_headers)
+
+    [conversation] = client.get("/messages/inbox", headers=receiver_headers).json()
+    assert conversation["peer"]["id"] == sender_id
+    assert conversation["unread_count"] == 2
+    assert conversation["last_message"]["snippet"] == "segun"
+    assert client.get("/messages/inbox", headers=sender_headers).json()[0]["unread_count"] == 0
+
+    marked = client.put(f"/messages/conversation/{sender_id}/read", headers=receiver_headers).json()
+    assert marked["marked"] == 2
+    assert client.get("/messages/inbox", headers=receiver_headers).json()[0]["unread_count"] == 0
+    assert client.get("/messages/inbox", headers=sender_headers).json()[0]["last_message"]["is_read"] is True
@@ -0,0 +1,64 @@
+import threading
+
+from friend_graph import FriendGraph
+
+
+def blocking_loader(edges, started, release):
+    def loader():
+        # Lê o "banco" e só devolve depois que o teste mexer no grafo
+        snapshot = list(edges)
+        started.set()
+        release.wait(5)
+        return snapshot
+    return loader
+
+
+def reload_while(graph: FriendGraph, started: threading.Event, release: threading.Event, change):
+    reloading = threading.Thread(target=graph.reload)
+    reloading.start()
+    assert started.wait(5)
+    change()
+    release.set()
+    reloading.join(5)
+
+
+def test_changes_during_reload_survive_the_swap():
+    edges = [(1, 2), (1, 3)]
+    started, release = threading.Event(), threading.Event()
+    graph = FriendGraph(blocking_loader(edges, started, release))
+    release.set()
+    graph.ensure_loaded()
+    started.clear()
+    release.clear()
+
+    def change():
+        edges.append((1, 4))
+        graph.add(1, 4)
+        edges.remove((1, 2))
+        graph.remove(1, 2)
+
+    reload_while(graph, started, release, change)
+
+    assert graph.friend_ids(1) == [3, 4]
+    assert graph.are_friends(4, 1)
+    assert not graph.are_friends(2, 1)
+
+
+def test_change_during_first_load_is_kept():
+    edges = [(1, 2)]
+    started, release = threading.Event(), threading.Event()
+    graph = FriendGraph(blocking_loader(edges, started, release))
+
+    reload_while(graph, started, release, lambda: graph.add(1, 5))
+
+    assert graph.friend_ids(1) == [2, 5]
+    assert graph.friend_count(5) == 1
+
+
+def test_friends_of_friends_counts_mutuals_and_skips_friends():
+    graph = FriendGraph(lambda: [(1, 2), (1, 3), (2, 3), (2, 4), (3, 4), (3, 5), (4, 6)])
+
+    # 2 e 3 já são amigos de 1; 6 está a dois passos
+    assert graph.friends_of_friends(1) == {4: 2, 5: 1}
+    assert graph.friends_of_friends(6) == {2: 1, 3: 1}
+    assert graph.friends_of_friends(99) == {}
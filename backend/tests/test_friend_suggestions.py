@@ -0,0 +1,97 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import main
+from main import FriendSuggestion, Friendship, JobLease, User
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+from friend_suggestions import run_friend_suggestions, top_k
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    main.Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def ints(*values):
+    return np.array(values, dtype=np.int64)
+
+
+@pytest.mark.parametrize("n", [8, 2 ** 62])
+def test_top_k_orders_by_value_then_column(n):
+    # n enorme estoura a chave int64 e cai no lexsort; o resultado tem que ser o mesmo
+    rows, cols, values, rank = top_k(ints(0, 0, 0, 1, 1), ints(5, 3, 4, 7, 2), ints(1, 3, 3, 2, 2), n, 2, 2)
+
+    assert rows.tolist() == [0, 0, 1, 1]
+    assert cols.tolist() == [3, 4, 2, 7]
+    assert values.tolist() == [3, 3, 2, 2]
+    assert rank.tolist() == [1, 2, 1, 2]
+
+
+def test_top_k_without_candidates():
+    rows, cols, values, rank = top_k(ints(), ints(), ints(), 8, 2, 2)
+    assert len(rows) == len(cols) == len(values) == len(rank) == 0
+
+
+def suggestions(db):
+    result = {}
+    for row in db.query(FriendSuggestion).order_by(FriendSuggestion.user_id, FriendSuggestion.rank):
+        result.setdefault(row.user_id, []).append((row.suggested_id, row.mutual_friends))
+    return result
+
+
+def test_run_friend_suggestions_on_small_graph(db):
+    for user_id in range(1, 7):
+        db.add(User(id=user_id, first_name="Teste", last_name=str(user_id), email=f"{user_id}@exemplo.com",
+                    password_hash="x", is_active=user_id != 6))
+    for requester_id, addressee_id in ((1, 2), (1, 3), (2, 4), (3, 4), (2, 5), (3, 6)):
+        db.add(Friendship(requester_id=requester_id, addressee_id=addressee_id, status="accepted"))
+    # Pedido pendente também tira o par das sugestões
+    db.add(Friendship(requester_id=5, addressee_id=1, status="pending"))
+    # Sugestão antiga de quem ficou sem candidatos é apagada
+    db.add(FriendSuggestion(user_id=6, suggested_id=1, rank=1))
+    db.commit()
+
+    report = run_friend_suggestions(db, FriendSuggestion, k=2, block_size=4, progress=lambda message: None)
+
+    assert report["users"] == 6 and report["edges"] == 6 and report["blocks"] == 2
+    # O inativo (6) não recebe nem aparece como sugestão
+    assert suggestions(db) == {
+        1: [(4, 2)],
+        2: [(3, 2)],
+        3: [(2, 2)],
+        4: [(1, 2), (5, 1)],
+        5: [(4, 1)],
+    }
+
+    run_friend_suggestions(db, FriendSuggestion, k=1, progress=lambda message: None)
+    assert suggestions(db)[4] == [(1, 2)]
+
+
+def test_job_lease_admits_one_owner(db, monkeypatch):
+    assert main.acquire_job_lease(db, "teste", 60, owner="a")
+    assert not main.acquire_job_lease(db, "teste", 60, owner="b")
+    # O dono renova; o outro só entra depois de vencer
+    assert main.acquire_job_lease(db, "teste", 60, owner="a")
+    db.query(JobLease).update({JobLease.expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    assert main.acquire_job_lease(db, "teste", 60, owner="b")
+    assert not main.acquire_job_lease(db, "teste", 60, owner="a")
+
+
+def test_first_run_happens_at_startup(client):
+    deadline = time.monotonic() + 5
+    while not main.friend_suggestions_report:
+        assert time.monotonic() < deadline, "sugestões não calculadas na subida"
+        time.sleep(0.05)
+    assert "suggestions" in main.friend_suggestions_report
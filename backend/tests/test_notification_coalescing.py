@@ -0,0 +1,78 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+import main
+
+
+def react(user_id: int, recipient_id: int, post_id: int):
+    # SQLite recusa a transação que perdeu a corrida pela escrita; o cliente tenta de novo
+    for _ in range(50):
+        db = main.SessionLocal()
+        try:
+            sender = db.query(main.User).filter(main.User.id == user_id).one()
+            main.queue_notification(db, recipient_id, sender, "reaction", "reagiu ao seu post", {"post_id": post_id})
+            db.commit()
+            return
+        except OperationalError:
+            db.rollback()
+            time.sleep(0.01)
+        finally:
+            db.close()
+    raise AssertionError("reação não gravada")
+
+
+def group_rows(recipient_id: int, post_id: int):
+    db = main.SessionLocal()
+    try:
+        return db.query(main.Notification).filter(
+            main.Notification.recipient_id == recipient_id,
+            main.Notification.group_key == f"reaction:{post_id}"
+        ).order_by(main.Notification.id).all()
+    finally:
+        db.close()
+
+
+def test_concurrent_reactions_count_each_actor_once(register):
+    recipient_id, _ = register()
+    reactors = [register()[0] for _ in range(8)]
+    post_id = 10_000 + recipient_id
+
+    # O primeiro evento abre o grupo; os demais chegam juntos
+    react(reactors[0], recipient_id, post_id)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda user_id: react(user_id, recipient_id, post_id), reactors[1:] + reactors[:3]))
+
+    rows = group_rows(recipient_id, post_id)
+    assert len(rows) == 1
+    assert rows[0].actor_count == len(reactors)
+    assert rows[0].message == f"e outras {len(reactors) - 1} pessoas reagiram ao seu post"
+
+
+def test_window_counts_from_first_event(register):
+    recipient_id, _ = register()
+    first, second, third = (register()[0] for _ in range(3))
+    post_id = 20_000 + recipient_id
+
+    react(first, recipient_id, post_id)
+    react(second, recipient_id, post_id)
+    [group] = group_rows(recipient_id, post_id)
+    assert group.actor_count == 2
+    assert group.group_started_at < group.created_at
+
+    # Eventos recentes não estendem a janela: o grupo começou há mais de uma janela
+    db = main.SessionLocal()
+    try:
+        db.query(main.Notification).filter(main.Notification.id == group.id).update({
+            main.Notification.group_started_at: datetime.utcnow() - timedelta(seconds=main.NOTIFICATION_COALESCE_WINDOW_SECONDS + 1)
+        }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+    react(third, recipient_id, post_id)
+    old, new = group_rows(recipient_id, post_id)
+    assert old.actor_count == 2
+    assert new.actor_count == 1 and new.sender_id == third
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import main
+from realtime_bus import RespBus
+
+
+def outbox_row(recipient_id: int):
+    db = main.SessionLocal()
+    try:
+        return db.query(main.NotificationOutbox).join(main.Notification).filter(
+            main.Notification.recipient_id == recipient_id
+        ).first()
+    finally:
+        db.close()
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        result = condition()
+        if result:
+            return result
+        assert time.monotonic() < deadline, "condição não atingida a tempo"
+        time.sleep(0.05)
+
+
+def test_row_stays_in_outbox_while_backplane_is_down(client, register):
+    _, headers = register()
+    recipient_id, _ = register()
+
+    # Nenhum stand-in ouvindo neste caminho: o backplane está fora
+    down = RespBus(f"unix://{os.path.join(tempfile.mkdtemp(), 'bus.sock')}")
+    original = main.manager.bus
+    main.manager.bus = down
+    try:
+        started = datetime.utcnow()
+        response = client.post("/friendships/", json={"addressee_id": recipient_id}, headers=headers)
+        assert response.status_code == 200
+
+        row = wait_for(lambda: (row := outbox_row(recipient_id)) is not None and row.attempts == 1 and row)
+        assert row.last_error == "Backplane indisponível"
+        assert row.claimed_by is None
+        assert row.available_at > started
+        assert down.publish_failures >= 1
+    finally:
+        main.manager.bus = original
+        client.portal.call(down.stop)
+
+    # Com o backplane de volta a próxima tentativa entrega e apaga a linha
+    db = main.SessionLocal()
+    try:
+        db.query(main.NotificationOutbox).filter(main.NotificationOutbox.id == row.id).update(
+            {main.NotificationOutbox.available_at: datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+    client.portal.call(main.wake_notification_dispatcher)
+    wait_for(lambda: outbox_row(recipient_id) is None)
@@ -0,0 +1,118 @@
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import main
+from notification_retention import run_retention
+from main import Notification, NotificationActor, NotificationOutbox
+
+
+@pytest.fixture
+def db():
+    # Banco próprio: as políticas são globais e não podem tocar nos dados dos outros testes
+    engine = create_engine("sqlite://")
+    main.Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    for user_id in (1, 2):
+        session.add(main.User(id=user_id, first_name="Teste", last_name=str(user_id),
+                              email=f"{user_id}@exemplo.com", password_hash="x"))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def notify(db, recipient_id: int, age_days: float = 0, is_read: bool = True, **fields) -> int:
+    notification = Notification(
+        recipient_id=recipient_id, notification_type="friend_request", title="Teste", message="oi",
+        is_read=is_read, created_at=datetime.utcnow() - timedelta(days=age_days), **fields
+    )
+    db.add(notification)
+    db.commit()
+    return notification.id
+
+
+def remaining(db):
+    return {row_id for (row_id,) in db.query(Notification.id)}
+
+
+def retain(db, **options):
+    options.setdefault("max_age_days", 0)
+    options.setdefault("keep_last", 0)
+    options.setdefault("archive_dir", "")
+    return run_retention(db, Notification, NotificationOutbox, NotificationActor, progress=lambda message: None, **options)
+
+
+def test_max_age_removes_only_old_read_notifications(db):
+    old_read = notify(db, 1, age_days=100)
+    old_unread = notify(db, 1, age_days=100, is_read=False)
+    recent_read = notify(db, 1, age_days=1)
+    old_pending = notify(db, 1, age_days=100)
+    db.add(NotificationOutbox(notification_id=old_pending))
+    db.commit()
+
+    report = retain(db, max_age_days=90)
+
+    assert report["deleted"] == {"max_age": 1, "keep_last": 0}
+    assert report["complete"] is True
+    assert remaining(db) == {old_unread, recent_read, old_pending}
+    assert old_read not in remaining(db)
+
+
+def test_keep_last_trims_each_recipient(db):
+    ids = [notify(db, 1, age_days=5 - day) for day in range(5)]
+    others = [notify(db, 2, age_days=day) for day in range(2)]
+    unread = notify(db, 1, age_days=10, is_read=False)
+
+    report = retain(db, keep_last=2, batch_size=2)
+
+    # Ficam as duas lidas mais recentes de cada um e todas as não lidas
+    assert report["deleted"]["keep_last"] == 3
+    assert remaining(db) == set(ids[-2:]) | set(others) | {unread}
+
+
+def test_batches_are_archived_as_gzip_ndjson(db, tmp_path):
+    ids = [notify(db, 1, age_days=100, group_key=f"reaction:{n}") for n in range(5)]
+    for notification_id in ids:
+        db.add(NotificationActor(notification_id=notification_id, user_id=2))
+    db.commit()
+
+    report = retain(db, max_age_days=90, batch_size=2, archive_dir=str(tmp_path))
+
+    assert report["archived"] == 5
+    assert len(report["segments"]) == report["batches"] == 3
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in report["segments"])
+    archived = []
+    for path in report["segments"]:
+        assert path.endswith(".ndjson.gz")
+        with gzip.open(path, "rt", encoding="utf-8") as segment:
+            archived.extend(json.loads(line) for line in segment)
+    assert [record["id"] for record in archived] == ids
+    assert archived[0]["group_key"] == "reaction:0"
+    assert remaining(db) == set()
+    assert db.query(NotificationActor).count() == 0
+
+
+def test_pass_stops_at_max_batches(db):
+    for _ in range(5):
+        notify(db, 1, age_days=100)
+
+    report = retain(db, max_age_days=90, batch_size=2, max_batches=1)
+
+    assert report["complete"] is False
+    assert report["deleted"]["max_age"] == 2
+    assert len(remaining(db)) == 3
+
+
+def test_first_pass_runs_at_startup(client):
+    deadline = time.monotonic() + 5
+    while not main.retention_report:
+        assert time.monotonic() < deadline, "retenção não rodou na subida"
+        time.sleep(0.05)
+    assert "deleted" in main.retention_report
@@ -0,0 +1,102 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+import main
+
+
+def pages(client, url, headers, limit, **params):
+    """Segue X-Next-Cursor até o fim e devolve os ids em ordem"""
+    ids, cursor = [], None
+    while True:
+        response = client.get(url, headers=headers, params={"limit": limit, **params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        ids += [item["id"] for item in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 17, 13, 45, 12, 123456)
+    assert main.decode_cursor(main.encode_cursor(created_at, 42)) == (created_at, 42)
+
+
+@pytest.mark.parametrize("cursor", ["lixo", "bm9wZQ", main.encode_cursor(datetime(2024, 1, 1), 1)[:-3] + "!!!"])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        main.decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_malformed_cursor_returns_400(client, register):
+    _, headers = register()
+    assert client.get("/posts/", headers=headers, params={"cursor": "lixo"}).status_code == 400
+
+
+def test_profile_pages_break_ties_on_id(client, register):
+    user_id, headers = register()
+    created = [client.post("/posts/", json={"content": f"post {i}"}, headers=headers).json()["id"] for i in range(7)]
+    # Todos no mesmo instante: só o id desempata
+    db = main.SessionLocal()
+    db.query(main.Post).filter(main.Post.id.in_(created)).update(
+        {main.Post.created_at: datetime(2024, 1, 1)}, synchronize_session=False
+    )
+    db.commit()
+    db.close()
+
+    assert pages(client, f"/users/{user_id}/posts", headers, limit=2) == sorted(created, reverse=True)
+
+
+def test_comment_threads_and_replies_page_without_gaps(client, register):
+    _, headers = register()
+    post_id = client.post("/posts/", json={"content": "com comentários"}, headers=headers).json()["id"]
+    roots = [
+        client.post("/comments/", json={"post_id": post_id, "content": f"c{i}"}, headers=headers).json()["id"]
+        for i in range(5)
+    ]
+    replies = [
+        client.post("/comments/", json={"post_id": post_id, "content": f"r{i}", "parent_id": roots[0]}, headers=headers).json()["id"]
+        for i in range(6)
+    ]
+
+    assert pages(client, f"/comments/post/{post_id}", headers, limit=2) == sorted(roots, reverse=True)
+
+    thread = next(item for item in client.get(f"/comments/post/{post_id}", headers=headers, params={"limit": 10}).json() if item["id"] == roots[0])
+    shown = [reply["id"] for reply in thread["replies"]]
+    assert thread["replies_count"] == 6
+    assert shown == replies[:main.COMMENT_REPLIES_PER_THREAD]
+    rest = pages(client, f"/comments/{roots[0]}/replies", headers, limit=2, **{"cursor": thread["replies_cursor"]})
+    assert shown + rest == replies
+
+    # Resposta criada depois da abertura do fio entra na contagem do que falta
+    late = client.post("/comments/", json={"post_id": post_id, "content": "tarde", "parent_id": replies[-1]}, headers=headers).json()["id"]
+    page = client.get(f"/comments/{roots[0]}/replies", headers=headers, params={"limit": 2, "cursor": thread["replies_cursor"]})
+    remaining = len(replies) + 1 - len(shown) - 2
+    assert page.headers["X-Remaining-Count"] == str(remaining)
+    assert pages(client, f"/comments/{roots[0]}/replies", headers, limit=2, **{"cursor": thread["replies_cursor"]})[-1] == late
+
+
+def test_conversation_sync_cursor_returns_only_new_messages(client, register):
+    sender_id, sender = register()
+    receiver_id, receiver = register()
+    first = [
+        client.post("/messages/", json={"receiver_id": receiver_id, "content": f"m{i}"}, headers=sender).json()["id"]
+        for i in range(3)
+    ]
+
+    response = client.get(f"/messages/conversation/{sender_id}", headers=receiver)
+    assert [message["id"] for message in response.json()] == sorted(first, reverse=True)
+    since = response.headers["X-Sync-Cursor"]
+
+    later = [
+        client.post("/messages/", json={"receiver_id": receiver_id, "content": f"n{i}"}, headers=sender).json()["id"]
+        for i in range(3)
+    ]
+    synced = client.get(f"/messages/conversation/{sender_id}", headers=receiver, params={"since": since, "limit": 2})
+    assert [message["id"] for message in synced.json()] == later[:2]
+    rest = client.get(f"/messages/conversation/{sender_id}", headers=receiver, params={"since": synced.headers["X-Sync-Cursor"]})
+    assert [message["id"] for message in rest.json()] == later[2:]
+    idle = client.get(f"/messages/conversation/{sender_id}", headers=receiver, params={"since": rest.headers["X-Sync-Cursor"]})
+    assert idle.json() == [] and idle.headers["X-Sync-Cursor"] == rest.headers["X-Sync-Cursor"]
@@ -0,0 +1,58 @@
+import asyncio
+
+from passlib.context import CryptContext
+
+import main
+import password_hashing
+
+
+def login(client, email, password):
+    return client.post("/auth/login", json={"email": email, "password": password})
+
+
+def test_register_and_login_verify_the_password(client):
+    response = client.post("/auth/register", json={
+        "first_name": "Ana", "last_name": "Lima", "email": "ana.hash@exemplo.com", "password": "certa"
+    })
+    assert response.status_code == 200, response.text
+
+    assert login(client, "ana.hash@exemplo.com", "certa").status_code == 200
+    assert login(client, "ana.hash@exemplo.com", "errada").status_code == 401
+    assert login(client, "ninguem@exemplo.com", "certa").status_code == 401
+
+
+def test_login_rehashes_with_the_current_cost(client, register):
+    user_id, _ = register(password="senha")
+    db = main.SessionLocal()
+    user = db.get(main.User, user_id)
+    email = user.email
+    user.password_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=password_hashing.BCRYPT_ROUNDS + 1).hash("senha")
+    db.commit()
+    db.close()
+
+    assert login(client, email, "senha").status_code == 200
+
+    db = main.SessionLocal()
+    rehashed = db.get(main.User, user_id).password_hash
+    db.close()
+    assert rehashed.startswith(f"$2b${password_hashing.BCRYPT_ROUNDS:02d}$")
+    assert login(client, email, "senha").status_code == 200
+
+
+def test_process_executor_uses_a_safe_start_method(monkeypatch):
+    # Pool próprio para o teste, sem mexer no executor da aplicação
+    monkeypatch.setattr(password_hashing, "HASH_EXECUTOR", "process")
+    monkeypatch.setattr(password_hashing, "HASH_WORKERS", 1)
+    monkeypatch.setattr(password_hashing, "_executor", None)
+    monkeypatch.setattr(password_hashing, "_slots", None)
+    try:
+        executor = password_hashing.get_executor()
+        assert executor._mp_context.get_start_method() in ("forkserver", "spawn")
+
+        async def roundtrip():
+            hashed = await password_hashing.hash_password_async("segredo")
+            return await password_hashing.verify_password_async("segredo", hashed)
+
+        assert asyncio.run(roundtrip())
+    finally:
+        password_hashing.shutdown_executor()
@@ -0,0 +1,35 @@
+import os
+import re
+import shutil
+
+import pytest
+from sqlalchemy import create_engine, inspect
+
+from conftest import BACKEND_DIR
+from migrations import HOT_QUERIES, check_query_plans, run_migrations
+
+
+def scratch_engine(path):
+    import main
+
+    engine = create_engine(f"sqlite:///{path}")
+    main.Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    return engine
+
+
+def test_hot_queries_use_indexes_on_new_database(tmp_path):
+    engine = scratch_engine(tmp_path / "new.db")
+    tables = set(inspect(engine).get_table_names())
+    for name, sql in HOT_QUERIES.items():
+        assert set(re.findall(r"FROM (\w+)", sql)) <= tables, name
+
+    assert check_query_plans(engine) == {}
+
+
+@pytest.mark.skipif(not os.path.exists(os.path.join(BACKEND_DIR, "vibe.db")), reason="sem vibe.db")
+def test_hot_queries_use_indexes_after_migrating_legacy_database(tmp_path):
+    shutil.copy(os.path.join(BACKEND_DIR, "vibe.db"), tmp_path / "vibe.db")
+    engine = scratch_engine(tmp_path / "vibe.db")
+
+    assert check_query_plans(engine) == {}
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+
+import pytest
+
+import main
+
+
+def caller_thread(db, marker):
+    return threading.get_ident(), marker, db.query(main.User.id).limit(1).all() is not None
+
+
+def test_run_read_moves_sync_session_off_the_loop():
+    async def scenario():
+        loop_thread = threading.get_ident()
+        db = main.SessionLocal()
+        try:
+            thread_id, marker, queried = await main.run_read(db, caller_thread, "ok")
+        finally:
+            db.close()
+        return loop_thread, thread_id, marker, queried
+
+    loop_thread, thread_id, marker, queried = asyncio.run(scenario())
+    assert thread_id != loop_thread
+    assert marker == "ok"
+    assert queried
+
+
+def test_run_read_uses_run_sync_with_async_session():
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async def scenario():
+        engine = create_async_engine(main.async_database_url(main.SQLALCHEMY_DATABASE_URL))
+        try:
+            async with async_sessionmaker(engine)() as db:
+                return await main.run_read(db, caller_thread, "ok")
+        finally:
+            await engine.dispose()
+
+    _, marker, queried = asyncio.run(scenario())
+    assert marker == "ok"
+    assert queried
+
+
+def test_get_read_db_routes(client, register):
+    user_id, headers = register(first_name="Leitura")
+    other_id, other_headers = register()
+
+    profile = client.get(f"/users/{user_id}", headers=other_headers)
+    assert profile.status_code == 200
+    assert profile.json()["first_name"] == "Leitura"
+    assert client.get("/users/999999", headers=headers).status_code == 404
+
+    assert client.get(f"/friendships/status/{other_id}", headers=headers).json() == {"status": "none"}
+    assert client.post("/friendships/", json={"addressee_id": other_id}, headers=headers).status_code == 200
+    assert client.get(f"/friendships/status/{other_id}", headers=headers).json() == {"status": "pending"}
+
+
+def test_offloaded_write_routes(client, register):
+    user_id, headers = register()
+    other_id, other_headers = register()
+
+    sent = client.post("/messages/", json={"receiver_id": other_id, "content": "oi"}, headers=headers)
+    assert sent.status_code == 200
+    message_id = sent.json()["id"]
+
+    assert client.put(f"/messages/{message_id}/read", headers=headers).status_code == 404
+    assert client.put(f"/messages/{message_id}/read", headers=other_headers).status_code == 200
+    marked = client.put(f"/messages/conversation/{user_id}/read", headers=other_headers).json()
+    assert marked["marked"] == 0
+    assert client.put("/messages/conversation/999999/read", headers=other_headers).status_code == 404
+
+    post_id = client.post("/posts/", json={"content": "post"}, headers=other_headers).json()["id"]
+    assert client.post("/reactions/", json={"post_id": post_id, "reaction_type": "like"}, headers=headers).json() == {"message": "Reaction created"}
+    assert client.post("/reactions/", json={"post_id": post_id, "reaction_type": "like"}, headers=headers).json() == {"message": "Reaction removed"}
+    comment = client.post("/comments/", json={"post_id": post_id, "content": "legal"}, headers=headers)
+    assert comment.status_code == 200
+    assert comment.json()["content"] == "legal"
+    assert client.post("/comments/", json={"post_id": 999999, "content": "x"}, headers=headers).status_code == 404
+
+    assert client.put("/notifications/999999/read", headers=other_headers).status_code == 404
+    assert client.put("/notifications/mark-all-read", headers=other_headers).status_code == 200
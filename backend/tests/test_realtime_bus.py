@@ -0,0 +1,122 @@
+import asyncio
+import os
+import tempfile
+
+from realtime_bus import RespBus, serve_standin
+from websocket_manager import ConnectionManager
+
+from test_websocket_manager import FakeWebSocket
+
+
+async def until(condition, timeout: float = 3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condição não atingida a tempo"
+        await asyncio.sleep(0.02)
+
+
+async def publish_until_received(manager: ConnectionManager, user_id: int, message: str, websocket: FakeWebSocket):
+    # O SUBSCRIBE chega ao stand-in de forma assíncrona; publica até ele valer
+    async def keep_publishing():
+        while message not in websocket.sent:
+            await manager.send_personal_message(message, user_id)
+            await asyncio.sleep(0.05)
+
+    await asyncio.wait_for(keep_publishing(), 3.0)
+
+
+class Backplane:
+    """Stand-in rodando como task, que pode ser derrubado e religado"""
+    def __init__(self):
+        self.url = f"unix://{os.path.join(tempfile.mkdtemp(), 'bus.sock')}"
+        self.task = None
+
+    async def up(self):
+        self.task = asyncio.create_task(serve_standin(self.url))
+        await until(lambda: os.path.exists(self.url[len("unix://"):]))
+
+    async def down(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        os.unlink(self.url[len("unix://"):])
+
+
+async def start_worker(url: str) -> ConnectionManager:
+    manager = ConnectionManager(send_timeout=0.5)
+    await manager.start(RespBus(url, reconnect_delay=0.05))
+    return manager
+
+
+def test_message_crosses_workers():
+    async def scenario():
+        backplane = Backplane()
+        await backplane.up()
+        worker_a, worker_b = await start_worker(backplane.url), await start_worker(backplane.url)
+        try:
+            socket = FakeWebSocket()
+            await worker_b.connect(socket, 2)
+
+            await publish_until_received(worker_a, 2, "de A para B", socket)
+            assert await worker_a.send_personal_message("de novo", 2) is True
+            assert worker_a.bus.stats()["published"] >= 1
+            assert worker_b.bus.stats()["received"] >= 1
+        finally:
+            await worker_a.stop()
+            await worker_b.stop()
+            await backplane.down()
+
+    asyncio.run(scenario())
+
+
+def test_subscriber_reconnects_and_resubscribes():
+    async def scenario():
+        backplane = Backplane()
+        await backplane.up()
+        worker_a, worker_b = await start_worker(backplane.url), await start_worker(backplane.url)
+        try:
+            socket = FakeWebSocket()
+            await worker_b.connect(socket, 2)
+            await publish_until_received(worker_a, 2, "antes", socket)
+
+            await backplane.down()
+            await until(lambda: not worker_b.bus.stats()["connected"])
+            await backplane.up()
+            await until(lambda: worker_b.bus.stats()["connected"])
+
+            await publish_until_received(worker_a, 2, "depois", socket)
+            assert worker_b.bus.stats()["reconnects"] >= 1
+        finally:
+            await worker_a.stop()
+            await worker_b.stop()
+            await backplane.down()
+
+    asyncio.run(scenario())
+
+
+def test_publish_with_backplane_down():
+    async def scenario():
+        backplane = Backplane()
+        await backplane.up()
+        worker_a, worker_b = await start_worker(backplane.url), await start_worker(backplane.url)
+        try:
+            local, remote = FakeWebSocket(), FakeWebSocket()
+            await worker_a.connect(local, 1)
+            await worker_b.connect(remote, 2)
+            await publish_until_received(worker_a, 1, "aquecendo", local)
+            await backplane.down()
+
+            # Sem backplane só quem está no mesmo worker recebe
+            assert await worker_a.send_personal_message("local", 1) is False
+            assert await worker_a.send_personal_message("remoto", 2) is False
+            await until(lambda: "local" in local.sent)
+            await asyncio.sleep(0.1)
+            assert "remoto" not in remote.sent
+            assert worker_a.bus.stats()["publish_failures"] == 2
+        finally:
+            await worker_a.stop()
+            await worker_b.stop()
+
+    asyncio.run(scenario())
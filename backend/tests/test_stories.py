@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import main
+from story_index import ActiveStoryIndex, StoryViewBuffer
+
+
+def story(story_id: int, created_at: datetime, expires_at: datetime):
+    return {"id": story_id, "created_at": created_at, "expires_at": expires_at, "views_count": 0}
+
+
+def test_active_story_index_orders_and_expires():
+    now = datetime.utcnow()
+    index = ActiveStoryIndex()
+    index.load([story(1, now - timedelta(hours=2), now + timedelta(hours=1))])
+    index.add(story(2, now - timedelta(hours=1), now + timedelta(minutes=5)))
+    index.add(story(3, now, now + timedelta(hours=3)))
+    version = index.version
+
+    assert [s["id"] for s in index.active(now)] == [3, 2, 1]
+    assert index.next_expiry() == now + timedelta(minutes=5)
+
+    index.increment_views(1, 2)
+    assert index.get(1)["views_count"] == 2
+    assert index.version == version
+
+    assert index.pop_expired(now + timedelta(minutes=10)) == [2]
+    assert index.version == version + 1
+    index.remove(3)
+    assert [s["id"] for s in index.active(now)] == [1]
+    # A entrada removida sai do heap só ao vencer, sem contar como expirada
+    assert index.pop_expired(now + timedelta(hours=4)) == [1]
+    assert index.stats()["expired"] == 2
+
+
+def test_story_view_buffer_dedupes_and_requeues():
+    now = datetime.utcnow()
+    buffer = StoryViewBuffer()
+    assert buffer.add(1, 10, now)
+    assert not buffer.add(1, 10, now)
+    assert buffer.add(1, 11, now)
+    assert buffer.add(2, 10, now)
+    assert len(buffer) == 3
+
+    rows = buffer.drain()
+    assert len(buffer) == 0
+    assert sorted((row["story_id"], row["viewer_id"]) for row in rows) == [(1, 10), (1, 11), (2, 10)]
+
+    buffer.add(1, 10, now)
+    buffer.requeue(rows)
+    assert len(buffer) == 3
+    assert buffer.stats()["duplicates"] == 1
+
+
+def tray_for(client, headers, author_id: int):
+    tray = client.get("/stories/tray", headers=headers).json()
+    return next(group for group in tray if group["author"]["id"] == author_id)
+
+
+def test_tray_cache_is_invalidated_by_views_and_new_stories(client, register):
+    author_id, author_headers = register()
+    viewer_id, viewer_headers = register()
+    first = client.post("/stories/", json={"content": "um"}, headers=author_headers).json()
+
+    group = tray_for(client, viewer_headers, author_id)
+    assert group["has_unseen"] is True
+    hits = main.story_tray_cache.hits
+    assert tray_for(client, viewer_headers, author_id) == group
+    assert main.story_tray_cache.hits == hits + 1
+
+    assert client.post(f"/stories/{first['id']}/view", headers=viewer_headers).status_code == 200
+    # Repetir a visualização não grava nem conta de novo
+    client.post(f"/stories/{first['id']}/view", headers=viewer_headers)
+    client.portal.call(main.flush_buffered_story_views)
+
+    group = tray_for(client, viewer_headers, author_id)
+    assert group["has_unseen"] is False
+    assert main.story_index.get(first["id"])["views_count"] == 1
+
+    # Story novo muda a versão do índice e a bandeja em cache deixa de valer
+    client.post("/stories/", json={"content": "dois"}, headers=author_headers)
+    group = tray_for(client, viewer_headers, author_id)
+    assert group["has_unseen"] is True
+    assert [s["seen"] for s in group["stories"]] == [True, False]
+
+
+def test_viewing_expired_or_missing_story(client, register):
+    _, author_headers = register()
+    _, viewer_headers = register()
+    created = client.post("/stories/", json={"content": "já era"}, headers=author_headers).json()
+
+    db = main.SessionLocal()
+    try:
+        db.query(main.Story).filter(main.Story.id == created["id"]).update(
+            {main.Story.expires_at: datetime.utcnow() - timedelta(seconds=1)}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+    main.story_index.remove(created["id"])
+
+    assert client.post(f"/stories/{created['id']}/view", headers=viewer_headers).status_code == 410
+    assert client.post("/stories/999999/view", headers=viewer_headers).status_code == 404
@@ -0,0 +1,54 @@
+from typeahead import NameIndex
+
+
+def ids(hits):
+    return [hit["id"] for hit in hits]
+
+
+def test_prefix_lookup_folds_accents_and_combines_terms():
+    index = NameIndex()
+    index.load([(1, "João", "Silva"), (2, "Joana", "Souza"), (3, "Maria", "Silveira")])
+
+    # Ordem alfabética da palavra casada: "joana" vem antes de "joao"
+    assert ids(index.suggest("jo")) == [2, 1]
+    assert ids(index.suggest("JOÃO")) == [1]
+    assert ids(index.suggest("sil")) == [1, 3]
+    assert ids(index.suggest("jo so")) == [2]
+    assert ids(index.suggest("sil", exclude=1)) == [3]
+    assert ids(index.suggest("s", limit=1)) == [1]
+    assert index.suggest("") == []
+
+
+def test_add_replaces_and_remove_drops_entries():
+    index = NameIndex(max_users=2)
+    index.load([(1, "João", "Silva")])
+    index.add(2, "Maria", "Souza")
+    assert not index.add(3, "Pedro", "Alves")
+    assert index.stats()["rejected"] == 1
+
+    # Renomear tira as palavras antigas do índice
+    index.add(1, "Joaquim", "Pereira")
+    assert ids(index.suggest("silva")) == []
+    assert ids(index.suggest("pereira")) == [1]
+
+    index.remove(1)
+    index.remove(1)
+    assert ids(index.suggest("jo")) == []
+    assert len(index) == 1
+    assert index.stats()["entries"] == 2
+
+
+def test_rename_and_deactivation_reach_the_index(client, register):
+    user_id, headers = register(first_name="Tipado")
+    _, viewer = register()
+
+    def suggest(q):
+        return ids(client.get("/users/suggest", params={"q": q, "limit": 50}, headers=viewer).json())
+
+    assert user_id in suggest("tipado")
+    client.put("/settings/profile", json={"first_name": "Renomeado"}, headers=headers)
+    assert user_id not in suggest("tipado")
+    assert user_id in suggest("renomeado")
+
+    assert client.delete("/settings/account", headers=headers).status_code == 200
+    assert user_id not in suggest("renomeado")
@@ -0,0 +1,68 @@
+import uuid
+
+import pytest
+
+import main
+import user_search
+
+
+@pytest.fixture
+def surname():
+    # Sobrenome único por teste: a busca é global e os outros testes também cadastram gente
+    return f"Zq{uuid.uuid4().hex[:8]}"
+
+
+def befriend(client, headers, other_id, other_headers):
+    client.post("/friendships/", json={"addressee_id": other_id}, headers=headers)
+    [pending] = client.get("/friendships/pending", headers=other_headers).json()
+    assert client.put(f"/friendships/{pending['id']}/accept", headers=other_headers).status_code == 200
+
+
+def search(client, headers, term):
+    response = client.get("/users/", params={"search": term}, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+def social_graph(client, register, surname):
+    """viewer -- friend -- fof, mais três desconhecidos com o mesmo sobrenome"""
+    viewer_id, viewer = register(first_name="Visitante", last_name=surname)
+    friend_id, friend = register(first_name="Amigo", last_name=surname)
+    fof_id, fof = register(first_name="Conhecido", last_name=surname)
+    strangers = [register(first_name="Estranho", last_name=surname)[0] for _ in range(3)]
+    befriend(client, viewer, friend_id, friend)
+    befriend(client, friend, fof_id, fof)
+    return viewer, friend_id, fof_id, strangers
+
+
+def test_accents_are_folded(client, register, surname):
+    user_id, _ = register(first_name="João", last_name=f"Ninguém {surname}")
+    _, viewer = register()
+
+    for term in ("joao", "JOÃO", "ninguem", "jo nin"):
+        assert [hit["id"] for hit in search(client, viewer, f"{term} {surname}")] == [user_id]
+
+
+def test_friends_of_friends_rank_beyond_the_candidate_cap(client, register, surname, monkeypatch):
+    viewer, friend_id, fof_id, strangers = social_graph(client, register, surname)
+    # Só 2 candidatos por relevância: o amigo de amigo precisa entrar pelo círculo
+    monkeypatch.setattr(user_search, "USER_SEARCH_CANDIDATES", 2)
+
+    hits = search(client, viewer, surname)
+
+    assert [hit["id"] for hit in hits[:2]] == [friend_id, fof_id]
+    assert hits[0]["is_friend"] is True
+    assert hits[1]["is_friend"] is False and hits[1]["mutual_friends"] == 1
+
+
+def test_like_fallback_keeps_social_order(client, register, surname, monkeypatch):
+    viewer, friend_id, fof_id, strangers = social_graph(client, register, surname)
+    monkeypatch.setattr(user_search, "has_search_index", lambda db: False)
+
+    hits = search(client, viewer, surname[:6])
+    ids = [hit["id"] for hit in hits]
+
+    assert ids[:2] == [friend_id, fof_id]
+    assert set(strangers) <= set(ids)
+    assert ids[2:5] == sorted(strangers)
+    assert search(client, viewer, f"amigo {surname}")[0]["id"] == friend_id
@@ -0,0 +1,64 @@
+import asyncio
+
+from realtime_bus import InProcessBus
+from websocket_manager import WS_CLOSE_TRY_AGAIN_LATER, ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self, stalled: bool = False, broken: bool = False):
+        self.stalled = stalled
+        self.broken = broken
+        self.sent = []
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        if self.broken:
+            raise RuntimeError("connection reset")
+        if self.stalled:
+            await asyncio.Event().wait()
+        self.sent.append(message)
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+
+async def send_and_settle(manager: ConnectionManager, user_id: int, message: str):
+    await manager.send_personal_message(message, user_id)
+    for _ in range(20):
+        await asyncio.sleep(0.02)
+
+
+def test_stalled_socket_is_closed_and_removed():
+    async def scenario():
+        manager = ConnectionManager(send_timeout=0.05)
+        await manager.start(InProcessBus())
+        stalled, healthy = FakeWebSocket(stalled=True), FakeWebSocket()
+        await manager.connect(stalled, 1)
+        await manager.connect(healthy, 1)
+
+        await send_and_settle(manager, 1, "olá")
+
+        assert stalled.closed_with == WS_CLOSE_TRY_AGAIN_LATER
+        assert healthy.sent == ["olá"] and healthy.closed_with is None
+        assert [c.websocket for c in manager.active_connections[1]] == [healthy]
+        assert manager.stats()["send_failures"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_failed_send_closes_socket():
+    async def scenario():
+        manager = ConnectionManager(send_timeout=0.05)
+        await manager.start(InProcessBus())
+        broken = FakeWebSocket(broken=True)
+        await manager.connect(broken, 1)
+
+        await send_and_settle(manager, 1, "olá")
+
+        assert broken.closed_with == WS_CLOSE_TRY_AGAIN_LATER
+        assert 1 not in manager.active_connections
+
+    asyncio.run(scenario())
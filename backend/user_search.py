@@ -0,0 +1,114 @@
+"""Busca de usuários por nome com índice full-text (SQLite FTS5).
+
+A tabela `users_fts` (criada na migração 007) indexa first_name/last_name
+com `unicode61 remove_diacritics 2`, então "joao" encontra "João", e é
+mantida por triggers em `users`, valendo para cadastro, edição de perfil e
+qualquer outro caminho de escrita. Cada palavra digitada vira um prefixo
+("jo si" -> "jo"* "si"*), e o custo depende das correspondências, não do
+tamanho da tabela.
+
+Ordem do resultado: amigos, depois amigos de amigos (por número de amigos
+em comum) e por fim os demais pela relevância (bm25). O círculo do usuário
+(amigos e amigos de amigos) vem do grafo em memória e entra inteiro na
+busca, fora do corte de USER_SEARCH_CANDIDATES: um amigo de amigo com bm25
+baixo não fica de fora por causa de 200 desconhecidos mais relevantes. Sem
+FTS5 (outro banco) cai para prefixo com LIKE, na mesma ordem.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import json
+import os
+import re
+
+from sqlalchemy import inspect, or_, text
+from sqlalchemy.orm import Session
+
+from friend_graph import FriendGraph
+
+USER_SEARCH_CANDIDATES = int(os.getenv("USER_SEARCH_CANDIDATES", "200"))
+
+# (id, é amigo, amigos em comum)
+SearchHit = Tuple[int, bool, int]
+
+# Candidatos: os mais relevantes de todos mais qualquer um do círculo que
+# corresponda; a ordem social é aplicada depois, com o grafo
+RANKED_SEARCH = text("""
+    WITH matches AS (
+        SELECT rowid AS id, rank FROM users_fts WHERE users_fts MATCH :query ORDER BY rank LIMIT :candidates
+    ),
+    circle_matches AS (
+        SELECT rowid AS id, rank FROM users_fts
+        WHERE users_fts MATCH :query AND rowid IN (SELECT value FROM json_each(:circle))
+    )
+    SELECT users.id, MIN(candidates.rank) AS rank
+    FROM (SELECT id, rank FROM matches UNION ALL SELECT id, rank FROM circle_matches) AS candidates
+    JOIN users ON users.id = candidates.id
+    WHERE users.is_active = 1 AND users.id != :viewer_id
+    GROUP BY users.id
+""")
+
+_index_ready: Dict[str, bool] = {}
+
+
+def search_terms(term: str) -> List[str]:
+    return re.findall(r"\w+", term.lower())
+
+
+def match_expression(terms: List[str]) -> str:
+    # \w+ não tem aspas nem operadores, então cada termo vai literal como prefixo
+    return " ".join(f'"{word}"*' for word in terms)
+
+
+def has_search_index(db: Session) -> bool:
+    bind = db.get_bind()
+    key = str(bind.url)
+    if key not in _index_ready:
+        _index_ready[key] = bind.dialect.name == "sqlite" and inspect(bind).has_table("users_fts")
+    return _index_ready[key]
+
+
+def social_circle(graph: Optional[FriendGraph], viewer_id: int) -> Tuple[Set[int], Dict[int, int]]:
+    """Amigos do usuário e amigos de amigos com o número de amigos em comum"""
+    if graph is None:
+        return set(), {}
+    return set(graph.friend_ids(viewer_id)), graph.friends_of_friends(viewer_id)
+
+
+def rank_hits(candidates: Iterable[Tuple[int, float]], graph: Optional[FriendGraph], viewer_id: int,
+              friends: Set[int], friends_of_friends: Dict[int, int], limit: int) -> List[SearchHit]:
+    candidates = list(candidates)
+    mutual = dict(friends_of_friends)
+    if friends:
+        mutual.update(graph.mutual_counts(viewer_id, [user_id for user_id, _ in candidates if user_id in friends]))
+    candidates.sort(key=lambda candidate: (candidate[0] not in friends, -mutual.get(candidate[0], 0), candidate[1]))
+    return [(user_id, user_id in friends, mutual.get(user_id, 0)) for user_id, _ in candidates[:limit]]
+
+
+def search_user_ids(db: Session, term: str, viewer_id: int, limit: int = 20, graph: Optional[FriendGraph] = None) -> List[SearchHit]:
+    terms = search_terms(term)
+    if not terms:
+        return []
+    friends, friends_of_friends = social_circle(graph, viewer_id)
+    circle = friends | friends_of_friends.keys()
+    if has_search_index(db):
+        candidates = db.execute(RANKED_SEARCH, {
+            "query": match_expression(terms),
+            "viewer_id": viewer_id,
+            "candidates": USER_SEARCH_CANDIDATES,
+            "circle": json.dumps(sorted(circle)),
+        }).all()
+    else:
+        candidates = prefix_candidates(db, terms, viewer_id, circle)
+    return rank_hits(candidates, graph, viewer_id, friends, friends_of_friends, limit)
+
+
+def prefix_candidates(db: Session, terms: List[str], viewer_id: int, circle: Set[int]) -> List[Tuple[int, float]]:
+    from main import User
+
+    query = db.query(User.id).filter(User.is_active == True, User.id != viewer_id)
+    for word in terms:
+        query = query.filter(or_(User.first_name.ilike(f"{word}%"), User.last_name.ilike(f"{word}%")))
+    ids = {user_id for (user_id,) in query.order_by(User.id).limit(USER_SEARCH_CANDIDATES)}
+    if circle:
+        ids.update(user_id for (user_id,) in query.filter(User.id.in_(circle)))
+    # Sem relevância no LIKE: entre desconhecidos, os cadastros mais antigos primeiro
+    return [(user_id, user_id) for user_id in ids]
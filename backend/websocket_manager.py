@@ -1,57 +1,215 @@
 from fastapi import WebSocket
-from typing import Dict, List
-import jwt
-from main import SECRET_KEY, ALGORITHM, SessionLocal, User
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import json
+import os
+
+from realtime_bus import BROADCAST_CHANNEL, InProcessBus, MessageBus, channel_user_id, user_channel
+
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+WS_CLOSE_TRY_AGAIN_LATER = 1013
+TYPING_FORWARD_INTERVAL_SECONDS = float(os.getenv("TYPING_FORWARD_INTERVAL_SECONDS", "3"))
+TYPING_TTL_SECONDS = float(os.getenv("TYPING_TTL_SECONDS", "6"))
+TYPING_MAX_PAIRS = int(os.getenv("TYPING_MAX_PAIRS", "10000"))
+
+class ClientConnection:
+    """Um socket com sua fila de saída limitada e a task que a drena"""
+    def __init__(self, websocket: WebSocket, user_id: int, max_queue: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.writer: Optional[asyncio.Task] = None
+
+    def enqueue(self, message: str) -> bool:
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+class TypingCoalescer:
+    """Reduz os eventos de digitação de cada par (quem digita, para quem).
+
+    Um "digitando" é repassado no máximo a cada `interval` segundos e vale por
+    `ttl` no cliente, então quem continua digitando mantém o indicador aceso
+    com poucos frames. Um "parou" só é repassado se ainda houver um
+    "digitando" válido do outro lado.
+    """
+    def __init__(self, interval: float = TYPING_FORWARD_INTERVAL_SECONDS, ttl: float = TYPING_TTL_SECONDS, max_pairs: int = TYPING_MAX_PAIRS):
+        self.interval = interval
+        self.ttl = ttl
+        self.max_pairs = max_pairs
+        self.forwarded = 0
+        self.suppressed = 0
+        self._started: Dict[Tuple[int, int], float] = {}
+
+    def should_forward(self, sender_id: int, receiver_id: int, is_typing: bool, now: float) -> bool:
+        key = (sender_id, receiver_id)
+        started = self._started.get(key)
+        if is_typing:
+            if started is not None and now - started < self.interval:
+                self.suppressed += 1
+                return False
+            if len(self._started) >= self.max_pairs:
+                self._prune(now)
+            self._started[key] = now
+        else:
+            self._started.pop(key, None)
+            if started is None or now - started >= self.ttl:
+                self.suppressed += 1
+                return False
+        self.forwarded += 1
+        return True
+
+    def clear(self, sender_id: int, receiver_id: int):
+        """A mensagem chegou: o indicador some no cliente sem frame extra"""
+        self._started.pop((sender_id, receiver_id), None)
+
+    def _prune(self, now: float):
+        for key, started in list(self._started.items()):
+            if now - started >= self.ttl:
+                del self._started[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active_pairs": len(self._started),
+            "forwarded": self.forwarded,
+            "suppressed": self.suppressed
+        }
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, List[WebSocket]] = {}
+    """Registro de sockets por usuário com envio não bloqueante.
+
+    Enviar só enfileira a mensagem; cada conexão tem seu próprio writer, então
+    um cliente lento não atrasa os demais. Quem estoura a fila é desconectado.
+    Toda mensagem passa pelo backplane (`bus`), que a entrega ao worker que
+    segura os sockets do destinatário.
+    """
+    def __init__(self, max_queue: int = WS_SEND_QUEUE_SIZE, send_timeout: float = WS_SEND_TIMEOUT_SECONDS):
+        self.active_connections: Dict[int, List[ClientConnection]] = {}
+        self.bus: MessageBus = InProcessBus()
+        self.typing = TypingCoalescer()
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.messages_sent = 0
+        self.send_failures = 0
+        self.dropped_slow_consumers = 0
+
+    async def start(self, bus: MessageBus):
+        self.bus = bus
+        await bus.start(self._on_bus_message)
+        await bus.subscribe(BROADCAST_CHANNEL)
+        for user_id in self.active_connections:
+            await bus.subscribe(user_channel(user_id))
+
+    async def stop(self):
+        await self.bus.stop()
 
     async def connect(self, websocket: WebSocket, user_id: int):
         await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
+        connection = ClientConnection(websocket, user_id, self.max_queue)
+        connection.writer = asyncio.create_task(self._drain(connection))
+        self.active_connections.setdefault(user_id, []).append(connection)
+        await self.bus.subscribe(user_channel(user_id))
 
     def disconnect(self, websocket: WebSocket, user_id: int):
-        if user_id in self.active_connections:
-            if websocket in self.active_connections[user_id]:
-                self.active_connections[user_id].remove(websocket)
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
-
-    async def send_personal_message(self, message: str, user_id: int):
-        if user_id in self.active_connections:
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_text(message)
-                except:
-                    # Remove broken connections
-                    self.active_connections[user_id].remove(connection)
-
-    async def broadcast(self, message: str):
-        for user_connections in self.active_connections.values():
-            for connection in user_connections:
-                try:
-                    await connection.send_text(message)
-                except:
-                    # Remove broken connections
-                    pass
+        for connection in list(self.active_connections.get(user_id, ())):
+            if connection.websocket is websocket:
+                self._remove(connection)
 
-manager = ConnectionManager()
+    def _remove(self, connection: ClientConnection):
+        connections = self.active_connections.get(connection.user_id)
+        if connections and connection in connections:
+            connections.remove(connection)
+            if not connections:
+                del self.active_connections[connection.user_id]
+                asyncio.create_task(self._release(connection.user_id))
+        if connection.writer is not None and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+
+    async def _release(self, user_id: int):
+        # Reconfere na hora: o usuário pode ter reconectado nesse meio tempo
+        if user_id not in self.active_connections:
+            await self.bus.unsubscribe(user_channel(user_id))
+
+    async def _on_bus_message(self, channel: str, message: str):
+        if channel == BROADCAST_CHANNEL:
+            for connections in list(self.active_connections.values()):
+                self._deliver(connections, message)
+            return
+        user_id = channel_user_id(channel)
+        if user_id is not None:
+            self._deliver(self.active_connections.get(user_id, ()), message)
 
-def verify_websocket_token(token: str):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
-        
-        db = SessionLocal()
+    async def _drain(self, connection: ClientConnection):
         try:
-            user = db.query(User).filter(User.email == email).first()
-            return user
-        finally:
-            db.close()
-    except jwt.PyJWTError:
-        return None
\ No newline at end of file
+            while True:
+                message = await connection.queue.get()
+                await asyncio.wait_for(connection.websocket.send_text(message), self.send_timeout)
+                self.messages_sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Envio falhou ou travou: sem fechar, o cliente ficaria conectado
+            # sem receber nada e sem motivo para reconectar
+            self.send_failures += 1
+            self._remove(connection)
+            await self._close(connection.websocket, WS_CLOSE_TRY_AGAIN_LATER)
+
+    async def _close(self, websocket: WebSocket, code: int):
+        try:
+            # O close também escreve no socket, que pode estar travado
+            await asyncio.wait_for(websocket.close(code=code), self.send_timeout)
+        except Exception:
+            pass
+
+    def _deliver(self, connections: Iterable[ClientConnection], message: str):
+        for connection in list(connections):
+            if not connection.enqueue(message):
+                # Fila cheia: o cliente não acompanha, então é derrubado
+                self.dropped_slow_consumers += 1
+                self._remove(connection)
+                asyncio.create_task(self._close(connection.websocket, WS_CLOSE_TRY_AGAIN_LATER))
+
+    def reply(self, websocket: WebSocket, user_id: int, message: str):
+        """Responde só ao socket que mandou o frame, pela fila dele"""
+        self._deliver(
+            [connection for connection in self.active_connections.get(user_id, ()) if connection.websocket is websocket],
+            message
+        )
+
+    async def send_personal_message(self, message: str, user_id: int) -> bool:
+        """False quando o backplane falhou e só os sockets deste worker receberam"""
+        return await self.bus.publish(user_channel(user_id), message)
+
+    async def send_notification(self, user_id: int, notification: dict) -> bool:
+        message = json.dumps({
+            "type": "notification",
+            **notification
+        })
+        return await self.send_personal_message(message, user_id)
+
+    async def broadcast(self, message: str) -> bool:
+        return await self.bus.publish(BROADCAST_CHANNEL, message)
+
+    def stats(self) -> Dict[str, Any]:
+        depths = [
+            connection.queue.qsize()
+            for connections in self.active_connections.values()
+            for connection in connections
+        ]
+        return {
+            "users": len(self.active_connections),
+            "connections": len(depths),
+            "queued_messages": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "queue_capacity": self.max_queue,
+            "messages_sent": self.messages_sent,
+            "send_failures": self.send_failures,
+            "dropped_slow_consumers": self.dropped_slow_consumers,
+            "typing": self.typing.stats(),
+            "bus": self.bus.stats()
+        }
+
+manager = ConnectionManager()
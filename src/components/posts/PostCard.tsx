@@ -35,6 +35,8 @@ export const PostCard: React.FC<PostCardProps> = ({ post, userToken, onPostDelet
   const [reactionCounts, setReactionCounts] = useState<any>({});
   const [loveCount, setLoveCount] = useState(0);
   const [comments, setComments] = useState<any[]>([]);
+  const [commentsCursor, setCommentsCursor] = useState<string | null>(null);
+  const [loadingMoreComments, setLoadingMoreComments] = useState(false);
   const [newComment, setNewComment] = useState('');
   const [loadingComment, setLoadingComment] = useState(false);
   const [isMobile, setIsMobile] = useState(false);
@@ -80,9 +82,18 @@ export const PostCard: React.FC<PostCardProps> = ({ post, userToken, onPostDelet
     }
   };
 
-  const fetchComments = async () => {
+  // A API devolve cada fio como árvore; aqui as respostas ficam num nível só, em ordem cronológica
+  const flattenReplies = (replies: any[] = []): any[] =>
+    replies
+      .flatMap((reply) => [reply, ...flattenReplies(reply.replies)])
+      .sort((a, b) => new Date(a.created_at).getTime() - new Date(b.created_at).getTime() || a.id - b.id);
+
+  // Sem cursor recarrega a primeira página; com cursor acrescenta a próxima
+  const fetchComments = async (cursor?: string) => {
+    const params = new URLSearchParams({ limit: '20' });
+    if (cursor) params.set('cursor', cursor);
     try {
-      const response = await fetch(`http://localhost:8000/comments/post/${post.id}`, {
+      const response = await fetch(`http://localhost:8000/comments/post/${post.id}?${params}`, {
         headers: {
           'Authorization': `Bearer ${userToken}`,
         },
@@ -90,13 +101,59 @@ export const PostCard: React.FC<PostCardProps> = ({ post, userToken, onPostDelet
       
       if (response.ok) {
         const data = await response.json();
-        setComments(data);
+        const page = data.map((comment: any) => {
+          const replies = flattenReplies(comment.replies);
+          // replies_count conta o fio inteiro; o que falta é o que não veio achatado aqui
+          return { ...comment, replies, replies_remaining: Math.max(comment.replies_count - replies.length, 0) };
+        });
+        setComments(prev => cursor ? [...prev, ...page] : page);
+        setCommentsCursor(response.headers.get('X-Next-Cursor'));
       }
     } catch (error) {
       console.error('Erro ao carregar comentários:', error);
     }
   };
 
+  const loadMoreComments = async () => {
+    if (!commentsCursor) return;
+    setLoadingMoreComments(true);
+    try {
+      await fetchComments(commentsCursor);
+    } finally {
+      setLoadingMoreComments(false);
+    }
+  };
+
+  const loadMoreReplies = async (comment: any) => {
+    const params = new URLSearchParams({ limit: '20', cursor: comment.replies_cursor });
+    try {
+      const response = await fetch(`http://localhost:8000/comments/${comment.id}/replies?${params}`, {
+        headers: {
+          'Authorization': `Bearer ${userToken}`,
+        },
+      });
+      
+      if (response.ok) {
+        const replies = await response.json();
+        const nextCursor = response.headers.get('X-Next-Cursor');
+        // O servidor conta também as respostas criadas depois que o fio foi aberto
+        const remaining = Number(response.headers.get('X-Remaining-Count') ?? 0);
+        setComments(prev => prev.map((item) => {
+          if (item.id !== comment.id) return item;
+          const loaded = new Set(item.replies.map((reply: any) => reply.id));
+          return {
+            ...item,
+            replies: [...item.replies, ...replies.filter((reply: any) => !loaded.has(reply.id))],
+            replies_cursor: nextCursor,
+            replies_remaining: nextCursor ? remaining : 0,
+          };
+        }));
+      }
+    } catch (error) {
+      console.error('Erro ao carregar respostas:', error);
+    }
+  };
+
   const handleReaction = async (reactionType: string) => {
     try {
       const response = await fetch('http://localhost:8000/reactions/', {
@@ -434,10 +491,29 @@ export const PostCard: React.FC<PostCardProps> = ({ post, userToken, onPostDelet
                                 ))}
                               </div>
                             )}
+
+                            {comment.replies_cursor && (
+                              <button
+                                onClick={() => loadMoreReplies(comment)}
+                                className="ml-6 mt-2 text-sm text-blue-600 hover:underline"
+                              >
+                                Ver mais respostas ({comment.replies_remaining})
+                              </button>
+                            )}
                           </div>
                         </div>
                       </div>
                     ))}
+
+                    {commentsCursor && (
+                      <button
+                        onClick={loadMoreComments}
+                        disabled={loadingMoreComments}
+                        className="w-full py-2 text-sm text-blue-600 hover:underline disabled:opacity-50"
+                      >
+                        {loadingMoreComments ? 'Carregando...' : 'Carregar mais comentários'}
+                      </button>
+                    )}
                   </div>
                 )}
               </div>
@@ -514,10 +590,29 @@ export const PostCard: React.FC<PostCardProps> = ({ post, userToken, onPostDelet
                                 ))}
                               </div>
                             )}
+
+                            {comment.replies_cursor && (
+                              <button
+                                onClick={() => loadMoreReplies(comment)}
+                                className="ml-6 mt-2 text-sm text-blue-600 hover:underline"
+                              >
+                                Ver mais respostas ({comment.replies_remaining})
+                              </button>
+                            )}
                           </div>
                         </div>
                       </div>
                     ))}
+
+                    {commentsCursor && (
+                      <button
+                        onClick={loadMoreComments}
+                        disabled={loadingMoreComments}
+                        className="w-full py-2 text-sm text-blue-600 hover:underline disabled:opacity-50"
+                      >
+                        {loadingMoreComments ? 'Carregando...' : 'Carregar mais comentários'}
+                      </button>
+                    )}
                   </div>
                 )}
               </div>